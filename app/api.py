@@ -1,15 +1,34 @@
+import io
+import json
 from datetime import datetime, timezone
 import time
-from fastapi import APIRouter, UploadFile, File, Form
-from pydantic import BaseModel
+from typing import AsyncIterator
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Request
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, ValidationError
+from starlette.concurrency import run_in_threadpool
 
-from app.llm import call_llm
+from app.coalesce import SingleFlight
+from app.jobs import ingest_queue
+from app.llm import acall_llm, astream_llm
+from app import metrics
 from app.logging import log_event
-from app.retrieval.index import StalenessAwareRetriever, ingest_document
+from app.openai_clients import limiter_states
+from app.request_context import endpoint_ctx
+from app.retrieval.context import build_context
+from app.retrieval.index import StalenessAwareRetriever, chunk_overlap, ingest_batch
+from app.retrieval.query_cache import normalize_query
 from app.config import settings
 
-router = APIRouter()
+async def _track_endpoint(request: Request) -> None:
+    # Runs in the handler's context, so stage metrics recorded while serving
+    # the request are labelled with its route template.
+    endpoint_ctx.set(request.scope["route"].path)
+
+
+router = APIRouter(dependencies=[Depends(_track_endpoint)])
 retriever = StalenessAwareRetriever()
+_prompt_flight = SingleFlight()
 
 
 class PromptRequest(BaseModel):
@@ -35,6 +54,45 @@ class IngestResponse(BaseModel):
     duration_ms: float
 
 
+class JobResponse(BaseModel):
+    job_id: str
+    doc_id: str
+    status: str
+    superseded_by: str | None = None
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    chunks_written: int = 0
+    result: IngestResponse | None = None
+    error: str | None = None
+    created_at: str | None = None
+    started_at: str | None = None
+    finished_at: str | None = None
+    queue_ms: float | None = None
+    run_ms: float | None = None
+
+
+class IngestBatchItem(BaseModel):
+    line: int
+    doc_id: str | None = None
+    added: int = 0
+    updated: int = 0
+    deleted: int = 0
+    total_chunks: int = 0
+    superseded_by: int | None = None
+    error: str | None = None
+
+
+class IngestBatchResponse(BaseModel):
+    results: list[IngestBatchItem]
+    documents: int
+    superseded: int
+    failed: int
+    chunks_embedded: int
+    duration_ms: float
+    docs_per_second: float
+    chunks_per_second: float
+
+
 class RetrieveRequest(BaseModel):
     query: str
     top_k: int = 5
@@ -45,12 +103,31 @@ class RetrieveResponse(BaseModel):
     results: list[dict]
 
 
-@router.post("/prompt", response_model=PromptResponse)
-def prompt_endpoint(req: PromptRequest):
-    log_event("api_request", endpoint="/prompt")
+class RetrieveBatchRequest(BaseModel):
+    queries: list[RetrieveRequest]
+
+
+class RetrieveBatchResponse(BaseModel):
+    results: list[list[dict]]
 
-    fresh_results = retriever.retrieve(
-        req.prompt,
+
+async def _prepare_prompt(prompt: str) -> tuple[list[str], str | None, str]:
+    """Retrieve context for a prompt; returns (cited chunk ids, warning,
+    context), citing only the chunks packed into the context.
+
+    Concurrent calls for the same (whitespace-normalised) prompt share one
+    retrieval.
+    """
+    prepared, _ = await _prompt_flight.do(
+        normalize_query(prompt),
+        lambda: _retrieve_context(prompt),
+    )
+    return prepared
+
+
+async def _retrieve_context(prompt: str) -> tuple[list[str], str | None, str]:
+    fresh_results = await retriever.aretrieve(
+        prompt,
         top_k=5,
         max_age_days=settings.staleness_max_age_days,
     )
@@ -58,7 +135,7 @@ def prompt_endpoint(req: PromptRequest):
     warning = None
 
     if not results:
-        fallback_results = retriever.retrieve(req.prompt, top_k=5)
+        fallback_results = await retriever.aretrieve(prompt, top_k=5)
         if fallback_results:
             warning = (
                 "No documents found within the allowed age window. "
@@ -88,33 +165,202 @@ def prompt_endpoint(req: PromptRequest):
             )
 
     context = ""
+    chunk_ids: list[str] = []
     if results:
-        lines = []
-        for idx, item in enumerate(results, start=1):
-            text = item.get("text", "")
-            doc_id = item.get("doc_id", "unknown")
-            chunk_id = item.get("chunk_id", "unknown")
-            updated_at = item.get("last_updated_at", "unknown")
-            lines.append(
-                f"[{idx}] doc_id={doc_id} chunk_id={chunk_id} updated_at={updated_at}\n{text}"
-            )
-        context = "\n\n".join(lines)
+        context, spans = build_context(
+            results,
+            settings.context_token_budget,
+            settings.context_duplicate_threshold,
+            chunk_overlap(),
+        )
+        chunk_ids = [chunk_id for span in spans for chunk_id in span["chunk_ids"]]
+
+    return chunk_ids, warning, context
 
-    output = call_llm(req.prompt, context=context or None)
+
+@router.post("/prompt", response_model=PromptResponse)
+async def prompt_endpoint(req: PromptRequest):
+    log_event("api_request", endpoint="/prompt")
+    _, warning, context = await _prepare_prompt(req.prompt)
+    output = await acall_llm(req.prompt, context=context or None)
     return PromptResponse(response=output, warning=warning)
 
 
-@router.post("/ingest", response_model=IngestResponse)
-def ingest_endpoint(req: IngestRequest):
+@router.post("/prompt/stream")
+async def prompt_stream_endpoint(req: PromptRequest):
+    """Server-sent events: ``meta`` (warning and cited chunk ids) once
+    retrieval finishes, ``token`` per generated delta, then ``done`` with
+    timings, or ``error`` if retrieval or the completion fails."""
+    log_event("api_request", endpoint="/prompt/stream")
+
+    async def events() -> AsyncIterator[str]:
+        t0 = time.perf_counter()
+        retrieval_ms = ttft_ms = None
+        try:
+            chunk_ids, warning, context = await _prepare_prompt(req.prompt)
+            retrieval_ms = round((time.perf_counter() - t0) * 1000, 2)
+            yield _sse(
+                "meta",
+                {
+                    "warning": warning,
+                    "chunk_ids": chunk_ids,
+                    "retrieval_ms": retrieval_ms,
+                },
+            )
+
+            async for delta in astream_llm(req.prompt, context=context or None):
+                if ttft_ms is None:
+                    ttft_ms = round((time.perf_counter() - t0) * 1000, 2)
+                yield _sse("token", {"text": delta})
+        except Exception as exc:
+            # Headers are already sent, so the failure goes in the stream.
+            total_ms = round((time.perf_counter() - t0) * 1000, 2)
+            log_event(
+                "prompt_stream_failed",
+                error=type(exc).__name__,
+                detail=str(exc),
+                retrieval_ms=retrieval_ms,
+                ttft_ms=ttft_ms,
+                total_ms=total_ms,
+            )
+            yield _sse("error", {"error": type(exc).__name__, "total_ms": total_ms})
+            return
+
+        total_ms = round((time.perf_counter() - t0) * 1000, 2)
+        log_event(
+            "prompt_stream_complete",
+            retrieval_ms=retrieval_ms,
+            ttft_ms=ttft_ms,
+            total_ms=total_ms,
+        )
+        yield _sse(
+            "done",
+            {"retrieval_ms": retrieval_ms, "ttft_ms": ttft_ms, "total_ms": total_ms},
+        )
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/ingest", response_model=JobResponse, status_code=202)
+async def ingest_endpoint(req: IngestRequest):
     log_event("api_request", endpoint="/ingest", doc_id=req.doc_id)
-    result = ingest_document(req.doc_id, req.text, source=req.source)
-    return IngestResponse(**result)
+    job = await run_in_threadpool(
+        ingest_queue.submit,
+        req.doc_id,
+        io.BytesIO(req.text.encode("utf-8")),
+        source=req.source,
+    )
+    return JobResponse(**job)
+
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+def job_endpoint(job_id: str):
+    job = ingest_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return JobResponse(**job)
+
+
+@router.post("/ingest/batch", response_model=IngestBatchResponse)
+async def ingest_batch_endpoint(request: Request):
+    """Ingest an NDJSON body of IngestRequest objects, one per line.
+
+    Documents are committed in groups of ``ingest_batch_docs``; a line that
+    fails validation is reported in its result without affecting the rest,
+    and a line followed by another for the same doc_id in its group is
+    reported as superseded. Each group waits for queued ingest jobs of its
+    documents already running and supersedes the ones still queued.
+    """
+    log_event("api_request", endpoint="/ingest/batch")
+    t0 = time.perf_counter()
+    results: list[IngestBatchItem] = []
+    pending: list[tuple[int, IngestRequest]] = []
+
+    async def flush() -> None:
+        docs = [req.model_dump() for _, req in pending]
+        outcome = await run_in_threadpool(
+            ingest_queue.run_exclusive,
+            [doc["doc_id"] for doc in docs],
+            lambda: ingest_batch(docs),
+            "ingest_batch",
+        )
+        by_doc = {item["doc_id"]: item for item in outcome}
+        last_line = {req.doc_id: line_no for line_no, req in pending}
+        for line_no, req in pending:
+            item = by_doc[req.doc_id]
+            if last_line[req.doc_id] != line_no:
+                results.append(
+                    IngestBatchItem(line=line_no, doc_id=req.doc_id, superseded_by=last_line[req.doc_id])
+                )
+                continue
+            results.append(
+                IngestBatchItem(
+                    line=line_no,
+                    doc_id=req.doc_id,
+                    added=item["added"],
+                    updated=item["updated"],
+                    deleted=item["deleted"],
+                    total_chunks=item["total_chunks"],
+                )
+            )
+        pending.clear()
+
+    line_no = 0
+    async for line in _iter_lines(request.stream()):
+        line_no += 1
+        if not line.strip():
+            continue
+        try:
+            pending.append((line_no, IngestRequest.model_validate_json(line)))
+        except ValidationError as exc:
+            results.append(IngestBatchItem(line=line_no, error=str(exc)))
+            continue
+        if len(pending) >= settings.ingest_batch_docs:
+            await flush()
+    if pending:
+        await flush()
+
+    results.sort(key=lambda item: item.line)
+    seconds = max(time.perf_counter() - t0, 1e-9)
+    failed = sum(1 for item in results if item.error is not None)
+    superseded = sum(1 for item in results if item.superseded_by is not None)
+    documents = len(results) - failed - superseded
+    embedded = sum(item.added + item.updated for item in results)
+    return IngestBatchResponse(
+        results=results,
+        documents=documents,
+        superseded=superseded,
+        failed=failed,
+        chunks_embedded=embedded,
+        duration_ms=round(seconds * 1000, 2),
+        docs_per_second=round(documents / seconds, 2),
+        chunks_per_second=round(embedded / seconds, 2),
+    )
+
+
+async def _iter_lines(stream: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    buffer = b""
+    async for block in stream:
+        buffer += block
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+    if buffer:
+        yield buffer
 
 
 @router.post("/retrieve", response_model=RetrieveResponse)
-def retrieve_endpoint(req: RetrieveRequest):
+async def retrieve_endpoint(req: RetrieveRequest):
     log_event("api_request", endpoint="/retrieve")
-    results = retriever.retrieve(
+    results = await retriever.aretrieve(
         req.query,
         top_k=req.top_k,
         max_age_days=req.max_age_days,
@@ -122,15 +368,34 @@ def retrieve_endpoint(req: RetrieveRequest):
     return RetrieveResponse(results=results)
 
 
-@router.post("/upload", response_model=IngestResponse)
+@router.post("/retrieve/batch", response_model=RetrieveBatchResponse)
+async def retrieve_batch_endpoint(req: RetrieveBatchRequest):
+    """Retrieve for many queries at once; ``results[i]`` answers ``queries[i]``."""
+    log_event("api_request", endpoint="/retrieve/batch", queries=len(req.queries))
+    results = await retriever.aretrieve_batch(
+        [(q.query, q.top_k, q.max_age_days) for q in req.queries]
+    )
+    return RetrieveBatchResponse(results=results)
+
+
+@router.get("/metrics")
+def metrics_endpoint():
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+
+@router.get("/limits")
+def limits_endpoint():
+    return {"limiters": limiter_states()}
+
+
+@router.post("/upload", response_model=JobResponse, status_code=202)
 def upload_endpoint(
     file: UploadFile = File(...),
     doc_id: str | None = Form(default=None),
     source: str | None = Form(default=None),
 ):
     log_event("api_request", endpoint="/upload", filename=file.filename)
-    content = file.file.read()
-    text = content.decode("utf-8", errors="replace")
     resolved_doc_id = doc_id or file.filename or f"upload-{int(time.time())}"
-    result = ingest_document(resolved_doc_id, text, source=source or file.filename)
-    return IngestResponse(**result)
+    job = ingest_queue.submit(resolved_doc_id, file.file, source=source or file.filename)
+    return JobResponse(**job)
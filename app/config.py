@@ -10,12 +10,77 @@ class Settings(BaseSettings):
     log_level: str = "INFO"
     log_file: str = "logs/chronicle.log"
     db_path: str = "data/chronicle.db"
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_cache_size_kib: int = 65536
+    sqlite_mmap_size_bytes: int = 268435456
+    sqlite_busy_timeout_ms: int = 5000
     staleness_half_life_days: float = 30.0
     staleness_warning_days: int = 30
     staleness_max_age_days: int = 180
+    embedding_migration_batch_size: int = 500
+    chunking_strategy: str = "fixed"
+    cdc_min_chars: int = 200
+    cdc_avg_chars: int = 500
+    cdc_max_chars: int = 1000
+    cdc_snap_window: int = 0
+    ingest_window_chunks: int = 256
+    ingest_batch_docs: int = 500
+    embedding_batch_size: int = 512
+    embedding_batch_max_tokens: int = 200000
+    embedding_batch_wait_ms: float = 5.0
+    embedding_max_concurrency: int = 4
+    upload_read_bytes: int = 1048576
+    ingest_workers: int = 2
+    ingest_spool_dir: str = "data/ingest_spool"
+    ingest_job_heartbeat_seconds: float = 10.0
+    ingest_job_stale_seconds: float = 60.0
+    ingest_job_retention_days: float = 7.0
+    embedding_backend: str = "openai"
+    embedding_model: str = "text-embedding-3-small"
+    hashing_embedding_dim: int = 256
+    embedding_cache_max_entries: int = 200000
+    query_cache_max_entries: int = 1024
+    query_cache_ttl_seconds: float = 3600.0
+    query_cache_persist: bool = False
+    result_cache_max_entries: int = 4096
+    result_cache_quantum_seconds: float = 60.0
+    context_token_budget: int = 3000
+    context_duplicate_threshold: float = 0.9
+    retrieval_backend: str = "exact"
+    ivf_nlist: int = 0
+    ivf_nprobe: int = 8
+    ivf_train_size: int = 10000
+    ivf_overfetch: int = 4
+    tiered_segment_days: float = 7.0
+    tiered_compact_after_days: float = 90.0
+    tiered_compacted_segment_days: float = 91.0
+    shared_index_dir: str = "data/index"
+    shared_index_log_max_bytes: int = 67108864
+    index_snapshot_dir: str = "data/index_snapshot"
+    index_snapshot_interval_seconds: float = 300.0
+    index_sync_interval_seconds: float = 1.0
 
     openai_api_key: str
+    openai_base_url: str | None = None
     model_name: str = "gpt-4.1-mini"
+    openai_max_connections: int = 200
+    openai_max_keepalive_connections: int = 100
+    openai_keepalive_expiry_seconds: float = 30.0
+    openai_timeout_seconds: float = 60.0
+    openai_connect_timeout_seconds: float = 5.0
+    openai_max_retries: int = 5
+    openai_backoff_base_seconds: float = 0.5
+    openai_backoff_max_seconds: float = 30.0
+    embedding_requests_per_minute: int = 3000
+    embedding_tokens_per_minute: int = 1000000
+    embedding_max_inflight: int = 16
+    llm_requests_per_minute: int = 500
+    llm_tokens_per_minute: int = 200000
+    llm_max_inflight: int = 64
+    llm_completion_token_estimate: int = 512
+    llm_response_cache_ttl_seconds: float = 0.0
+    llm_response_cache_max_entries: int = 1024
 
     model_config = SettingsConfigDict(env_file=_ENV_PATH)
 
@@ -0,0 +1,396 @@
+import codecs
+import os
+import shutil
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, TypeVar
+
+from app.config import settings
+from app.logging import log_event
+from app.request_context import endpoint_ctx, request_id_ctx
+from app.retrieval import store
+from app.retrieval.index import ingest_stream
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+SUPERSEDED = "superseded"
+
+# How often expired jobs and orphaned spool files are swept.
+_PRUNE_INTERVAL_SECONDS = 3600.0
+# Delay before retrying a job whose document another process is ingesting.
+_CLAIM_RETRY_SECONDS = 1.0
+
+T = TypeVar("T")
+
+
+class IngestJobQueue:
+    """Persistent ingestion queue drained by a pool of worker threads.
+
+    Each submission spools its content to disk and records a job row, so
+    the HTTP request returns immediately and queued work survives a
+    restart. At most one job per doc_id is queued: a newer submission
+    supersedes the queued one, so only the latest content is embedded.
+    Jobs for the same doc_id never run concurrently.
+
+    Several processes can share one database. Every job row records the
+    process that owns it, which heartbeats while it is alive; workers claim
+    a job with a conditional update, and a process only takes over jobs
+    whose owner has stopped heartbeating for ``stale_seconds``. Finished
+    jobs are deleted after ``retention_days``, along with spool files no
+    unfinished job refers to.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        spool_dir: str,
+        workers: int = 2,
+        heartbeat_seconds: float = 10.0,
+        stale_seconds: float = 60.0,
+        retention_days: float = 7.0,
+    ):
+        self.db_path = db_path
+        self.spool_dir = Path(spool_dir)
+        self.workers = max(workers, 1)
+        self.heartbeat_seconds = heartbeat_seconds
+        self.stale_seconds = max(stale_seconds, heartbeat_seconds * 2)
+        self.retention_days = retention_days
+        self.owner = _owner_id()
+        self._pending: "OrderedDict[str, Dict]" = OrderedDict()
+        self._running: set = set()
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._pruned_at = 0.0
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        # Forked workers must not share an owner id with their parent.
+        self.owner = _owner_id()
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        self._recover()
+        self._prune()
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"ingest-worker-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._maintain, name="ingest-heartbeat", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def submit(self, doc_id: str, content: BinaryIO, source: Optional[str] = None) -> Dict:
+        job_id = uuid.uuid4().hex
+        payload_path = self.spool_dir / f"{job_id}.txt"
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        with open(payload_path, "wb") as out:
+            shutil.copyfileobj(content, out, settings.upload_read_bytes)
+
+        job = {
+            "job_id": job_id,
+            "doc_id": doc_id,
+            "source": source,
+            "request_id": request_id_ctx.get(),
+            "status": QUEUED,
+            "payload_path": str(payload_path),
+            "created_at": store.now_iso(),
+            "owner": self.owner,
+            "heartbeat_at": time.time(),
+        }
+        store.create_job(self.db_path, job)
+        # Queued jobs for the document in any process are superseded; a
+        # worker that already popped one finds it no longer claimable.
+        for previous in store.supersede_jobs(self.db_path, job_id, doc_id, store.now_iso()):
+            _remove_payload(previous["payload_path"])
+            log_event("ingest_job_superseded", job_id=previous["job_id"], superseded_by=job_id)
+        self._enqueue(job)
+        log_event("ingest_job_queued", job_id=job_id, doc_id=doc_id, queue_depth=self.depth())
+        return job
+
+    def run_exclusive(self, doc_ids: List[str], fn: Callable[[], T], source: str) -> T:
+        """Run ``fn``, which writes ``doc_ids`` directly, as one job per
+        document.
+
+        Waits until no job for those documents is running in any process,
+        supersedes their queued jobs, and keeps workers off them until
+        ``fn`` returns, so queued and direct writes of a document never
+        interleave.
+        """
+        doc_ids = list(dict.fromkeys(doc_ids))
+        created_at = store.now_iso()
+        jobs = [
+            {
+                "job_id": uuid.uuid4().hex,
+                "doc_id": doc_id,
+                "source": source,
+                "request_id": request_id_ctx.get(),
+                "status": RUNNING,
+                "created_at": created_at,
+                "owner": self.owner,
+            }
+            for doc_id in doc_ids
+        ]
+        while True:
+            with self._cond:
+                if not self._running.intersection(doc_ids):
+                    started_at = store.now_iso()
+                    for job in jobs:
+                        job.update(
+                            started_at=started_at,
+                            queue_ms=_elapsed_ms(created_at, started_at),
+                            heartbeat_at=time.time(),
+                        )
+                    superseded = store.start_jobs(self.db_path, jobs, started_at)
+                    if superseded is not None:
+                        self._running.update(doc_ids)
+                        break
+                self._cond.wait(_CLAIM_RETRY_SECONDS)
+        for job in superseded:
+            _remove_payload(job["payload_path"])
+            log_event("ingest_job_superseded", job_id=job["job_id"], superseded_by=job["superseded_by"])
+
+        job_ids = [job["job_id"] for job in jobs]
+        t0 = time.perf_counter()
+        try:
+            result = fn()
+        except Exception as exc:
+            store.finish_jobs(
+                self.db_path,
+                job_ids,
+                status=FAILED,
+                error=str(exc),
+                finished_at=store.now_iso(),
+                run_ms=round((time.perf_counter() - t0) * 1000, 2),
+            )
+            raise
+        else:
+            store.finish_jobs(
+                self.db_path,
+                job_ids,
+                status=SUCCEEDED,
+                finished_at=store.now_iso(),
+                run_ms=round((time.perf_counter() - t0) * 1000, 2),
+            )
+            return result
+        finally:
+            with self._cond:
+                self._running.difference_update(doc_ids)
+                self._cond.notify_all()
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        return store.get_job(self.db_path, job_id)
+
+    def depth(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def _enqueue(self, job: Dict) -> None:
+        with self._cond:
+            previous = self._pending.get(job["doc_id"])
+            if previous and previous["created_at"] > job["created_at"]:
+                return
+            self._pending[job["doc_id"]] = job
+            self._cond.notify()
+
+    def _recover(self) -> None:
+        """Take over jobs whose owning process stopped heartbeating."""
+        now = time.time()
+        with self._cond:
+            held = {job["job_id"] for job in self._pending.values()}
+        adopted = 0
+        for job in store.adopt_stale_jobs(self.db_path, self.owner, now - self.stale_seconds, now):
+            if job["job_id"] in held:
+                continue
+            if not job["payload_path"] or not os.path.exists(job["payload_path"]):
+                store.update_job(
+                    self.db_path,
+                    job["job_id"],
+                    status=FAILED,
+                    error="payload missing after restart",
+                    finished_at=store.now_iso(),
+                )
+                continue
+            self._enqueue(job)
+            adopted += 1
+        if adopted:
+            log_event("ingest_jobs_recovered", jobs=adopted, owner=self.owner, queue_depth=self.depth())
+
+    def _prune(self) -> None:
+        """Delete expired job rows and spool files no unfinished job uses."""
+        self._pruned_at = time.time()
+        cutoff = datetime.now(timezone.utc) - timedelta(days=self.retention_days)
+        jobs = store.prune_jobs(self.db_path, cutoff.isoformat())
+        active = store.list_job_payloads(self.db_path)
+        # Young files may belong to a submission not recorded yet.
+        orphan_before = time.time() - self.stale_seconds
+        files = 0
+        for path in self.spool_dir.glob("*.txt"):
+            try:
+                if str(path) not in active and path.stat().st_mtime < orphan_before:
+                    path.unlink()
+                    files += 1
+            except FileNotFoundError:
+                pass
+        if jobs or files:
+            log_event("ingest_jobs_pruned", jobs=jobs, spool_files=files)
+
+    def _maintain(self) -> None:
+        while True:
+            time.sleep(self.heartbeat_seconds)
+            try:
+                store.touch_jobs(self.db_path, self.owner, time.time())
+                self._recover()
+                if time.time() - self._pruned_at >= _PRUNE_INTERVAL_SECONDS:
+                    self._prune()
+            except Exception as exc:
+                log_event("ingest_job_maintenance_failed", error=str(exc))
+
+    def _next(self) -> Dict:
+        with self._cond:
+            while True:
+                for doc_id in self._pending:
+                    if doc_id not in self._running:
+                        self._running.add(doc_id)
+                        return self._pending.pop(doc_id)
+                self._cond.wait()
+
+    def _work(self) -> None:
+        while True:
+            job = self._next()
+            try:
+                self._run(job)
+            finally:
+                with self._cond:
+                    self._running.discard(job["doc_id"])
+                    self._cond.notify_all()
+
+    def _claim(self, job: Dict, started_at: str, queue_ms: float) -> bool:
+        claimed = store.claim_job(
+            self.db_path,
+            job["job_id"],
+            self.owner,
+            started_at=started_at,
+            queue_ms=queue_ms,
+            heartbeat_at=time.time(),
+        )
+        if claimed:
+            return True
+        current = store.get_job(self.db_path, job["job_id"])
+        if current and current["status"] == QUEUED and current["owner"] == self.owner:
+            # Another process is still running an older job for the document.
+            timer = threading.Timer(_CLAIM_RETRY_SECONDS, self._enqueue, args=(job,))
+            timer.daemon = True
+            timer.start()
+        else:
+            log_event(
+                "ingest_job_skipped",
+                job_id=job["job_id"],
+                doc_id=job["doc_id"],
+                status=current["status"] if current else None,
+            )
+        return False
+
+    def _run(self, job: Dict) -> None:
+        job_id = job["job_id"]
+        started_at = store.now_iso()
+        queue_ms = _elapsed_ms(job["created_at"], started_at)
+        if not self._claim(job, started_at, queue_ms):
+            return
+        token = request_id_ctx.set(job.get("request_id") or job_id)
+        endpoint_token = endpoint_ctx.set("ingest_job")
+        t0 = time.perf_counter()
+        def on_progress(progress: Dict) -> None:
+            store.update_job(
+                self.db_path,
+                job_id,
+                chunks_total=progress["chunks"],
+                chunks_embedded=progress["embedded"],
+                chunks_written=progress["written"],
+            )
+
+        try:
+            with open(job["payload_path"], "rb") as payload:
+                result = ingest_stream(
+                    job["doc_id"],
+                    decode_stream(payload, settings.upload_read_bytes),
+                    source=job["source"],
+                    on_progress=on_progress,
+                )
+        except Exception as exc:
+            run_ms = round((time.perf_counter() - t0) * 1000, 2)
+            store.update_job(
+                self.db_path,
+                job_id,
+                status=FAILED,
+                error=str(exc),
+                finished_at=store.now_iso(),
+                run_ms=run_ms,
+            )
+            log_event("ingest_job_failed", job_id=job_id, doc_id=job["doc_id"], error=str(exc))
+        else:
+            run_ms = round((time.perf_counter() - t0) * 1000, 2)
+            store.update_job(
+                self.db_path,
+                job_id,
+                status=SUCCEEDED,
+                result=result,
+                chunks_total=result["total_chunks"],
+                finished_at=store.now_iso(),
+                run_ms=run_ms,
+            )
+            log_event(
+                "ingest_job_complete",
+                job_id=job_id,
+                doc_id=job["doc_id"],
+                queue_ms=queue_ms,
+                run_ms=run_ms,
+            )
+        finally:
+            _remove_payload(job["payload_path"])
+            endpoint_ctx.reset(endpoint_token)
+            request_id_ctx.reset(token)
+
+
+def decode_stream(fileobj: BinaryIO, block_size: int) -> Iterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    while block := fileobj.read(block_size):
+        text = decoder.decode(block)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def _elapsed_ms(start_iso: str, end_iso: str) -> float:
+    start = datetime.fromisoformat(start_iso)
+    end = datetime.fromisoformat(end_iso)
+    return round((end - start).total_seconds() * 1000, 2)
+
+
+def _owner_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _remove_payload(path: Optional[str]) -> None:
+    if path:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+ingest_queue = IngestJobQueue(
+    settings.db_path,
+    settings.ingest_spool_dir,
+    settings.ingest_workers,
+    heartbeat_seconds=settings.ingest_job_heartbeat_seconds,
+    stale_seconds=settings.ingest_job_stale_seconds,
+    retention_days=settings.ingest_job_retention_days,
+)
@@ -1,17 +1,24 @@
-from openai import OpenAI
+import hashlib
+import time
+from typing import AsyncIterator
+
+from app.coalesce import SingleFlight, TTLCache
 from app.config import settings
 from app.logging import log_event
+from app.metrics import LLM_SECONDS, LLM_TTFT_SECONDS, count_cache
+from app.request_context import endpoint_ctx
+from app.openai_clients import async_client, client, llm_limiter
+from app.rate_limit import estimate_tokens
 
-client = OpenAI(api_key=settings.openai_api_key)
 
+_inflight = SingleFlight()
+_responses = TTLCache(
+    settings.llm_response_cache_max_entries,
+    settings.llm_response_cache_ttl_seconds,
+)
 
-def call_llm(prompt: str, context: str | None = None) -> str:
-    log_event(
-        "llm_request",
-        model=settings.model_name,
-        prompt_length=len(prompt),
-    )
 
+def _build_messages(prompt: str, context: str | None) -> list[dict]:
     messages = []
     if context:
         messages.append(
@@ -29,11 +36,31 @@ def call_llm(prompt: str, context: str | None = None) -> str:
             }
         )
     messages.append({"role": "user", "content": prompt})
+    return messages
 
-    response = client.chat.completions.create(
+
+def _token_budget(messages: list[dict]) -> int:
+    prompt_tokens = sum(estimate_tokens(m["content"]) for m in messages)
+    return prompt_tokens + settings.llm_completion_token_estimate
+
+
+def call_llm(prompt: str, context: str | None = None) -> str:
+    log_event(
+        "llm_request",
         model=settings.model_name,
-        messages=messages,
+        prompt_length=len(prompt),
+    )
+
+    messages = _build_messages(prompt, context)
+    t0 = time.perf_counter()
+    response = llm_limiter.call(
+        lambda: client.chat.completions.create(
+            model=settings.model_name,
+            messages=messages,
+        ),
+        tokens=_token_budget(messages),
     )
+    LLM_SECONDS.labels(endpoint_ctx.get(), "complete").observe(time.perf_counter() - t0)
 
     output = response.choices[0].message.content
 
@@ -43,3 +70,117 @@ def call_llm(prompt: str, context: str | None = None) -> str:
     )
 
     return output
+
+
+async def acall_llm(prompt: str, context: str | None = None) -> str:
+    """Async completion. Concurrent identical requests (same prompt and
+    context) share one provider call, and with
+    ``llm_response_cache_ttl_seconds`` set, finished answers are reused
+    for that long."""
+    key = _request_key(prompt, context)
+    cached = _responses.get(key)
+    if _responses.enabled:
+        count_cache("llm_response", hits=int(cached is not None), misses=int(cached is None))
+    log_event(
+        "llm_request",
+        model=settings.model_name,
+        prompt_length=len(prompt),
+        context_fingerprint=key[:16],
+        response_cache_hit=cached is not None,
+    )
+
+    t0 = time.perf_counter()
+    coalesced = False
+    if cached is None:
+        output, coalesced = await _inflight.do(key, lambda: _acomplete(prompt, context))
+        _responses.put(key, output)
+    else:
+        output = cached
+
+    log_event(
+        "llm_response",
+        response_length=len(output),
+        response_cache_hit=cached is not None,
+        coalesced=coalesced,
+        duration_ms=round((time.perf_counter() - t0) * 1000, 2),
+        **_sharing_stats(),
+    )
+
+    return output
+
+
+async def _acomplete(prompt: str, context: str | None) -> str:
+    messages = _build_messages(prompt, context)
+    t0 = time.perf_counter()
+    response = await llm_limiter.acall(
+        lambda: async_client.chat.completions.create(
+            model=settings.model_name,
+            messages=messages,
+        ),
+        tokens=_token_budget(messages),
+    )
+    LLM_SECONDS.labels(endpoint_ctx.get(), "complete").observe(time.perf_counter() - t0)
+    return response.choices[0].message.content
+
+
+def _request_key(prompt: str, context: str | None) -> str:
+    digest = hashlib.sha256()
+    for part in (settings.model_name, prompt, context or ""):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _sharing_stats() -> dict:
+    flights = _inflight.stats()
+    return {
+        "llm_completions": flights["leaders"],
+        "llm_coalesced_requests": flights["followers"],
+        "llm_response_cache_hits": _responses.hits,
+        "llm_response_cache_misses": _responses.misses,
+    }
+
+
+async def astream_llm(prompt: str, context: str | None = None) -> AsyncIterator[str]:
+    """Yield completion text deltas as the model produces them."""
+    log_event(
+        "llm_request",
+        model=settings.model_name,
+        prompt_length=len(prompt),
+        stream=True,
+    )
+
+    t0 = time.perf_counter()
+    ttft_ms = None
+    response_length = 0
+    messages = _build_messages(prompt, context)
+    # The limiter covers opening the stream (where 429s surface); the
+    # concurrency slot is released once the first response arrives.
+    stream = await llm_limiter.acall(
+        lambda: async_client.chat.completions.create(
+            model=settings.model_name,
+            messages=messages,
+            stream=True,
+        ),
+        tokens=_token_budget(messages),
+    )
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            continue
+        if ttft_ms is None:
+            ttft_ms = round((time.perf_counter() - t0) * 1000, 2)
+            LLM_TTFT_SECONDS.labels(endpoint_ctx.get()).observe(ttft_ms / 1000)
+        response_length += len(delta)
+        yield delta
+
+    LLM_SECONDS.labels(endpoint_ctx.get(), "stream").observe(time.perf_counter() - t0)
+
+    log_event(
+        "llm_response",
+        response_length=response_length,
+        ttft_ms=ttft_ms,
+        duration_ms=round((time.perf_counter() - t0) * 1000, 2),
+    )
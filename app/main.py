@@ -5,11 +5,25 @@ from app.api import router as api_router
 from app.ui import router as ui_router
 from app.logging import setup_logging
 from app.config import settings
+from app.jobs import ingest_queue
 from app.middleware import request_context_middleware
-from app.retrieval.store import init_db
+from app.retrieval.index import index_snapshotter, memory_index
+from app.retrieval.store import configure_connections, init_db
 
 setup_logging(settings.log_level, settings.log_file)
-init_db(settings.db_path)
+configure_connections(
+    journal_mode=settings.sqlite_journal_mode,
+    synchronous=settings.sqlite_synchronous,
+    cache_size_kib=settings.sqlite_cache_size_kib,
+    mmap_size_bytes=settings.sqlite_mmap_size_bytes,
+    busy_timeout_ms=settings.sqlite_busy_timeout_ms,
+)
+init_db(settings.db_path, settings.embedding_migration_batch_size)
+# Load the index before serving (from the latest snapshot when there is
+# one) so the first queries do not pay for it.
+memory_index.ensure_loaded(settings.db_path)
+index_snapshotter.start()
+ingest_queue.start()
 
 app = FastAPI(title=settings.app_name)
 
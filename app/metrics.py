@@ -0,0 +1,79 @@
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+
+from app.request_context import endpoint_ctx
+
+# Stage timings run from sub-millisecond scoring to multi-second LLM calls.
+_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+REQUEST_SECONDS = Histogram(
+    "chronicle_http_request_duration_seconds",
+    "HTTP request latency.",
+    ["endpoint", "method", "status"],
+    buckets=_BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    "chronicle_stage_duration_seconds",
+    "Latency of one retrieval or ingest stage.",
+    ["endpoint", "stage"],
+    buckets=_BUCKETS,
+)
+LLM_SECONDS = Histogram(
+    "chronicle_llm_duration_seconds",
+    "LLM completion latency, to the last token when streaming.",
+    ["endpoint", "mode"],
+    buckets=_BUCKETS,
+)
+LLM_TTFT_SECONDS = Histogram(
+    "chronicle_llm_time_to_first_token_seconds",
+    "Time to the first streamed completion token.",
+    ["endpoint"],
+    buckets=_BUCKETS,
+)
+SQLITE_SECONDS = Histogram(
+    "chronicle_sqlite_duration_seconds",
+    "Time spent inside SQLite reads and write transactions, including lock waits.",
+    ["endpoint", "operation"],
+    buckets=_BUCKETS,
+)
+CACHE_REQUESTS = Counter(
+    "chronicle_cache_requests_total",
+    "Cache lookups by cache and result (hit or miss).",
+    ["endpoint", "cache", "result"],
+)
+INDEX_SEGMENTS = Counter(
+    "chronicle_index_segments_total",
+    "Time segments per query: scanned, skipped_age (outside max_age_days) or skipped_bound (cannot reach the top-k).",
+    ["outcome"],
+)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(endpoint_ctx.get(), name).observe(time.perf_counter() - t0)
+
+
+def observe_stage(name: str, seconds: float) -> None:
+    STAGE_SECONDS.labels(endpoint_ctx.get(), name).observe(seconds)
+
+
+def count_cache(cache: str, hits: int = 0, misses: int = 0) -> None:
+    endpoint = endpoint_ctx.get()
+    if hits:
+        CACHE_REQUESTS.labels(endpoint, cache, "hit").inc(hits)
+    if misses:
+        CACHE_REQUESTS.labels(endpoint, cache, "miss").inc(misses)
+
+
+def render() -> tuple[bytes, str]:
+    return generate_latest(), CONTENT_TYPE_LATEST
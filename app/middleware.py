@@ -3,6 +3,7 @@ import uuid
 from fastapi import Request
 
 from app.logging import log_event
+from app.metrics import REQUEST_SECONDS
 from app.request_context import request_id_ctx
 
 
@@ -18,6 +19,7 @@ async def request_context_middleware(request: Request, call_next):
         path=request.url.path,
     )
 
+    response = None
     try:
         response = await call_next(request)
         return response
@@ -29,6 +31,13 @@ async def request_context_middleware(request: Request, call_next):
             duration_ms=round(duration_ms, 2),
             status_code=getattr(response, "status_code", None),
         )
+        # The route template ("/jobs/{job_id}") keeps path parameters out of
+        # the label; it is only known once routing has run.
+        REQUEST_SECONDS.labels(
+            getattr(request.scope.get("route"), "path", "unmatched"),
+            request.method,
+            str(getattr(response, "status_code", 500)),
+        ).observe(duration_ms / 1000)
 
         request_id_ctx.reset(token)
 
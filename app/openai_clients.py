@@ -0,0 +1,60 @@
+import httpx2
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI, Timeout
+
+from app.config import settings
+from app.rate_limit import RateLimiter
+
+# One pooled client per mode, shared by the LLM and embedding calls so
+# requests reuse warm keep-alive connections instead of opening new ones.
+# The SDK's transport is httpx2, so pool limits must come from it, not httpx.
+_limits = httpx2.Limits(
+    max_connections=settings.openai_max_connections,
+    max_keepalive_connections=settings.openai_max_keepalive_connections,
+    keepalive_expiry=settings.openai_keepalive_expiry_seconds,
+)
+_timeout = Timeout(
+    settings.openai_timeout_seconds,
+    connect=settings.openai_connect_timeout_seconds,
+)
+
+# Retries are handled by the rate limiters below so backoff and 429s feed
+# the shared concurrency limit instead of being retried blindly per call.
+client = OpenAI(
+    api_key=settings.openai_api_key,
+    base_url=settings.openai_base_url,
+    max_retries=0,
+    timeout=_timeout,
+    http_client=DefaultHttpxClient(limits=_limits),
+)
+async_client = AsyncOpenAI(
+    api_key=settings.openai_api_key,
+    base_url=settings.openai_base_url,
+    max_retries=0,
+    timeout=_timeout,
+    http_client=DefaultAsyncHttpxClient(limits=_limits),
+)
+
+# Embedding and chat models have separate provider quotas, so each gets its
+# own limiter; sync and async calls of the same kind share one.
+embedding_limiter = RateLimiter(
+    "embedding",
+    requests_per_minute=settings.embedding_requests_per_minute,
+    tokens_per_minute=settings.embedding_tokens_per_minute,
+    max_concurrency=settings.embedding_max_inflight,
+    max_retries=settings.openai_max_retries,
+    backoff_base_seconds=settings.openai_backoff_base_seconds,
+    backoff_max_seconds=settings.openai_backoff_max_seconds,
+)
+llm_limiter = RateLimiter(
+    "llm",
+    requests_per_minute=settings.llm_requests_per_minute,
+    tokens_per_minute=settings.llm_tokens_per_minute,
+    max_concurrency=settings.llm_max_inflight,
+    max_retries=settings.openai_max_retries,
+    backoff_base_seconds=settings.openai_backoff_base_seconds,
+    backoff_max_seconds=settings.openai_backoff_max_seconds,
+)
+
+
+def limiter_states() -> list[dict]:
+    return [embedding_limiter.state(), llm_limiter.state()]
@@ -0,0 +1,352 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+import openai
+
+from app.logging import log_event
+
+_RETRYABLE = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+# 5xx statuses that mean the provider is shedding load.
+_OVERLOAD_STATUSES = (503, 529)
+# Callers waiting for a concurrency slot are woken by releases; this only
+# bounds the wait should a wake-up be lost.
+_MAX_PARK_SECONDS = 1.0
+_MIN_WAIT_SECONDS = 0.001
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for English text with cl100k-style
+    # tokenizers; budgets only have to stay under the provider limits.
+    return len(text) // 4 + 1
+
+
+class RateLimiter:
+    """Client-side limiter for one provider quota (e.g. embeddings or chat).
+
+    Requests wait for room in two token buckets (requests/min and
+    tokens/min) and for a free concurrency slot; callers blocked on a slot
+    queue in FIFO order and are woken as slots free up. The concurrency
+    limit is adjusted AIMD-style: it grows by ~1 per window of successful
+    calls and halves on a 429 or overload error, or when the 90th
+    percentile of per-token latency over the last ``latency_window`` calls
+    jumps past ``latency_spike_factor`` times its running level. Retryable
+    errors are retried with full-jitter exponential backoff, and a
+    Retry-After header pauses every caller until it has passed.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        max_concurrency: int = 16,
+        min_concurrency: int = 1,
+        max_retries: int = 5,
+        backoff_base_seconds: float = 0.5,
+        backoff_max_seconds: float = 30.0,
+        latency_spike_factor: float = 3.0,
+        latency_window: int = 20,
+    ):
+        self.name = name
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max(max_concurrency, 1)
+        self.min_concurrency = max(min(min_concurrency, self.max_concurrency), 1)
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.latency_spike_factor = latency_spike_factor
+        self.latency_window = max(latency_window, 2)
+
+        self.concurrency_limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.queue_depth = 0
+        self.throttle_events = 0
+        self.retries = 0
+        self.failures = 0
+        self._request_budget = float(requests_per_minute)
+        self._token_budget = float(tokens_per_minute)
+        self._refilled_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._latencies: List[float] = []
+        self._latency_baseline: Optional[float] = None
+        self._waiters: Deque[Callable[[], bool]] = deque()
+        self._lock = threading.Lock()
+
+    def call(self, fn: Callable[[], Any], tokens: int = 1) -> Any:
+        attempt = 0
+        while True:
+            self._wait_sync(tokens)
+            t0 = time.monotonic()
+            try:
+                result = fn()
+            except _RETRYABLE as exc:
+                delay = self._on_error(exc, attempt)
+                attempt += 1
+                time.sleep(delay)
+                continue
+            except Exception:
+                self._release(None, tokens)
+                raise
+            self._release(time.monotonic() - t0, tokens)
+            return result
+
+    async def acall(self, fn: Callable[[], Awaitable[Any]], tokens: int = 1) -> Any:
+        attempt = 0
+        while True:
+            await self._wait_async(tokens)
+            t0 = time.monotonic()
+            try:
+                result = await fn()
+            except _RETRYABLE as exc:
+                delay = self._on_error(exc, attempt)
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                self._release(None, tokens)
+                raise
+            self._release(time.monotonic() - t0, tokens)
+            return result
+
+    def state(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                "name": self.name,
+                "concurrency_limit": round(self.concurrency_limit, 2),
+                "in_flight": self.in_flight,
+                "queue_depth": self.queue_depth,
+                "throttle_events": self.throttle_events,
+                "retries": self.retries,
+                "failures": self.failures,
+                "request_budget": round(self._request_budget, 2),
+                "token_budget": round(self._token_budget, 2),
+                "blocked_for_seconds": round(max(self._blocked_until - time.monotonic(), 0.0), 3),
+            }
+
+    def _wait_sync(self, tokens: int) -> None:
+        with self._lock:
+            self.queue_depth += 1
+        try:
+            while True:
+                with self._lock:
+                    delay = self._try_acquire(tokens)
+                    if delay is None:
+                        woken = threading.Event()
+                        wake = _event_waker(woken)
+                        self._waiters.append(wake)
+                if delay == 0:
+                    return
+                if delay is None:
+                    if not woken.wait(_MAX_PARK_SECONDS):
+                        self._unpark(wake)
+                else:
+                    time.sleep(delay)
+        finally:
+            with self._lock:
+                self.queue_depth -= 1
+
+    async def _wait_async(self, tokens: int) -> None:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self.queue_depth += 1
+        try:
+            while True:
+                with self._lock:
+                    delay = self._try_acquire(tokens)
+                    if delay is None:
+                        woken = loop.create_future()
+                        wake = _future_waker(loop, woken)
+                        self._waiters.append(wake)
+                if delay == 0:
+                    return
+                if delay is None:
+                    try:
+                        await asyncio.wait_for(asyncio.shield(woken), _MAX_PARK_SECONDS)
+                    except asyncio.TimeoutError:
+                        self._unpark(wake)
+                    except BaseException:
+                        self._unpark(wake)
+                        raise
+                else:
+                    await asyncio.sleep(delay)
+        finally:
+            with self._lock:
+                self.queue_depth -= 1
+
+    def _try_acquire(self, tokens: int) -> Optional[float]:
+        """Take a slot and budget and return 0, return how long to wait for
+        budget, or None when every slot is taken. Caller holds the lock."""
+        # A request larger than a full minute of budget is admitted once the
+        # bucket is full rather than never.
+        tokens = min(max(tokens, 1), self.tokens_per_minute)
+        now = time.monotonic()
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        if self.in_flight >= int(self.concurrency_limit):
+            return None
+        self._refill(now)
+        waits = []
+        if self._request_budget < 1:
+            waits.append((1 - self._request_budget) * 60.0 / self.requests_per_minute)
+        if self._token_budget < tokens:
+            waits.append((tokens - self._token_budget) * 60.0 / self.tokens_per_minute)
+        if waits:
+            return max(max(waits), _MIN_WAIT_SECONDS)
+        self._request_budget -= 1
+        self._token_budget -= tokens
+        self.in_flight += 1
+        # Pass the wake-up on while slots remain, e.g. after the limit grew.
+        if self.in_flight < int(self.concurrency_limit):
+            self._wake_one()
+        return 0.0
+
+    def _wake_one(self) -> None:
+        """Wake the longest-waiting caller blocked on a slot; caller holds
+        the lock."""
+        while self._waiters:
+            if self._waiters.popleft()():
+                return
+
+    def _unpark(self, wake: Callable[[], bool]) -> None:
+        """Withdraw a waiter that stopped waiting; if it was already woken,
+        hand the wake-up to the next one."""
+        with self._lock:
+            try:
+                self._waiters.remove(wake)
+            except ValueError:
+                self._wake_one()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._refilled_at
+        self._refilled_at = now
+        self._request_budget = min(
+            self.requests_per_minute,
+            self._request_budget + elapsed * self.requests_per_minute / 60.0,
+        )
+        self._token_budget = min(
+            self.tokens_per_minute,
+            self._token_budget + elapsed * self.tokens_per_minute / 60.0,
+        )
+
+    def _release(self, latency: Optional[float], tokens: int) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self._wake_one()
+            if latency is None:
+                return
+            if self._latency_spike(latency / max(tokens, 1)):
+                self._decrease("latency_spike")
+                return
+            before = int(self.concurrency_limit)
+            self.concurrency_limit = min(
+                self.max_concurrency,
+                self.concurrency_limit + 1.0 / self.concurrency_limit,
+            )
+            if int(self.concurrency_limit) > before:
+                self._wake_one()
+
+    def _latency_spike(self, per_token: float) -> bool:
+        """Record one call's per-token latency; at the end of each window,
+        report whether its 90th percentile exceeds the baseline (a running
+        average of earlier windows' 90th percentiles) by the spike factor.
+        A heavy but steady tail moves the baseline too, so only a shift of
+        the whole distribution counts."""
+        self._latencies.append(per_token)
+        if len(self._latencies) < self.latency_window:
+            return False
+        window = sorted(self._latencies)
+        self._latencies = []
+        p90 = window[int(0.9 * (len(window) - 1))]
+        baseline = self._latency_baseline
+        self._latency_baseline = p90 if baseline is None else 0.8 * baseline + 0.2 * p90
+        return baseline is not None and p90 > baseline * self.latency_spike_factor
+
+    def _on_error(self, exc: Exception, attempt: int) -> float:
+        """Record a retryable failure and return the delay before retrying,
+        re-raising once retries are exhausted."""
+        retry_after = _retry_after_seconds(exc)
+        with self._lock:
+            self.in_flight -= 1
+            self._wake_one()
+            if isinstance(exc, openai.RateLimitError):
+                self._decrease("rate_limited")
+            elif getattr(exc, "status_code", None) in _OVERLOAD_STATUSES:
+                self._decrease("overloaded")
+            if attempt >= self.max_retries:
+                self.failures += 1
+                raise exc
+            self.retries += 1
+            cap = min(self.backoff_max_seconds, self.backoff_base_seconds * 2 ** attempt)
+            delay = random.uniform(0, cap)
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+                self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+        log_event(
+            "rate_limit_retry",
+            limiter=self.name,
+            attempt=attempt + 1,
+            error=type(exc).__name__,
+            delay_ms=round(delay * 1000, 2),
+        )
+        return delay
+
+    def _decrease(self, reason: str) -> None:
+        self.concurrency_limit = max(float(self.min_concurrency), self.concurrency_limit / 2)
+        self.throttle_events += 1
+        log_event(
+            "rate_limit_throttle",
+            limiter=self.name,
+            reason=reason,
+            concurrency_limit=round(self.concurrency_limit, 2),
+        )
+
+
+def _event_waker(event: threading.Event) -> Callable[[], bool]:
+    def wake() -> bool:
+        event.set()
+        return True
+
+    return wake
+
+
+def _future_waker(loop: asyncio.AbstractEventLoop, future: asyncio.Future) -> Callable[[], bool]:
+    def wake() -> bool:
+        try:
+            loop.call_soon_threadsafe(_resolve, future)
+        except RuntimeError:
+            # The waiter's event loop is closed; nobody is left to wake.
+            return False
+        return True
+
+    return wake
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+def _retry_after_seconds(exc: Exception) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is not None:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return None
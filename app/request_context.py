@@ -2,3 +2,6 @@ from contextvars import ContextVar
 
 request_id_ctx: ContextVar[str | None] = ContextVar("request_id", default=None)
 
+# Route template of the request being served ("/jobs/{job_id}"), used as
+# the metrics label; work outside a request reports as "background".
+endpoint_ctx: ContextVar[str] = ContextVar("endpoint", default="background")
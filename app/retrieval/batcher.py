@@ -0,0 +1,180 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from app.logging import log_event
+from app.rate_limit import estimate_tokens
+from app.retrieval.embedding import Embedder
+
+
+class _Request:
+    def __init__(self, texts: List[str], loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.texts = texts
+        # Event loop of an async caller, whose batches use ``inner.aembed``.
+        self.loop = loop
+        self.vectors: List = [None] * len(texts)
+        self.remaining = len(texts)
+        self.future: Future = Future()
+        self.lock = threading.Lock()
+
+
+class BatchingEmbedder(Embedder):
+    """Shared embedder that coalesces concurrent ``embed`` calls.
+
+    Texts submitted within ``max_wait_ms`` of each other are packed into
+    batches bounded by ``max_items`` and ``max_tokens`` (a single large
+    request is split the same way), sent to ``inner`` on up to
+    ``max_concurrency`` threads, and the vectors are routed back to each
+    caller in order. Async callers are batched separately and their batches
+    are sent with ``inner.aembed`` on the callers' event loop, so an
+    embedder with a native async client keeps using it.
+    """
+
+    def __init__(
+        self,
+        inner: Embedder,
+        max_wait_ms: float = 5.0,
+        max_items: int = 512,
+        max_tokens: int = 200000,
+        max_concurrency: int = 4,
+    ):
+        self.inner = inner
+        self.model = inner.model
+        self.max_wait_ms = max_wait_ms
+        self.max_items = max(max_items, 1)
+        self.max_tokens = max(max_tokens, 1)
+        self._queue: "queue.Queue[_Request]" = queue.Queue()
+        self._pool = ThreadPoolExecutor(max_concurrency, thread_name_prefix="embed-batch")
+        self._dispatcher: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, texts: List[str], loop: Optional[asyncio.AbstractEventLoop] = None) -> Future:
+        request = _Request(list(texts), loop)
+        if not request.texts:
+            request.future.set_result([])
+            return request.future
+        self._ensure_started()
+        self._queue.put(request)
+        return request.future
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return self.submit(texts).result()
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.wrap_future(self.submit(texts, asyncio.get_running_loop()))
+
+    def _ensure_started(self) -> None:
+        if self._dispatcher is not None:
+            return
+        with self._start_lock:
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(
+                    target=self._run,
+                    name="embed-dispatcher",
+                    daemon=True,
+                )
+                self._dispatcher.start()
+
+    def _run(self) -> None:
+        while True:
+            pending = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait_ms / 1000.0
+            while True:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    pending.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            groups: Dict[Optional[asyncio.AbstractEventLoop], List[_Request]] = {}
+            for request in pending:
+                groups.setdefault(request.loop, []).append(request)
+            for loop, requests in groups.items():
+                for batch in self._pack(requests):
+                    self._dispatch(loop, batch, len(pending))
+
+    def _dispatch(
+        self,
+        loop: Optional[asyncio.AbstractEventLoop],
+        batch: List[Tuple[_Request, int]],
+        callers: int,
+    ) -> None:
+        if loop is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(self._asend(batch, callers), loop)
+                return
+            except RuntimeError:
+                # The caller's loop has closed; nobody awaits these results
+                # on it, so fall back to the thread pool.
+                pass
+        self._pool.submit(self._send, batch, callers)
+
+    def _pack(self, pending: List[_Request]) -> List[List[Tuple[_Request, int]]]:
+        batches: List[List[Tuple[_Request, int]]] = []
+        batch: List[Tuple[_Request, int]] = []
+        tokens = 0
+        for request in pending:
+            for i, text in enumerate(request.texts):
+                cost = estimate_tokens(text)
+                if batch and (len(batch) >= self.max_items or tokens + cost > self.max_tokens):
+                    batches.append(batch)
+                    batch, tokens = [], 0
+                batch.append((request, i))
+                tokens += cost
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _send(self, batch: List[Tuple[_Request, int]], callers: int) -> None:
+        t0 = time.perf_counter()
+        try:
+            vectors = self.inner.embed([request.texts[i] for request, i in batch])
+            _check_count(vectors, batch)
+        except Exception as exc:
+            _fail(batch, callers, exc)
+            return
+        _deliver(batch, callers, vectors, t0)
+
+    async def _asend(self, batch: List[Tuple[_Request, int]], callers: int) -> None:
+        t0 = time.perf_counter()
+        try:
+            vectors = await self.inner.aembed([request.texts[i] for request, i in batch])
+            _check_count(vectors, batch)
+        except Exception as exc:
+            _fail(batch, callers, exc)
+            return
+        _deliver(batch, callers, vectors, t0)
+
+
+def _check_count(vectors: List, batch: List[Tuple[_Request, int]]) -> None:
+    if len(vectors) != len(batch):
+        # Zipping would hand callers misaligned or missing vectors.
+        raise ValueError(f"embedder returned {len(vectors)} vectors for {len(batch)} texts")
+
+
+def _fail(batch: List[Tuple[_Request, int]], callers: int, exc: Exception) -> None:
+    log_event("embedding_batch_failed", items=len(batch), callers=callers, error=str(exc))
+    for request, _ in batch:
+        with request.lock:
+            if not request.future.done():
+                request.future.set_exception(exc)
+
+
+def _deliver(batch: List[Tuple[_Request, int]], callers: int, vectors: List, t0: float) -> None:
+    for (request, i), vector in zip(batch, vectors):
+        with request.lock:
+            request.vectors[i] = vector
+            request.remaining -= 1
+            if request.remaining == 0 and not request.future.done():
+                request.future.set_result(request.vectors)
+
+    log_event(
+        "embedding_batch",
+        items=len(batch),
+        callers=callers,
+        duration_ms=round((time.perf_counter() - t0) * 1000, 2),
+    )
@@ -1,31 +1,57 @@
-from typing import List, Dict
+from typing import Dict, Iterable, Iterator, List
 import hashlib
+import random
+
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 100
+
 
 def chunk_text(
     text: str,
     doc_id: str,
-    chunk_size: int = 500,
-    overlap: int = 100,
+    chunk_size: int = CHUNK_SIZE,
+    overlap: int = CHUNK_OVERLAP,
 ) -> List[Dict]:
-    chunks = []
+    return list(iter_chunks([text], doc_id, chunk_size, overlap))
+
+
+def iter_chunks(
+    pieces: Iterable[str],
+    doc_id: str,
+    chunk_size: int = CHUNK_SIZE,
+    overlap: int = CHUNK_OVERLAP,
+) -> Iterator[Dict]:
+    """Fixed-size chunking over a stream of text pieces.
+
+    Yields the same chunks as ``chunk_text`` on the concatenated text while
+    buffering only about one chunk (plus the incoming piece) at a time.
+    """
+    step = chunk_size - overlap
+    buffer = ""
     start = 0
     idx = 0
 
-    while start < len(text):
-        end = start + chunk_size
-        chunk_text = text[start:end]
+    for piece in pieces:
+        buffer = buffer[start:] + piece
+        start = 0
+        while start + chunk_size <= len(buffer):
+            yield _chunk(doc_id, idx, buffer[start:start + chunk_size])
+            start += step
+            idx += 1
 
-        chunks.append({
-            "chunk_id": f"{doc_id}_{idx}",
-            "doc_id": doc_id,
-            "index": idx,
-            "text": chunk_text,
-        })
-
-        start = end - overlap
+    while start < len(buffer):
+        yield _chunk(doc_id, idx, buffer[start:start + chunk_size])
+        start += step
         idx += 1
 
-    return chunks
+
+def _chunk(doc_id: str, idx: int, text: str, chunk_id: str | None = None) -> Dict:
+    return {
+        "chunk_id": chunk_id or f"{doc_id}_{idx}",
+        "doc_id": doc_id,
+        "index": idx,
+        "text": text,
+    }
 
 
 def hash_text(text: str) -> str:
@@ -36,3 +62,104 @@ def add_chunk_hashes(chunks: List[Dict]) -> List[Dict]:
     for chunk in chunks:
         chunk["chunk_hash"] = hash_text(chunk["text"])
     return chunks
+
+
+_GEAR_RNG = random.Random(0x6368726F6E)
+_GEAR = [_GEAR_RNG.getrandbits(64) for _ in range(256)]
+_GEAR_MASK = (1 << 64) - 1
+_BREAKS = ("\n\n", ". ", "! ", "? ", "\n")
+
+
+def chunk_text_cdc(
+    text: str,
+    doc_id: str,
+    min_size: int = 200,
+    avg_size: int = 500,
+    max_size: int = 1000,
+    snap_window: int = 0,
+) -> List[Dict]:
+    """Split text at content-defined boundaries found with a gear rolling hash.
+
+    A boundary depends only on the characters just before it, so an edit
+    moves at most the chunks around it and every later chunk keeps its
+    text. Chunk ids are derived from the chunk's content (with an
+    occurrence suffix for repeats) rather than its position. With
+    ``snap_window`` > 0 a boundary is moved forward to the next paragraph
+    or sentence break within that many characters.
+    """
+    return list(iter_chunks_cdc([text], doc_id, min_size, avg_size, max_size, snap_window))
+
+
+def iter_chunks_cdc(
+    pieces: Iterable[str],
+    doc_id: str,
+    min_size: int = 200,
+    avg_size: int = 500,
+    max_size: int = 1000,
+    snap_window: int = 0,
+) -> Iterator[Dict]:
+    """Streaming form of ``chunk_text_cdc``; buffers at most ``max_size``
+    characters beyond the incoming piece."""
+    bits = max((max(avg_size - min_size, 1)).bit_length() - 1, 0)
+    mask = ((1 << bits) - 1) << (64 - bits)
+    seen: Dict[str, int] = {}
+    buffer = ""
+    start = 0
+    idx = 0
+
+    def emit(cut: int) -> Dict:
+        piece = buffer[start:cut]
+        digest = hash_text(piece)[:16]
+        occurrence = seen.get(digest, 0)
+        seen[digest] = occurrence + 1
+        chunk_id = f"{doc_id}_{digest}" if not occurrence else f"{doc_id}_{digest}_{occurrence}"
+        return _chunk(doc_id, idx, piece, chunk_id)
+
+    for piece in pieces:
+        buffer = buffer[start:] + piece
+        start = 0
+        while len(buffer) - start >= max_size:
+            cut = _next_cdc_cut(buffer, start, start + max_size, min_size, mask, snap_window)
+            yield emit(cut)
+            start = cut
+            idx += 1
+
+    while start < len(buffer):
+        cut = _next_cdc_cut(buffer, start, len(buffer), min_size, mask, snap_window)
+        yield emit(cut)
+        start = cut
+        idx += 1
+
+
+def _next_cdc_cut(
+    text: str,
+    start: int,
+    end: int,
+    min_size: int,
+    mask: int,
+    snap_window: int,
+) -> int:
+    gear = _GEAR
+    h = 0
+    pos = start + min_size
+    for i in range(start, min(pos, end)):
+        h = ((h << 1) + gear[ord(text[i]) & 0xFF]) & _GEAR_MASK
+    cut = end
+    while pos < end:
+        h = ((h << 1) + gear[ord(text[pos]) & 0xFF]) & _GEAR_MASK
+        pos += 1
+        if not h & mask:
+            cut = pos
+            break
+    if snap_window and cut < end:
+        cut = _snap_to_break(text, cut, min(cut + snap_window, end))
+    return cut
+
+
+def _snap_to_break(text: str, cut: int, limit: int) -> int:
+    best = -1
+    for token in _BREAKS:
+        found = text.find(token, cut, limit)
+        if found != -1 and (best == -1 or found + len(token) < best):
+            best = found + len(token)
+    return best if best != -1 else cut
@@ -0,0 +1,143 @@
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.logging import log_event
+from app.rate_limit import estimate_tokens
+from app.retrieval.base import RetrievalResult
+
+_SHINGLE_WORDS = 3
+
+
+def build_context(
+    results: List[RetrievalResult],
+    token_budget: int,
+    duplicate_threshold: float = 0.9,
+    chunk_overlap: int = 0,
+) -> Tuple[str, List[Dict]]:
+    """Assemble the LLM context from ranked retrieval results.
+
+    Adjacent chunks of the same document are merged into one span, dropping
+    the ``chunk_overlap`` characters the chunker repeated between them;
+    spans whose word shingles are at least ``duplicate_threshold``
+    contained in a better-scored span (overlap coefficient, so a chunk
+    repeated inside a longer span still counts) are
+    dropped, and the rest are packed by score until ``token_budget`` is
+    spent. Returns the context text and the spans it contains.
+    """
+    spans = sorted(_merge_spans(results, chunk_overlap), key=lambda span: -span["score"])
+
+    kept: List[Dict] = []
+    kept_shingles: List[Set[int]] = []
+    duplicates = 0
+    for span in spans:
+        shingles = _shingles(span["text"])
+        if any(_overlap(shingles, other) >= duplicate_threshold for other in kept_shingles):
+            duplicates += 1
+            continue
+        kept.append(span)
+        kept_shingles.append(shingles)
+
+    packed: List[Dict] = []
+    blocks: List[str] = []
+    used = 0
+    for span in kept:
+        block = _format(len(packed) + 1, span)
+        cost = estimate_tokens(block)
+        if used + cost > token_budget:
+            continue
+        packed.append(span)
+        blocks.append(block)
+        used += cost
+
+    if not packed and kept:
+        # Nothing fits whole: keep as much of the best span as the budget allows.
+        span = dict(kept[0])
+        header = _format(1, {**span, "text": ""})
+        span["text"] = span["text"][: max(token_budget - estimate_tokens(header), 0) * 4]
+        packed.append(span)
+        blocks.append(_format(1, span))
+        used = estimate_tokens(blocks[0])
+
+    log_event(
+        "context_built",
+        chunks=len(results),
+        spans=len(spans),
+        duplicates_dropped=duplicates,
+        spans_packed=len(packed),
+        estimated_tokens=used,
+        token_budget=token_budget,
+    )
+    return "\n\n".join(blocks), packed
+
+
+def _merge_spans(results: List[RetrievalResult], chunk_overlap: int) -> List[Dict]:
+    by_doc: Dict[str, List[RetrievalResult]] = {}
+    for item in results:
+        by_doc.setdefault(item.get("doc_id", "unknown"), []).append(item)
+
+    spans: List[Dict] = []
+    for doc_id, items in by_doc.items():
+        positioned = sorted(
+            (i for i in items if i.get("chunk_index") is not None),
+            key=lambda i: i["chunk_index"],
+        )
+        span: Optional[Dict] = None
+        for item in positioned:
+            if span is not None and item["chunk_index"] <= span["last_index"] + 1:
+                span["text"] = _join_overlapping(span["text"], item.get("text", ""), chunk_overlap)
+                span["chunk_ids"].append(item.get("chunk_id", "unknown"))
+                span["score"] = max(span["score"], item.get("score", 0.0))
+                span["updated_at"] = max(span["updated_at"], item.get("last_updated_at") or "")
+                span["last_index"] = item["chunk_index"]
+                continue
+            span = _span(doc_id, item)
+            span["last_index"] = item["chunk_index"]
+            spans.append(span)
+        spans.extend(_span(doc_id, i) for i in items if i.get("chunk_index") is None)
+    for span in spans:
+        span.pop("last_index", None)
+    return spans
+
+
+def _span(doc_id: str, item: RetrievalResult) -> Dict:
+    return {
+        "doc_id": doc_id,
+        "chunk_ids": [item.get("chunk_id", "unknown")],
+        "text": item.get("text", ""),
+        "score": item.get("score", 0.0),
+        "updated_at": item.get("last_updated_at") or "",
+    }
+
+
+def _join_overlapping(left: str, right: str, overlap: int) -> str:
+    """Concatenate two consecutive chunks, keeping their shared text once.
+
+    Only the ``overlap`` characters the chunker repeats are dropped, and only
+    when they match; content-defined chunks do not overlap at all.
+    """
+    shared = right[:overlap]
+    if shared and left.endswith(shared):
+        return left + right[len(shared):]
+    return left + right
+
+
+def _shingles(text: str) -> Set[int]:
+    words = text.lower().split()
+    if len(words) <= _SHINGLE_WORDS:
+        return {hash(" ".join(words))}
+    return {
+        hash(" ".join(words[i:i + _SHINGLE_WORDS]))
+        for i in range(len(words) - _SHINGLE_WORDS + 1)
+    }
+
+
+def _overlap(a: Set[int], b: Set[int]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+def _format(idx: int, span: Dict) -> str:
+    return (
+        f"[{idx}] doc_id={span['doc_id']} chunk_id={','.join(span['chunk_ids'])} "
+        f"updated_at={span['updated_at'] or 'unknown'}\n{span['text']}"
+    )
@@ -1,8 +1,16 @@
+import asyncio
 from abc import ABC, abstractmethod
 from typing import List
 
 
 class Embedder(ABC):
+    # Identifies the vector space; cached embeddings are keyed by it.
+    model: str = ""
+
     @abstractmethod
     def embed(self, texts: List[str]) -> List[List[float]]:
         raise NotImplementedError
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        """Async variant; embedders without a native client run ``embed`` in a thread."""
+        return await asyncio.to_thread(self.embed, texts)
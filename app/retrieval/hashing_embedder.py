@@ -0,0 +1,47 @@
+import hashlib
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from app.retrieval.embedding import Embedder
+
+
+class HashingEmbedder(Embedder):
+    """Deterministic offline embedder for benchmarks and local runs.
+
+    Word unigrams and bigrams are hashed (keyed blake2b, so the result is
+    stable across processes) into ``dim`` signed buckets and the counts are
+    L2-normalised. Texts that share words land close together, which is
+    enough for retrieval to behave plausibly without any network call.
+    Rows are returned as float32 arrays rather than lists of floats.
+    """
+
+    def __init__(self, dim: int = 256, seed: int = 0):
+        self.dim = dim
+        self.seed = seed
+        self.model = f"hashing-{dim}-{seed}"
+        self._key = seed.to_bytes(8, "little")
+        self._buckets: Dict[str, Tuple[int, float]] = {}
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = text.lower().split()
+            features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+            if not features:
+                continue
+            buckets = [self._bucket(f) for f in features]
+            np.add.at(out[row], [b[0] for b in buckets], [b[1] for b in buckets])
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        out /= np.where(norms == 0.0, 1.0, norms)
+        return list(out)
+
+    def _bucket(self, feature: str) -> Tuple[int, float]:
+        bucket = self._buckets.get(feature)
+        if bucket is None:
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8, key=self._key).digest()
+            value = int.from_bytes(digest, "little")
+            bucket = (value % self.dim, 1.0 if value >> 63 else -1.0)
+            if len(self._buckets) < 1_000_000:
+                self._buckets[feature] = bucket
+        return bucket
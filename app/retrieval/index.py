@@ -1,118 +1,364 @@
-import math
+import asyncio
+import hashlib
+import itertools
 import time
-from datetime import datetime, timezone
-from typing import List, Dict, Optional
+from pathlib import Path
+from typing import Callable, List, Dict, Iterable, Iterator, Optional, Tuple
 
 from app.logging import log_event
+from app.metrics import count_cache, observe_stage, stage
 from app.config import settings
-from app.retrieval.chunking import chunk_text, add_chunk_hashes, hash_text
+from app.retrieval.chunking import CHUNK_OVERLAP, iter_chunks, iter_chunks_cdc, add_chunk_hashes
+from app.retrieval.embedding import Embedder
+from app.retrieval.hashing_embedder import HashingEmbedder
 from app.retrieval.openai_embedder import OpenAIEmbedder
 from app.retrieval.base import Retriever, RetrievalResult
-from app.retrieval import store
+from app.retrieval.batcher import BatchingEmbedder
+from app.retrieval import snapshot, store
+from app.retrieval.ivf import IVFIndex
+from app.retrieval.query_cache import QueryEmbeddingCache, normalize_query, query_cache
+from app.retrieval.result_cache import RetrievalResultCache, result_cache
+from app.retrieval.shared import SharedIndex
+from app.retrieval.snapshot import Snapshotter
+from app.retrieval.tiered import TieredIndex
+from app.retrieval.vectors import InMemoryIndex
 
 
-class InMemoryIndex:
-    def __init__(self):
-        self.vectors: List[List[float]] = []
-        self.metadata: List[Dict] = []
+def _build_index() -> InMemoryIndex:
+    if settings.retrieval_backend == "ivf":
+        return IVFIndex(
+            nlist=settings.ivf_nlist,
+            nprobe=settings.ivf_nprobe,
+            train_size=settings.ivf_train_size,
+            overfetch=settings.ivf_overfetch,
+        )
+    if settings.retrieval_backend == "tiered":
+        return TieredIndex(
+            segment_days=settings.tiered_segment_days,
+            compact_after_days=settings.tiered_compact_after_days,
+            compacted_segment_days=settings.tiered_compacted_segment_days,
+        )
+    if settings.retrieval_backend == "shared":
+        return SharedIndex(
+            snapshot.directory_for(Path(settings.shared_index_dir), settings.db_path),
+            log_max_bytes=settings.shared_index_log_max_bytes,
+        )
+    if settings.retrieval_backend != "exact":
+        raise ValueError(f"unknown retrieval_backend: {settings.retrieval_backend!r}")
+    return InMemoryIndex()
 
-    def add(self, embeddings: List[List[float]], metadatas: List[Dict]):
-        self.vectors.extend(embeddings)
-        self.metadata.extend(metadatas)
 
-        log_event(
-            "index_add",
-            added=len(embeddings),
-            total=len(self.vectors),
+memory_index = _build_index()
+memory_index.sync_interval_seconds = settings.index_sync_interval_seconds
+if settings.index_snapshot_dir:
+    memory_index.snapshot_dir = snapshot.directory_for(Path(settings.index_snapshot_dir), settings.db_path)
+index_snapshotter = Snapshotter(memory_index, settings.index_snapshot_interval_seconds)
+
+
+def _build_embedder() -> Embedder:
+    if settings.embedding_backend == "hashing":
+        embedder = HashingEmbedder(settings.hashing_embedding_dim)
+    elif settings.embedding_backend == "openai":
+        embedder = OpenAIEmbedder()
+    else:
+        raise ValueError(f"unknown embedding_backend: {settings.embedding_backend!r}")
+    if settings.embedding_batch_wait_ms <= 0:
+        return embedder
+    return BatchingEmbedder(
+        embedder,
+        max_wait_ms=settings.embedding_batch_wait_ms,
+        max_items=settings.embedding_batch_size,
+        max_tokens=settings.embedding_batch_max_tokens,
+        max_concurrency=settings.embedding_max_concurrency,
+    )
+
+
+shared_embedder = _build_embedder()
+
+
+def _iter_document_chunks(pieces: Iterable[str], doc_id: str) -> Iterator[Dict]:
+    if settings.chunking_strategy == "cdc":
+        return iter_chunks_cdc(
+            pieces,
+            doc_id,
+            min_size=settings.cdc_min_chars,
+            avg_size=settings.cdc_avg_chars,
+            max_size=settings.cdc_max_chars,
+            snap_window=settings.cdc_snap_window,
         )
+    if settings.chunking_strategy == "fixed":
+        return iter_chunks(pieces, doc_id)
+    raise ValueError(f"unknown chunking_strategy: {settings.chunking_strategy!r}")
 
 
-def _cosine_similarity(a: List[float], b: List[float]) -> float:
-    if not a or not b or len(a) != len(b):
-        return 0.0
-    dot = sum(x * y for x, y in zip(a, b))
-    norm_a = math.sqrt(sum(x * x for x in a))
-    norm_b = math.sqrt(sum(y * y for y in b))
-    if norm_a == 0.0 or norm_b == 0.0:
-        return 0.0
-    return dot / (norm_a * norm_b)
+def chunk_overlap() -> int:
+    """Characters each chunk repeats from the end of the one before it."""
+    return CHUNK_OVERLAP if settings.chunking_strategy == "fixed" else 0
 
 
-def _staleness_weight(updated_at: Optional[str]) -> float:
-    if not updated_at:
-        return 1.0
-    try:
-        ts = datetime.fromisoformat(updated_at)
-        if ts.tzinfo is None:
-            ts = ts.replace(tzinfo=timezone.utc)
-    except ValueError:
-        return 1.0
-    age_days = max((datetime.now(timezone.utc) - ts).total_seconds() / 86400.0, 0.0)
-    half_life = max(settings.staleness_half_life_days, 0.1)
-    return math.exp(-age_days / half_life)
+def _windows(chunks: Iterator[Dict], size: int) -> Iterator[List[Dict]]:
+    while True:
+        # Chunks are produced lazily, so pulling a window is the chunk stage
+        # (including reading and decoding the input stream).
+        with stage("chunk"):
+            window = list(itertools.islice(chunks, max(size, 1)))
+        if not window:
+            return
+        yield window
 
 
-def ingest_document(doc_id: str, text: str, source: Optional[str] = None) -> Dict:
-    t0 = time.perf_counter()
-    existing_doc = store.get_document(settings.db_path, doc_id)
-    existing_chunks = store.get_chunks_by_doc(settings.db_path, doc_id)
-    existing_by_id = {c["chunk_id"]: c for c in existing_chunks}
+def _embed_with_cache(embedder: Embedder, chunks: List[Dict]) -> Tuple[List[bytes], int, int]:
+    """Embed chunk texts, reusing cached vectors for any known chunk_hash.
 
-    chunks = add_chunk_hashes(chunk_text(text, doc_id))
-    new_chunk_ids = {c["chunk_id"] for c in chunks}
+    Returns one embedding BLOB per chunk plus cache hit and miss counts; a
+    miss is one unique text sent to the embedder.
+    """
+    hashes = list(dict.fromkeys(c["chunk_hash"] for c in chunks))
+    blobs = store.get_cached_embeddings(settings.db_path, embedder.model, hashes)
+    missing = {}
+    for chunk in chunks:
+        if chunk["chunk_hash"] not in blobs:
+            missing.setdefault(chunk["chunk_hash"], chunk["text"])
 
-    to_embed = []
-    to_upsert = []
+    if missing:
+        t0 = time.perf_counter()
+        embeddings = embedder.embed(list(missing.values()))
+        observe_stage("embed", time.perf_counter() - t0)
+        fresh = {h: store.serialize_embedding(e) for h, e in zip(missing, embeddings)}
+        store.put_cached_embeddings(
+            settings.db_path,
+            embedder.model,
+            fresh,
+            settings.embedding_cache_max_entries,
+        )
+        blobs.update(fresh)
+
+    count_cache("embedding", hits=len(chunks) - len(missing), misses=len(missing))
+    return [blobs[c["chunk_hash"]] for c in chunks], len(chunks) - len(missing), len(missing)
 
+
+def _diff_chunks(chunks: List[Dict], existing_by_id: Dict[str, Dict]) -> Tuple[List[Dict], List[Dict]]:
+    """Split chunks into those needing an embedding and unchanged ones that
+    only moved position."""
+    to_embed = []
+    moved = []
     for chunk in chunks:
         prev_row = existing_by_id.get(chunk["chunk_id"])
         if prev_row and prev_row.get("chunk_hash") == chunk["chunk_hash"]:
+            if prev_row.get("chunk_index") != chunk["index"]:
+                moved.append(chunk)
             continue
         to_embed.append(chunk)
+    return to_embed, moved
 
-    embedder = OpenAIEmbedder()
-    if to_embed:
-        embeddings = embedder.embed([c["text"] for c in to_embed])
-        for chunk, embedding in zip(to_embed, embeddings):
-            chunk["embedding"] = store.serialize_embedding(embedding)
-            prev_time = existing_by_id.get(chunk["chunk_id"], {}).get("created_at")
-            chunk["created_at"] = prev_time or store.now_iso()
-            chunk["updated_at"] = store.now_iso()
-            to_upsert.append(chunk)
-
-    deleted = [cid for cid in existing_by_id.keys() if cid not in new_chunk_ids]
+
+def _stamp_chunk(chunk: Dict, blob: bytes, existing_by_id: Dict[str, Dict]) -> None:
+    chunk["embedding"] = blob
+    prev_time = existing_by_id.get(chunk["chunk_id"], {}).get("created_at")
+    chunk["created_at"] = prev_time or store.now_iso()
+    chunk["updated_at"] = store.now_iso()
+    chunk["updated_at_epoch"] = store.to_epoch(chunk["updated_at"])
+
+
+def ingest_document(doc_id: str, text: str, source: Optional[str] = None) -> Dict:
+    return ingest_stream(doc_id, [text], source=source)
+
+
+def ingest_stream(
+    doc_id: str,
+    pieces: Iterable[str],
+    source: Optional[str] = None,
+    on_progress: Optional[Callable[[Dict], None]] = None,
+) -> Dict:
+    """Ingest a document delivered as a stream of text pieces.
+
+    Chunks are diffed, embedded and written ``ingest_window_chunks`` at a
+    time, so memory depends on the window size rather than the document.
+    ``on_progress`` is called after each window with running counts of
+    chunks seen, embedded and written.
+    """
+    t0 = time.perf_counter()
+    existing_doc = store.get_document(settings.db_path, doc_id)
+    existing_by_id = {c["chunk_id"]: c for c in store.get_chunk_states(settings.db_path, doc_id)}
+
+    content_hash = hashlib.sha256()
+
+    def hashed(stream: Iterable[str]) -> Iterator[str]:
+        for piece in stream:
+            content_hash.update(piece.encode("utf-8"))
+            yield piece
+
+    embedder = shared_embedder
+    seen_ids = set()
+    added = updated = total_chunks = written = 0
+    cache_hits = cache_misses = 0
+
+    chunks = _iter_document_chunks(hashed(pieces), doc_id)
+    for window in _windows(chunks, settings.ingest_window_chunks):
+        with stage("diff"):
+            add_chunk_hashes(window)
+            to_embed, moved = _diff_chunks(window, existing_by_id)
+        total_chunks += len(window)
+        seen_ids.update(c["chunk_id"] for c in window)
+
+        if to_embed:
+            blobs, hits, misses = _embed_with_cache(embedder, to_embed)
+            cache_hits += hits
+            cache_misses += misses
+            for chunk, blob in zip(to_embed, blobs):
+                _stamp_chunk(chunk, blob, existing_by_id)
+                if chunk["chunk_id"] in existing_by_id:
+                    updated += 1
+                else:
+                    added += 1
+            with stage("write"):
+                store.upsert_chunks(settings.db_path, to_embed)
+                memory_index.upsert(to_embed)
+        if moved:
+            with stage("write"):
+                store.update_chunk_indexes(settings.db_path, moved)
+                memory_index.move(moved)
+        written += len(to_embed) + len(moved)
+
+        log_event(
+            "ingest_progress",
+            doc_id=doc_id,
+            chunks=total_chunks,
+            embedded=added + updated,
+        )
+        if on_progress:
+            on_progress({"chunks": total_chunks, "embedded": added + updated, "written": written})
+
+    deleted = [cid for cid in existing_by_id.keys() if cid not in seen_ids]
     store.delete_chunks(settings.db_path, doc_id, deleted)
+    memory_index.remove(deleted)
 
     now = store.now_iso()
     doc_payload = {
         "doc_id": doc_id,
         "source": source,
-        "content_hash": hash_text(text),
+        "content_hash": content_hash.hexdigest(),
         "created_at": existing_doc["created_at"] if existing_doc else now,
         "updated_at": now,
     }
     store.upsert_document(settings.db_path, doc_payload)
-    if to_upsert:
-        store.upsert_chunks(settings.db_path, to_upsert)
 
     duration_ms = round((time.perf_counter() - t0) * 1000, 2)
     log_event(
         "ingest_complete",
         doc_id=doc_id,
-        added=len(to_upsert),
+        added=added + updated,
         deleted=len(deleted),
+        embedding_cache_hits=cache_hits,
+        embedding_cache_misses=cache_misses,
         duration_ms=duration_ms,
     )
     return {
-        "added": len([c for c in to_upsert if c["chunk_id"] not in existing_by_id]),
-        "updated": len([c for c in to_upsert if c["chunk_id"] in existing_by_id]),
+        "added": added,
+        "updated": updated,
         "deleted": len(deleted),
-        "total_chunks": len(chunks),
+        "total_chunks": total_chunks,
         "duration_ms": duration_ms,
     }
 
 
+def ingest_batch(docs: List[Dict]) -> List[Dict]:
+    """Ingest many documents with bulk reads, cross-document embedding and a
+    single write transaction.
+
+    ``docs`` carry ``doc_id``, ``text`` and optional ``source``; a repeated
+    doc_id keeps its last occurrence. Returns one result per document in the
+    same shape as ``ingest_document``.
+    """
+    t0 = time.perf_counter()
+    latest = {doc["doc_id"]: doc for doc in docs}
+    doc_ids = list(latest)
+    existing_docs = store.get_documents(settings.db_path, doc_ids)
+    existing_states = store.get_chunk_states_by_docs(settings.db_path, doc_ids)
+
+    now = store.now_iso()
+    plans = []
+    documents = []
+    all_embed = []
+    all_moved = []
+    all_deleted = []
+    for doc_id, doc in latest.items():
+        existing_by_id = {c["chunk_id"]: c for c in existing_states[doc_id]}
+        with stage("chunk"):
+            chunks = list(_iter_document_chunks([doc["text"]], doc_id))
+        with stage("diff"):
+            to_embed, moved = _diff_chunks(add_chunk_hashes(chunks), existing_by_id)
+        new_ids = {c["chunk_id"] for c in chunks}
+        deleted = [cid for cid in existing_by_id if cid not in new_ids]
+        plans.append((doc_id, existing_by_id, chunks, to_embed, deleted))
+        all_embed.extend(to_embed)
+        all_moved.extend(moved)
+        all_deleted.extend((doc_id, cid) for cid in deleted)
+        existing_doc = existing_docs.get(doc_id)
+        documents.append(
+            {
+                "doc_id": doc_id,
+                "source": doc.get("source"),
+                "content_hash": hashlib.sha256(doc["text"].encode("utf-8")).hexdigest(),
+                "created_at": existing_doc["created_at"] if existing_doc else now,
+                "updated_at": now,
+            }
+        )
+
+    cache_hits = cache_misses = 0
+    if all_embed:
+        blobs, cache_hits, cache_misses = _embed_with_cache(shared_embedder, all_embed)
+        blob_iter = iter(blobs)
+        for _, existing_by_id, _, to_embed, _ in plans:
+            for chunk in to_embed:
+                _stamp_chunk(chunk, next(blob_iter), existing_by_id)
+
+    with stage("write"):
+        store.write_ingest_batch(settings.db_path, documents, all_embed, all_moved, all_deleted)
+        memory_index.remove([cid for _, cid in all_deleted])
+        memory_index.upsert(all_embed)
+        memory_index.move(all_moved)
+
+    duration_ms = round((time.perf_counter() - t0) * 1000, 2)
+    results = []
+    for doc_id, existing_by_id, chunks, to_embed, deleted in plans:
+        updated = sum(1 for c in to_embed if c["chunk_id"] in existing_by_id)
+        results.append(
+            {
+                "doc_id": doc_id,
+                "added": len(to_embed) - updated,
+                "updated": updated,
+                "deleted": len(deleted),
+                "total_chunks": len(chunks),
+                "duration_ms": duration_ms,
+            }
+        )
+
+    log_event(
+        "ingest_batch_complete",
+        documents=len(results),
+        embedded=len(all_embed),
+        deleted=len(all_deleted),
+        embedding_cache_hits=cache_hits,
+        embedding_cache_misses=cache_misses,
+        duration_ms=duration_ms,
+    )
+    return results
+
+
 class StalenessAwareRetriever(Retriever):
+    def __init__(
+        self,
+        index: Optional[InMemoryIndex] = None,
+        embedder: Optional[Embedder] = None,
+        cache: Optional[QueryEmbeddingCache] = None,
+        results: Optional[RetrievalResultCache] = None,
+    ):
+        self.index = index or memory_index
+        self.embedder = embedder or shared_embedder
+        self.cache = cache or query_cache
+        self.results = results or result_cache
+
     def retrieve(
         self,
         query: str,
@@ -120,40 +366,143 @@ class StalenessAwareRetriever(Retriever):
         max_age_days: Optional[int] = None,
     ) -> List[RetrievalResult]:
         t0 = time.perf_counter()
-        embedder = OpenAIEmbedder()
-        query_embedding = embedder.embed([query])[0]
-
-        rows = store.list_chunks(settings.db_path)
-        results: List[RetrievalResult] = []
-
-        for row in rows:
-            if store.is_stale(row.get("updated_at"), max_age_days):
-                continue
-            embedding = store.parse_embedding(row.get("embedding"))
-            if not embedding:
-                continue
-            similarity = _cosine_similarity(query_embedding, embedding)
-            weight = _staleness_weight(row.get("updated_at"))
-            score = similarity * weight
-            results.append(
-                {
-                    "chunk_id": row.get("chunk_id"),
-                    "doc_id": row.get("doc_id"),
-                    "text": row.get("text"),
-                    "similarity": similarity,
-                    "created_at": row.get("created_at"),
-                    "last_updated_at": row.get("updated_at"),
-                    "score": score,
-                }
+        version = self.index.current_version()
+        cached = self.results.get(query, top_k, max_age_days, version)
+        if cached is not None:
+            self._log_complete(t0, top_k, cached, True, result_cache_hit=True)
+            return cached
+        with stage("query_embed"):
+            query_embedding, cache_hit = self.cache.embed(self.embedder, query)
+        results = self._search(query_embedding, top_k, max_age_days)
+        self.results.put(query, top_k, max_age_days, version, results)
+        self._log_complete(t0, top_k, results, cache_hit)
+        return results
+
+    async def aretrieve(
+        self,
+        query: str,
+        top_k: int = 5,
+        max_age_days: Optional[int] = None,
+    ) -> List[RetrievalResult]:
+        """Async ``retrieve``: the query embedding is awaited and the index
+        sync, load and scoring run in a worker thread, off the event loop."""
+        t0 = time.perf_counter()
+        # Reading the version may catch the index up under its lock.
+        version = await asyncio.to_thread(self.index.current_version)
+        cached = self.results.get(query, top_k, max_age_days, version)
+        if cached is not None:
+            self._log_complete(t0, top_k, cached, True, result_cache_hit=True)
+            return cached
+        with stage("query_embed"):
+            query_embedding, cache_hit = await self.cache.aembed(self.embedder, query)
+        results = await asyncio.to_thread(self._search, query_embedding, top_k, max_age_days)
+        self.results.put(query, top_k, max_age_days, version, results)
+        self._log_complete(t0, top_k, results, cache_hit)
+        return results
+
+    def retrieve_batch(
+        self,
+        requests: List[Tuple[str, int, Optional[int]]],
+    ) -> List[List[RetrievalResult]]:
+        """Retrieve for many (query, top_k, max_age_days) requests at once.
+
+        Cached results are reused, the remaining queries are embedded in one
+        call and scored together; results are returned in input order.
+        """
+        t0 = time.perf_counter()
+        version = self.index.current_version()
+        out, pending = self._cached_batch(requests, version)
+        query_cache_hits = 0
+        if pending:
+            with stage("query_embed"):
+                vectors, query_cache_hits = self.cache.embed_many(
+                    self.embedder, [requests[i][0] for i in pending]
+                )
+            fresh = self._search_batch(vectors, [requests[i] for i in pending])
+            self._fill_batch(requests, version, out, pending, fresh)
+        self._log_batch_complete(t0, requests, out, pending, query_cache_hits)
+        return out
+
+    async def aretrieve_batch(
+        self,
+        requests: List[Tuple[str, int, Optional[int]]],
+    ) -> List[List[RetrievalResult]]:
+        """Async ``retrieve_batch``."""
+        t0 = time.perf_counter()
+        version = await asyncio.to_thread(self.index.current_version)
+        out, pending = self._cached_batch(requests, version)
+        query_cache_hits = 0
+        if pending:
+            with stage("query_embed"):
+                vectors, query_cache_hits = await self.cache.aembed_many(
+                    self.embedder, [requests[i][0] for i in pending]
+                )
+            fresh = await asyncio.to_thread(
+                self._search_batch, vectors, [requests[i] for i in pending]
             )
+            self._fill_batch(requests, version, out, pending, fresh)
+        self._log_batch_complete(t0, requests, out, pending, query_cache_hits)
+        return out
 
-        results.sort(key=lambda r: r.get("score", 0.0), reverse=True)
-        results = results[:top_k]
+    def _cached_batch(
+        self,
+        requests: List[Tuple[str, int, Optional[int]]],
+        version: int,
+    ) -> Tuple[List[Optional[List[RetrievalResult]]], List[int]]:
+        out = [self.results.get(query, top_k, age, version) for query, top_k, age in requests]
+        return out, [i for i, results in enumerate(out) if results is None]
 
+    def _fill_batch(self, requests, version, out, pending, fresh) -> None:
+        for i, results in zip(pending, fresh):
+            out[i] = results
+            query, top_k, age = requests[i]
+            self.results.put(query, top_k, age, version, results)
+
+    def _search_batch(self, vectors, requests) -> List[List[RetrievalResult]]:
+        with stage("candidate_load"):
+            self.index.ensure_loaded(settings.db_path)
+        return self.index.search_batch(
+            vectors,
+            [top_k for _, top_k, _ in requests],
+            [age for _, _, age in requests],
+        )
+
+    def _log_batch_complete(self, t0, requests, out, pending, query_cache_hits) -> None:
+        unique_pending = len({normalize_query(requests[i][0]) for i in pending})
+        count_cache("retrieval_result", hits=len(requests) - len(pending), misses=len(pending))
+        count_cache("query_embedding", hits=query_cache_hits, misses=unique_pending - query_cache_hits)
+        log_event(
+            "retrieval_batch_complete",
+            queries=len(requests),
+            result_count=sum(len(r) for r in out),
+            result_cache_hits=len(requests) - len(pending),
+            query_cache_hits=query_cache_hits,
+            duration_ms=round((time.perf_counter() - t0) * 1000, 2),
+        )
+
+    def _search(self, query_embedding, top_k: int, max_age_days: Optional[int]) -> List[RetrievalResult]:
+        with stage("candidate_load"):
+            self.index.ensure_loaded(settings.db_path)
+        return self.index.search(query_embedding, top_k, max_age_days)
+
+    def _log_complete(
+        self,
+        t0: float,
+        top_k: int,
+        results: List[RetrievalResult],
+        cache_hit: bool,
+        result_cache_hit: bool = False,
+    ) -> None:
+        count_cache("retrieval_result", hits=int(result_cache_hit), misses=int(not result_cache_hit))
+        if not result_cache_hit:
+            count_cache("query_embedding", hits=int(cache_hit), misses=int(not cache_hit))
         log_event(
             "retrieval_complete",
             top_k=top_k,
             result_count=len(results),
+            query_cache_hit=cache_hit,
+            result_cache_hit=result_cache_hit,
+            **self.cache.stats(),
+            **self.results.stats(),
             duration_ms=round((time.perf_counter() - t0) * 1000, 2),
         )
-        return results
@@ -0,0 +1,285 @@
+import itertools
+import math
+import threading
+import time
+from typing import List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.logging import log_event
+from app.retrieval.base import RetrievalResult
+from app.retrieval.vectors import InMemoryIndex, _normalize
+
+# Rows assigned per lock hold while a background retrain fills its lists.
+_ASSIGN_BLOCK_ROWS = 16384
+
+
+class IVFIndex(InMemoryIndex):
+    """Inverted-file approximate index over the resident vector matrix.
+
+    Rows are bucketed by their nearest k-means centroid and a query only
+    scores the ``nprobe`` buckets whose centroids are closest. Candidates are
+    rescored exactly with the staleness weight and age filter, and the probe
+    widens until at least ``top_k * overfetch`` candidates survive the
+    filter. Below ``train_size`` rows the index answers exactly. Once the
+    index serves, growing past twice the trained size retrains in a
+    background thread.
+    """
+
+    def __init__(
+        self,
+        nlist: int = 0,
+        nprobe: int = 8,
+        train_size: int = 10000,
+        overfetch: int = 4,
+        seed: int = 0,
+    ):
+        super().__init__()
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_size = train_size
+        self.overfetch = max(overfetch, 1)
+        self.centroids: Optional[np.ndarray] = None
+        self._assignment = np.zeros(0, dtype=np.int32)
+        self._lists: List[Set[int]] = []
+        self._trained_size = 0
+        self._rng = np.random.default_rng(seed)
+        # Lists being built by a retrain, kept current alongside the live
+        # ones until they are swapped in.
+        self._next_centroids: Optional[np.ndarray] = None
+        self._next_assignment = np.zeros(0, dtype=np.int32)
+        self._next_lists: List[Set[int]] = []
+        self._train_epoch = 0
+        self._training = False
+
+    def search(
+        self,
+        query_embedding: List[float],
+        top_k: int,
+        max_age_days: Optional[int] = None,
+    ) -> List[RetrievalResult]:
+        with self._lock:
+            if self.centroids is None:
+                return super().search(query_embedding, top_k, max_age_days)
+            if top_k <= 0 or not self._size or len(query_embedding) != self.dim:
+                return []
+            query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+            nlist = self.centroids.shape[0]
+            order = np.argsort(-(self.centroids @ query))
+            nprobe = min(max(self.nprobe, 1), nlist)
+            while True:
+                rows = np.fromiter(
+                    itertools.chain.from_iterable(self._lists[c] for c in order[:nprobe]),
+                    dtype=np.int64,
+                )
+                results, eligible = self._rank(query, top_k, max_age_days, rows)
+                if eligible >= top_k * self.overfetch or nprobe >= nlist:
+                    return results
+                nprobe = min(nprobe * 2, nlist)
+
+    def search_batch(
+        self,
+        query_embeddings: List[List[float]],
+        top_ks: List[int],
+        max_age_days: List[Optional[int]],
+    ) -> List[List[RetrievalResult]]:
+        """Probe lists per query once trained; untrained indexes score the
+        batch exactly."""
+        with self._lock:
+            if self.centroids is None:
+                return super().search_batch(query_embeddings, top_ks, max_age_days)
+            return [
+                self.search(q, k, age)
+                for q, k, age in zip(query_embeddings, top_ks, max_age_days)
+            ]
+
+    def train(self) -> None:
+        """Fit spherical k-means on a sample and reassign every row."""
+        with self._lock:
+            t0 = time.perf_counter()
+            sample, nlist = self._sample()
+            self._begin(_kmeans(sample, nlist, self._rng))
+            self._assign_pending(np.arange(self._size))
+            self._finish(t0, background=False)
+
+    def _train_in_background(self) -> None:
+        """Retrain off the ingest path; caller holds the lock.
+
+        k-means runs on a copied sample without the lock. The new lists are
+        then filled in short locked blocks while the row hooks keep them
+        current, and swapped in once complete; searches use the old lists
+        until then.
+        """
+        if self._training:
+            return
+        self._training = True
+        sample, nlist = self._sample()
+        rng = np.random.default_rng(self._rng.integers(1 << 62))
+        epoch = self._train_epoch
+        threading.Thread(
+            target=self._run_training,
+            args=(sample, nlist, rng, epoch),
+            name="ivf-train",
+            daemon=True,
+        ).start()
+
+    def _run_training(self, sample: np.ndarray, nlist: int, rng: np.random.Generator, epoch: int) -> None:
+        t0 = time.perf_counter()
+        try:
+            centroids = _kmeans(sample, nlist, rng)
+            with self._lock:
+                if epoch != self._train_epoch:
+                    return
+                self._begin(centroids)
+                epoch = self._train_epoch
+            start = 0
+            while True:
+                with self._lock:
+                    if epoch != self._train_epoch:
+                        return
+                    if start >= self._size:
+                        self._finish(t0, background=True)
+                        return
+                    stop = min(start + _ASSIGN_BLOCK_ROWS, self._size)
+                    self._assign_pending(np.arange(start, stop))
+                start = stop
+        except Exception as exc:
+            log_event("index_train_failed", error=str(exc))
+        finally:
+            with self._lock:
+                self._training = False
+
+    def _sample(self) -> Tuple[np.ndarray, int]:
+        """Copy of the k-means training sample and the list count to fit."""
+        size = self._size
+        nlist = self.nlist or int(round(math.sqrt(size)))
+        nlist = max(1, min(nlist, size))
+        sample_size = min(size, max(nlist * 40, self.train_size))
+        return self.vectors[self._rng.choice(size, sample_size, replace=False)], nlist
+
+    def _begin(self, centroids: np.ndarray) -> None:
+        """Start filling lists for ``centroids`` next to the live ones."""
+        self._train_epoch += 1
+        self._next_centroids = centroids
+        self._next_assignment = np.full(self.vectors.shape[0], -1, dtype=np.int32)
+        self._next_lists = [set() for _ in range(centroids.shape[0])]
+
+    def _assign_pending(self, rows: np.ndarray) -> None:
+        """Assign those of ``rows`` the new lists do not hold yet."""
+        rows = rows[self._next_assignment[rows] < 0]
+        for start in range(0, rows.shape[0], _ASSIGN_BLOCK_ROWS):
+            block = rows[start : start + _ASSIGN_BLOCK_ROWS]
+            assign = np.argmax(self.vectors[block] @ self._next_centroids.T, axis=1)
+            self._next_assignment[block] = assign
+            for row, c in zip(block.tolist(), assign.tolist()):
+                self._next_lists[c].add(row)
+
+    def _finish(self, t0: float, background: bool) -> None:
+        """Swap the completed new lists in; caller holds the lock."""
+        # Rows moved in from a block that was not assigned yet.
+        self._assign_pending(np.arange(self._size))
+        self.centroids = self._next_centroids
+        self._assignment = self._next_assignment
+        self._lists = self._next_lists
+        self._next_centroids = None
+        self._next_assignment = np.zeros(0, dtype=np.int32)
+        self._next_lists = []
+        self._trained_size = self._size
+        log_event(
+            "index_train",
+            nlist=self.centroids.shape[0],
+            total=self._size,
+            background=background,
+            duration_ms=round((time.perf_counter() - t0) * 1000, 2),
+        )
+
+    def _upsert_rows(self, rows) -> int:
+        added = super()._upsert_rows(rows)
+        if self._size >= self.train_size and self._size >= 2 * self._trained_size:
+            # The initial build trains inline, before the index serves.
+            if self.loaded:
+                self._train_in_background()
+            else:
+                self.train()
+        return added
+
+    def _reserve(self, capacity: int) -> None:
+        super()._reserve(capacity)
+        if self._assignment.shape[0] < self.vectors.shape[0]:
+            self._assignment = _grow(self._assignment, self.vectors.shape[0], self._size)
+        if self._next_centroids is not None and self._next_assignment.shape[0] < self.vectors.shape[0]:
+            self._next_assignment = _grow(self._next_assignment, self.vectors.shape[0], self._size)
+
+    def _reindex(self) -> None:
+        self._assignment = np.full(self.vectors.shape[0], -1, dtype=np.int32)
+        self.centroids = None
+        self._lists = []
+        self._trained_size = 0
+        # Drop a background retrain; its rows no longer line up.
+        self._train_epoch += 1
+        self._next_centroids = None
+        self._next_assignment = np.zeros(0, dtype=np.int32)
+        self._next_lists = []
+        if self._size >= self.train_size:
+            self.train()
+
+    def _on_set(self, row: int) -> None:
+        if self.centroids is not None:
+            c = int(np.argmax(self.centroids @ self.vectors[row]))
+            self._assignment[row] = c
+            self._lists[c].add(row)
+        if self._next_centroids is not None:
+            c = int(np.argmax(self._next_centroids @ self.vectors[row]))
+            self._next_assignment[row] = c
+            self._next_lists[c].add(row)
+
+    def _on_remove(self, row: int) -> None:
+        _unassign(self._assignment, self._lists, row)
+        if self._next_centroids is not None:
+            _unassign(self._next_assignment, self._next_lists, row)
+
+    def _on_move(self, src: int, dst: int) -> None:
+        _move(self._assignment, self._lists, src, dst)
+        if self._next_centroids is not None:
+            _move(self._next_assignment, self._next_lists, src, dst)
+
+
+def _kmeans(sample: np.ndarray, nlist: int, rng: np.random.Generator) -> np.ndarray:
+    """Spherical k-means centroids for ``sample``."""
+    sample_size = sample.shape[0]
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+    for _ in range(10):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        members = np.bincount(assign, minlength=nlist)
+        starts = np.concatenate(([0], np.cumsum(members)[:-1]))
+        nonempty = members > 0
+        sums = np.add.reduceat(sample[order], starts[nonempty], axis=0)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids[nonempty] = sums / np.maximum(norms, 1e-12)
+        empty = np.flatnonzero(~nonempty)
+        if empty.size:
+            centroids[empty] = sample[rng.choice(sample_size, empty.size)]
+    return centroids
+
+
+def _grow(assignment: np.ndarray, capacity: int, size: int) -> np.ndarray:
+    grown = np.full(capacity, -1, dtype=np.int32)
+    grown[:size] = assignment[:size]
+    return grown
+
+
+def _unassign(assignment: np.ndarray, lists: List[Set[int]], row: int) -> None:
+    c = assignment[row]
+    if c >= 0:
+        lists[c].discard(row)
+        assignment[row] = -1
+
+
+def _move(assignment: np.ndarray, lists: List[Set[int]], src: int, dst: int) -> None:
+    c = assignment[src]
+    assignment[dst] = c
+    assignment[src] = -1
+    if c >= 0:
+        lists[c].discard(src)
+        lists[c].add(dst)
@@ -1,15 +1,25 @@
 from typing import List
-from openai import OpenAI
 
 from app.config import settings
+from app.openai_clients import async_client, client, embedding_limiter
+from app.rate_limit import estimate_tokens
+from app.retrieval.embedding import Embedder
 
-client = OpenAI(api_key=settings.openai_api_key)
 
+class OpenAIEmbedder(Embedder):
+    def __init__(self, model: str | None = None):
+        self.model = model or settings.embedding_model
 
-class OpenAIEmbedder:
     def embed(self, texts: List[str]) -> List[List[float]]:
-        response = client.embeddings.create(
-            model="text-embedding-3-small",
-            input=texts,
+        response = embedding_limiter.call(
+            lambda: client.embeddings.create(model=self.model, input=texts),
+            tokens=sum(estimate_tokens(t) for t in texts),
+        )
+        return [d.embedding for d in response.data]
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        response = await embedding_limiter.acall(
+            lambda: async_client.embeddings.create(model=self.model, input=texts),
+            tokens=sum(estimate_tokens(t) for t in texts),
         )
         return [d.embedding for d in response.data]
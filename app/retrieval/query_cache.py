@@ -0,0 +1,186 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.retrieval import store
+from app.retrieval.chunking import hash_text
+from app.retrieval.embedding import Embedder
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.split())
+
+
+class QueryEmbeddingCache:
+    """Bounded LRU cache of query embeddings with a per-entry TTL.
+
+    Keys are (embedding model, whitespace-normalised query). When
+    ``db_path`` is set, misses fall back to the persistent embedding_cache
+    table (keyed by the text's hash, like chunks) before calling the
+    embedder, so cached queries survive restarts.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, db_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def embed(self, embedder: Embedder, query: str) -> Tuple[np.ndarray, bool]:
+        """Return the query embedding and whether it was served from cache."""
+        text = normalize_query(query)
+        key = (embedder.model, text)
+        vector = self._get(key)
+        if vector is None and self.db_path:
+            vector = self._load_persistent(key)
+        if vector is not None:
+            return vector, True
+
+        vector = np.asarray(embedder.embed([text])[0], dtype=np.float32)
+        self._store(key, vector)
+        return vector, False
+
+    async def aembed(self, embedder: Embedder, query: str) -> Tuple[np.ndarray, bool]:
+        """Async ``embed``: SQLite access runs in a worker thread and the
+        embedder is awaited."""
+        text = normalize_query(query)
+        key = (embedder.model, text)
+        vector = self._get(key)
+        if vector is None and self.db_path:
+            vector = await asyncio.to_thread(self._load_persistent, key)
+        if vector is not None:
+            return vector, True
+
+        vector = np.asarray((await embedder.aembed([text]))[0], dtype=np.float32)
+        await asyncio.to_thread(self._store, key, vector)
+        return vector, False
+
+    def embed_many(self, embedder: Embedder, queries: List[str]) -> Tuple[List[np.ndarray], int]:
+        """Embed many queries with at most one embedder call; returns the
+        vectors in input order and how many unique queries were cached."""
+        texts = [normalize_query(q) for q in queries]
+        found = self._lookup_many(embedder.model, texts)
+        hits = len(found)
+        missing = [t for t in dict.fromkeys(texts) if t not in found]
+        if missing:
+            vectors = [np.asarray(v, dtype=np.float32) for v in embedder.embed(missing)]
+            found.update(self._store_many(embedder.model, dict(zip(missing, vectors))))
+        return [found[t] for t in texts], hits
+
+    async def aembed_many(self, embedder: Embedder, queries: List[str]) -> Tuple[List[np.ndarray], int]:
+        """Async ``embed_many``."""
+        texts = [normalize_query(q) for q in queries]
+        found = await asyncio.to_thread(self._lookup_many, embedder.model, texts)
+        hits = len(found)
+        missing = [t for t in dict.fromkeys(texts) if t not in found]
+        if missing:
+            vectors = [np.asarray(v, dtype=np.float32) for v in await embedder.aembed(missing)]
+            fresh = await asyncio.to_thread(self._store_many, embedder.model, dict(zip(missing, vectors)))
+            found.update(fresh)
+        return [found[t] for t in texts], hits
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "query_cache_hits": self.hits,
+                "query_cache_persistent_hits": self.persistent_hits,
+                "query_cache_misses": self.misses,
+                "query_cache_evictions": self.evictions,
+                "query_cache_size": len(self._entries),
+            }
+
+    def _get(self, key: Tuple[str, str]) -> Optional[np.ndarray]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, vector = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.evictions += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def _load_persistent(self, key: Tuple[str, str]) -> Optional[np.ndarray]:
+        model, text = key
+        blob = store.get_cached_embeddings(self.db_path, model, [hash_text(text)])
+        if not blob:
+            return None
+        vector = store.parse_embedding(next(iter(blob.values())))
+        with self._lock:
+            self.persistent_hits += 1
+        self._put(key, vector)
+        return vector
+
+    def _lookup_many(self, model: str, texts: List[str]) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+        for text in dict.fromkeys(texts):
+            vector = self._get((model, text))
+            if vector is not None:
+                found[text] = vector
+        remaining = {hash_text(t): t for t in dict.fromkeys(texts) if t not in found}
+        if remaining and self.db_path:
+            blobs = store.get_cached_embeddings(self.db_path, model, list(remaining))
+            for chunk_hash, blob in blobs.items():
+                vector = store.parse_embedding(blob)
+                found[remaining[chunk_hash]] = vector
+                self._put((model, remaining[chunk_hash]), vector)
+            with self._lock:
+                self.persistent_hits += len(blobs)
+        return found
+
+    def _store_many(self, model: str, vectors: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        with self._lock:
+            self.misses += len(vectors)
+        if self.db_path:
+            store.put_cached_embeddings(
+                self.db_path,
+                model,
+                {hash_text(t): store.serialize_embedding(v) for t, v in vectors.items()},
+                settings.embedding_cache_max_entries,
+            )
+        for text, vector in vectors.items():
+            self._put((model, text), vector)
+        return vectors
+
+    def _store(self, key: Tuple[str, str], vector: np.ndarray) -> None:
+        with self._lock:
+            self.misses += 1
+        if self.db_path:
+            model, text = key
+            store.put_cached_embeddings(
+                self.db_path,
+                model,
+                {hash_text(text): store.serialize_embedding(vector)},
+                settings.embedding_cache_max_entries,
+            )
+        self._put(key, vector)
+
+    def _put(self, key: Tuple[str, str], vector: np.ndarray) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+
+query_cache = QueryEmbeddingCache(
+    settings.query_cache_max_entries,
+    settings.query_cache_ttl_seconds,
+    db_path=settings.db_path if settings.query_cache_persist else None,
+)
@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.retrieval.base import RetrievalResult
+from app.retrieval.query_cache import normalize_query
+
+_Key = Tuple[str, int, Optional[int], int]
+
+
+class RetrievalResultCache:
+    """Bounded LRU cache of ranked retrieval results.
+
+    Keys are (normalised query, top_k, max_age_days, time bucket), where the
+    bucket is ``time // quantum_seconds`` so staleness weights and the age
+    cut-off are never reused beyond one quantum. Entries belong to a corpus
+    version; seeing a newer version drops everything cached before it, so a
+    hit is never stale relative to an ingest.
+    """
+
+    def __init__(self, max_entries: int, quantum_seconds: float):
+        self.max_entries = max_entries
+        self.quantum_seconds = max(quantum_seconds, 1e-3)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._version: Optional[int] = None
+        self._entries: "OrderedDict[_Key, List[RetrievalResult]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        query: str,
+        top_k: int,
+        max_age_days: Optional[int],
+        version: int,
+    ) -> Optional[List[RetrievalResult]]:
+        if self.max_entries <= 0:
+            return None
+        key = self._key(query, top_k, max_age_days)
+        with self._lock:
+            self._sync_version(version)
+            results = self._entries.get(key)
+            if results is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return [dict(r) for r in results]
+
+    def put(
+        self,
+        query: str,
+        top_k: int,
+        max_age_days: Optional[int],
+        version: int,
+        results: List[RetrievalResult],
+    ) -> None:
+        """Cache ``results`` computed against corpus ``version``; dropped if
+        the corpus has moved on since."""
+        if self.max_entries <= 0:
+            return
+        key = self._key(query, top_k, max_age_days)
+        with self._lock:
+            self._sync_version(version)
+            if version != self._version:
+                return
+            self._entries[key] = [dict(r) for r in results]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "result_cache_hits": self.hits,
+                "result_cache_misses": self.misses,
+                "result_cache_evictions": self.evictions,
+                "result_cache_size": len(self._entries),
+            }
+
+    def _key(self, query: str, top_k: int, max_age_days: Optional[int]) -> _Key:
+        bucket = int(time.time() // self.quantum_seconds)
+        return (normalize_query(query), top_k, max_age_days, bucket)
+
+    def _sync_version(self, version: int) -> None:
+        if self._version is None or version > self._version:
+            self.evictions += len(self._entries)
+            self._entries.clear()
+            self._version = version
+
+
+result_cache = RetrievalResultCache(
+    settings.result_cache_max_entries,
+    settings.result_cache_quantum_seconds,
+)
@@ -0,0 +1,365 @@
+import base64
+import json
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.logging import log_event
+from app.retrieval import snapshot, store
+from app.retrieval.base import RetrievalResult
+from app.retrieval.vectors import InMemoryIndex, snapshot_identity, snapshot_mismatch
+
+# Rows copied per block when folding the snapshot into a new generation.
+_COMPACT_BLOCK_ROWS = 65536
+
+
+class SharedIndex(InMemoryIndex):
+    """Vector index shared by worker processes through an mmapped snapshot.
+
+    The bulk of the rows lives in an on-disk snapshot (see ``snapshot``)
+    that every process maps read-only, so the page cache holds a single
+    copy of the embeddings however many uvicorn workers serve queries.
+    Mutations are appended to the snapshot's log under an exclusive file
+    lock, and each process replays new log records into a small resident
+    overlay (the inherited InMemoryIndex storage) before it searches;
+    snapshot rows that were replaced or removed are masked out. Once the log
+    grows past ``log_max_bytes`` the writer folds snapshot and overlay into
+    a new generation and swaps CURRENT, and other processes remap on their
+    next search.
+
+    Each generation records the database and chunk_changes position it was
+    built from. A generation from another database is rebuilt from SQLite,
+    and writes the log never saw (made while another backend was serving)
+    are caught up from chunk_changes and appended to the log.
+    """
+
+    def __init__(self, directory: str, log_max_bytes: int = 64 << 20):
+        super().__init__()
+        self.directory = Path(directory)
+        self.log_max_bytes = log_max_bytes
+        self.generation: Optional[int] = None
+        self.base_vectors = np.zeros((0, 0), dtype=np.float32)
+        self.base_epochs = np.zeros(0, dtype=np.float64)
+        self.base_metadata: List[Dict] = []
+        self._base_row_by_id: Dict[str, int] = {}
+        self._base_dead = np.zeros(0, dtype=bool)
+        self._log_offset = 0
+        self._base_change_seq = 0
+
+    def __len__(self) -> int:
+        return len(self._base_row_by_id) + self._size
+
+    def ensure_loaded(self, db_path: str) -> None:
+        if self.loaded:
+            return
+        with self._lock:
+            if self.loaded:
+                return
+            t0 = time.perf_counter()
+            source = "snapshot"
+            with snapshot.lock(self.directory):
+                generation = snapshot.current_generation(self.directory)
+                mismatch = self._mismatch(generation, db_path)
+                if mismatch:
+                    if generation is not None:
+                        log_event("index_snapshot_mismatch", generation=generation, reason=mismatch)
+                    # Read first: anything committed while listing is synced again.
+                    change_seq = store.last_chunk_change(db_path)
+                    self._create(store.list_chunks(db_path), **snapshot_identity(db_path, change_seq))
+                    source = "sqlite"
+            self.loaded = True
+            self._refresh()
+            self._db_path = db_path
+            self._change_seq = self._base_change_seq
+            applied = self.sync() or {}
+            self._synced_at = time.monotonic()
+            log_event(
+                "index_load",
+                total=len(self),
+                generation=self.generation,
+                source=source,
+                duration_ms=round((time.perf_counter() - t0) * 1000, 2),
+                **applied,
+            )
+
+    def build(self, rows: List[Dict]) -> None:
+        """Publish ``rows`` as a fresh generation and map it."""
+        with self._lock:
+            with snapshot.lock(self.directory):
+                self._create(rows)
+            self.loaded = True
+            self._refresh()
+
+    def save_snapshot(self) -> Optional[int]:
+        """Fold the log into a new generation; the shared index is always
+        on disk, so this only bounds what starting workers replay."""
+        if not self.loaded:
+            return None
+        with self._lock, snapshot.lock(self.directory):
+            self._refresh()
+            if not self._log_offset:
+                return None
+            self._compact()
+            return self.generation
+
+    def upsert(self, chunks: List[Dict]) -> None:
+        if chunks:
+            self._append({"op": "upsert", "rows": [_encode_row(c) for c in chunks]})
+
+    def move(self, chunks: List[Dict]) -> None:
+        if chunks:
+            self._append(
+                {"op": "move", "chunks": [{"chunk_id": c["chunk_id"], "index": c["index"]} for c in chunks]}
+            )
+
+    def remove(self, chunk_ids: List[str]) -> None:
+        if chunk_ids:
+            self._append({"op": "remove", "chunk_ids": list(chunk_ids)})
+
+    def current_version(self) -> int:
+        with self._lock:
+            if self.loaded:
+                self._refresh()
+        return super().current_version()
+
+    def search(
+        self,
+        query_embedding: List[float],
+        top_k: int,
+        max_age_days: Optional[int] = None,
+    ) -> List[RetrievalResult]:
+        return self.search_batch([query_embedding], [top_k], [max_age_days])[0]
+
+    def search_batch(
+        self,
+        query_embeddings: List[List[float]],
+        top_ks: List[int],
+        max_age_days: List[Optional[int]],
+    ) -> List[List[RetrievalResult]]:
+        """Search the mapped snapshot and the overlay, then merge per query."""
+        with self._lock:
+            if self.loaded:
+                self._refresh()
+            base = self._search_matrix(
+                self.base_vectors,
+                self.base_epochs,
+                self.base_metadata,
+                query_embeddings,
+                top_ks,
+                max_age_days,
+                excluded=self._base_dead if self._base_dead.any() else None,
+            )
+            overlay = super().search_batch(query_embeddings, top_ks, max_age_days)
+            out = []
+            for k, from_base, from_overlay in zip(top_ks, base, overlay):
+                merged = from_base + from_overlay
+                merged.sort(key=lambda r: r["score"], reverse=True)
+                out.append(merged[:k])
+            return out
+
+    def _append(self, record: Dict) -> None:
+        line = (json.dumps(record) + "\n").encode("utf-8")
+        with self._lock, snapshot.lock(self.directory):
+            self.version += 1
+            generation = snapshot.current_generation(self.directory)
+            if generation is None:
+                # Nothing published yet: the first load reads these rows
+                # from SQLite.
+                return
+            with open(snapshot.log_path(self.directory, generation), "ab") as log:
+                log.write(line)
+            if self.loaded:
+                self._refresh()
+                if self._log_offset > self.log_max_bytes:
+                    self._compact()
+
+    def _mismatch(self, generation: Optional[int], db_path: str) -> Optional[str]:
+        """Why ``generation`` cannot serve ``db_path``, if it cannot."""
+        if generation is None:
+            return "missing"
+        try:
+            info = snapshot.read_snapshot(self.directory, generation)[3]
+        except (OSError, ValueError, KeyError):
+            return "unreadable"
+        return snapshot_mismatch(info, db_path)
+
+    def _reconcile(
+        self,
+        db_path: str,
+        chunk_ids: List[str],
+        versions: Dict[str, Tuple[int, Optional[str]]],
+    ) -> Dict[str, int]:
+        # Compare against what the log already holds, so only writes it
+        # missed are appended.
+        with self._lock:
+            if self.loaded:
+                self._refresh()
+        return super()._reconcile(db_path, chunk_ids, versions)
+
+    def _indexed(self, chunk_id: str) -> Optional[Dict]:
+        meta = super()._indexed(chunk_id)
+        if meta is None:
+            row = self._base_row_by_id.get(chunk_id)
+            if row is not None:
+                meta = self.base_metadata[row]
+        return meta
+
+    def _indexed_ids(self) -> Set[str]:
+        return super()._indexed_ids().union(self._base_row_by_id)
+
+    def _refresh(self) -> None:
+        """Remap a newly published generation and replay unseen log records."""
+        generation = snapshot.current_generation(self.directory)
+        while generation is not None and generation != self.generation:
+            try:
+                self._open(generation)
+            except FileNotFoundError:
+                # Superseded and removed between reading CURRENT and
+                # opening it: open the generation CURRENT names now.
+                latest = snapshot.current_generation(self.directory)
+                if latest == generation:
+                    raise
+                generation = latest
+        if self.generation is None:
+            return
+        path = snapshot.log_path(self.directory, self.generation)
+        try:
+            if path.stat().st_size <= self._log_offset:
+                return
+            with open(path, "rb") as log:
+                log.seek(self._log_offset)
+                data = log.read()
+        except FileNotFoundError:
+            return
+        # A concurrent append may be half written; stop at the last newline.
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            if line:
+                self._apply(json.loads(line))
+        self._log_offset += end
+
+    def _apply(self, record: Dict) -> None:
+        op = record["op"]
+        if op == "upsert":
+            rows = [_decode_row(r) for r in record["rows"]]
+            self._mask([r["chunk_id"] for r in rows])
+            InMemoryIndex.upsert(self, rows)
+        elif op == "remove":
+            self._mask(record["chunk_ids"])
+            InMemoryIndex.remove(self, record["chunk_ids"])
+        elif op == "move":
+            for chunk in record["chunks"]:
+                row = self._base_row_by_id.get(chunk["chunk_id"])
+                if row is not None:
+                    self.base_metadata[row] = {**self.base_metadata[row], "chunk_index": chunk["index"]}
+            InMemoryIndex.move(self, record["chunks"])
+
+    def _mask(self, chunk_ids: List[str]) -> None:
+        for chunk_id in chunk_ids:
+            row = self._base_row_by_id.pop(chunk_id, None)
+            if row is not None:
+                self._base_dead[row] = True
+
+    def _open(self, generation: int) -> None:
+        vectors, epochs, metadata, info = snapshot.read_snapshot(self.directory, generation)
+        if self.generation is not None:
+            # Another process may have folded records we never replayed.
+            self.version += 1
+        self.generation = generation
+        self._base_change_seq = info.get("change_seq") or 0
+        self.base_vectors = vectors
+        self.base_epochs = epochs
+        self.base_metadata = metadata
+        self._base_row_by_id = {meta["chunk_id"]: row for row, meta in enumerate(metadata)}
+        self._base_dead = np.zeros(len(metadata), dtype=bool)
+        self._log_offset = 0
+        # The overlay restarts empty: the new generation already holds it.
+        self.dim = info["dim"]
+        self.vectors = np.zeros((0, self.dim or 0), dtype=np.float32)
+        self.updated_epochs = np.zeros(0, dtype=np.float64)
+        self.metadata = []
+        self._row_by_id = {}
+        self._size = 0
+
+    def _create(self, rows: List[Dict], **identity) -> None:
+        """Publish ``rows`` as the next generation, recording ``identity``
+        (see ``snapshot_identity``); caller holds the lock."""
+        t0 = time.perf_counter()
+        staging = InMemoryIndex()
+        staging.build(rows)
+        size = len(staging)
+        generation = (snapshot.current_generation(self.directory) or 0) + 1
+        snapshot.write_snapshot(
+            self.directory,
+            generation,
+            staging.dim,
+            size,
+            [(staging.vectors[:size], staging.updated_epochs[:size])],
+            staging.metadata,
+            **identity,
+        )
+        snapshot.publish(self.directory, generation)
+        log_event(
+            "index_snapshot",
+            generation=generation,
+            total=size,
+            duration_ms=round((time.perf_counter() - t0) * 1000, 2),
+        )
+
+    def _compact(self) -> None:
+        """Fold the snapshot's live rows and the overlay into a new
+        generation; caller holds the lock and has replayed the whole log."""
+        t0 = time.perf_counter()
+        previous = self.generation
+        generation = previous + 1
+        live = ~self._base_dead
+        count = int(live.sum()) + self._size
+
+        def blocks():
+            for start in range(0, self.base_vectors.shape[0], _COMPACT_BLOCK_ROWS):
+                stop = start + _COMPACT_BLOCK_ROWS
+                keep = live[start:stop]
+                yield self.base_vectors[start:stop][keep], self.base_epochs[start:stop][keep]
+            yield self.vectors[: self._size], self.updated_epochs[: self._size]
+
+        metadata = [meta for meta, alive in zip(self.base_metadata, live) if alive] + self.metadata
+        # Everything up to the position this process has synced is folded in;
+        # a generation built without a database is rebuilt by the next loader.
+        identity = snapshot_identity(self._db_path, self._change_seq) if self._db_path else {}
+        snapshot.write_snapshot(self.directory, generation, self.dim, count, blocks(), metadata, **identity)
+        snapshot.publish(self.directory, generation)
+        self._open(generation)
+        snapshot.remove_generation(self.directory, previous)
+        log_event(
+            "index_snapshot",
+            generation=generation,
+            total=count,
+            duration_ms=round((time.perf_counter() - t0) * 1000, 2),
+        )
+
+
+def _encode_row(row: Dict) -> Dict:
+    embedding = row.get("embedding")
+    if isinstance(embedding, (bytes, str)):
+        embedding = store.parse_embedding(embedding)
+    return {
+        "chunk_id": row["chunk_id"],
+        "doc_id": row.get("doc_id"),
+        "chunk_index": row.get("chunk_index", row.get("index")),
+        "text": row.get("text"),
+        "created_at": row.get("created_at"),
+        "updated_at": row.get("updated_at"),
+        "updated_at_epoch": row.get("updated_at_epoch"),
+        "embedding": None if embedding is None else base64.b64encode(
+            np.asarray(embedding, dtype="<f4").tobytes()
+        ).decode("ascii"),
+    }
+
+
+def _decode_row(row: Dict) -> Dict:
+    embedding = row["embedding"]
+    if embedding is not None:
+        embedding = np.frombuffer(base64.b64decode(embedding), dtype="<f4")
+    return {**row, "embedding": embedding}
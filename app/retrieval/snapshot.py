@@ -0,0 +1,205 @@
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from app.logging import log_event
+from app.retrieval import store
+
+# On-disk layout of one index snapshot generation in ``directory``:
+#   snapshot-<generation>.vectors.npy  float32 (count, dim), L2-normalised
+#   snapshot-<generation>.epochs.npy   float64 (count,) updated_at epochs
+#   snapshot-<generation>.meta.json    ids/metadata sidecar plus build info
+#   snapshot-<generation>.log          later mutations (shared index only)
+#   CURRENT                            name of the published generation
+# Files are written under temporary names and renamed into place; CURRENT
+# is swapped last, so readers only ever see complete generations.
+_POINTER = "CURRENT"
+
+
+def directory_for(base: Path, db_path: str) -> Path:
+    """Snapshot directory under ``base`` for one database, so apps pointed at
+    different databases never share (and overwrite) snapshots."""
+    resolved = str(Path(db_path).resolve())
+    digest = hashlib.sha1(resolved.encode("utf-8")).hexdigest()[:12]
+    return Path(base) / f"{Path(db_path).stem}-{digest}"
+
+
+def published_age(directory: Path) -> Optional[float]:
+    """Seconds since a generation was last published, or None."""
+    try:
+        return time.time() - (Path(directory) / _POINTER).stat().st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def stem(directory: Path, generation: int) -> Path:
+    return Path(directory) / f"snapshot-{generation:08d}"
+
+
+def log_path(directory: Path, generation: int) -> Path:
+    return stem(directory, generation).with_suffix(".log")
+
+
+@contextmanager
+def lock(directory: Path) -> Iterator[None]:
+    """Serialise snapshot writers across processes with an advisory file
+    lock."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / "lock", "a") as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def current_generation(directory: Path) -> Optional[int]:
+    try:
+        return int((Path(directory) / _POINTER).read_text().strip())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def write_snapshot(
+    directory: Path,
+    generation: int,
+    dim: Optional[int],
+    count: int,
+    blocks: Iterable[Tuple[np.ndarray, np.ndarray]],
+    metadata: List[Dict],
+    **info,
+) -> None:
+    """Write one generation from ``(vectors, epochs)`` row blocks without
+    materialising the whole matrix; it becomes visible on ``publish``."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    base = stem(directory, generation)
+    vectors_tmp = base.with_suffix(".vectors.npy.tmp")
+    epochs_tmp = base.with_suffix(".epochs.npy.tmp")
+    if count and dim:
+        vectors = open_memmap(vectors_tmp, mode="w+", dtype=np.float32, shape=(count, dim))
+        epochs = open_memmap(epochs_tmp, mode="w+", dtype=np.float64, shape=(count,))
+        pos = 0
+        for block_vectors, block_epochs in blocks:
+            n = block_vectors.shape[0]
+            vectors[pos:pos + n] = block_vectors
+            epochs[pos:pos + n] = block_epochs
+            pos += n
+        if pos != count:
+            raise ValueError(f"snapshot blocks hold {pos} rows, expected {count}")
+        vectors.flush()
+        epochs.flush()
+        del vectors, epochs
+    else:
+        count = 0
+        with open(vectors_tmp, "wb") as out:
+            np.save(out, np.zeros((0, dim or 0), dtype=np.float32))
+        with open(epochs_tmp, "wb") as out:
+            np.save(out, np.zeros(0, dtype=np.float64))
+    _fsync(vectors_tmp)
+    _fsync(epochs_tmp)
+    os.replace(vectors_tmp, base.with_suffix(".vectors.npy"))
+    os.replace(epochs_tmp, base.with_suffix(".epochs.npy"))
+    _write_atomic(
+        base.with_suffix(".meta.json"),
+        json.dumps(
+            {
+                "generation": generation,
+                "dim": dim,
+                "count": count,
+                "created_at": store.now_iso(),
+                **info,
+                "metadata": metadata,
+            }
+        ),
+    )
+    log_path(directory, generation).touch()
+
+
+def publish(directory: Path, generation: int) -> None:
+    """Atomically point CURRENT at ``generation``."""
+    _write_atomic(Path(directory) / _POINTER, f"{generation}\n")
+
+
+def read_snapshot(directory: Path, generation: int) -> Tuple[np.ndarray, np.ndarray, List[Dict], Dict]:
+    """Map a generation read-only; returns vectors, epochs, metadata and the
+    remaining sidecar fields."""
+    base = stem(directory, generation)
+    info = json.loads(base.with_suffix(".meta.json").read_text())
+    metadata = info.pop("metadata")
+    # Zero-length arrays cannot be mapped.
+    mode = "r" if info["count"] else None
+    vectors = np.load(base.with_suffix(".vectors.npy"), mmap_mode=mode)
+    epochs = np.load(base.with_suffix(".epochs.npy"), mmap_mode=mode)
+    return vectors, epochs, metadata, info
+
+
+def remove_generation(directory: Path, generation: int) -> None:
+    """Delete a superseded generation; processes that still map it keep
+    their view until they move on."""
+    base = stem(directory, generation)
+    for suffix in (".vectors.npy", ".epochs.npy", ".meta.json", ".log"):
+        try:
+            base.with_suffix(suffix).unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as out:
+        out.write(text)
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(tmp, path)
+
+
+def _fsync(path: Path) -> None:
+    with open(path, "rb+") as f:
+        os.fsync(f.fileno())
+
+
+class Snapshotter:
+    """Background thread that saves ``index`` every ``interval_seconds``
+    when it has changed since the last save and no other process published
+    a snapshot within the last half interval."""
+
+    def __init__(self, index, interval_seconds: float):
+        self.index = index
+        self.interval_seconds = interval_seconds
+        self._saved_version: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread or self.interval_seconds <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name="index-snapshot", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval_seconds)
+            version = self.index.version
+            if not self.index.loaded or version == self._saved_version:
+                continue
+            # Every worker runs a snapshotter; one save per interval is
+            # enough, since any worker's snapshot loads for all of them.
+            age = published_age(self.index.snapshot_dir) if self.index.snapshot_dir else None
+            if age is not None and age < self.interval_seconds / 2:
+                continue
+            try:
+                self.index.save_snapshot()
+            except Exception as exc:
+                log_event("index_snapshot_failed", error=str(exc))
+                continue
+            self._saved_version = version
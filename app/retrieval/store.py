@@ -1,19 +1,151 @@
 import json
+import os
 import sqlite3
+import struct
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime, timezone, timedelta
-from typing import List, Dict, Optional, Iterable
+from typing import List, Dict, Optional, Iterable, Iterator, Set, Tuple, Union
 
+import numpy as np
 
-def _connect(db_path: str) -> sqlite3.Connection:
-    conn = sqlite3.connect(db_path)
+from app.logging import log_event
+from app.metrics import SQLITE_SECONDS
+from app.request_context import endpoint_ctx
+
+# Embedding BLOB layout: 4-byte dtype tag, uint32 dimension, then the raw
+# little-endian float32 values. The 8-byte header keeps the payload aligned
+# so readers can view it in place with np.frombuffer.
+_EMBEDDING_HEADER = struct.Struct("<4sI")
+_EMBEDDING_TAG = b"f4le"
+_EMBEDDING_DTYPE = np.dtype("<f4")
+
+# Stays below SQLite's default limit on bound parameters per statement.
+_MAX_BATCH_PARAMS = 500
+
+# Entries kept in chunk_changes; a process that falls further behind than
+# this resynchronises from a full id scan instead.
+_CHUNK_CHANGE_RETENTION = 100000
+
+# Legacy rows keep JSON in ``embedding`` until migrated; readers always see
+# whichever encoding is present under the ``embedding`` key.
+_CHUNK_COLUMNS = """
+    chunk_id, doc_id, chunk_index, chunk_hash, text,
+    COALESCE(embedding_blob, embedding) AS embedding,
+    created_at, updated_at, updated_at_epoch
+"""
+
+
+# PRAGMA auto_vacuum value for INCREMENTAL, and free pages released per step.
+_AUTO_VACUUM_INCREMENTAL = 2
+_VACUUM_STEP_PAGES = 2048
+
+# Embedding cache bookkeeping per database: buffered last_used_at touches
+# and an estimate of the row count.
+_CACHE_TOUCH_FLUSH = 1024
+_CACHE_EVICT_FRACTION = 0.05
+_cache_touches: Dict[str, Dict[tuple, float]] = {}
+_cache_sizes: Dict[str, int] = {}
+_cache_guard = threading.Lock()
+
+_local = threading.local()
+_write_locks: Dict[str, threading.Lock] = {}
+_write_locks_guard = threading.Lock()
+_pragmas = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size_kib": 65536,
+    "mmap_size_bytes": 268435456,
+    "busy_timeout_ms": 5000,
+}
+
+
+def configure_connections(
+    journal_mode: str = "WAL",
+    synchronous: str = "NORMAL",
+    cache_size_kib: int = 65536,
+    mmap_size_bytes: int = 268435456,
+    busy_timeout_ms: int = 5000,
+) -> None:
+    """Set the pragmas applied to connections opened from now on."""
+    _pragmas.update(
+        journal_mode=journal_mode,
+        synchronous=synchronous,
+        cache_size_kib=cache_size_kib,
+        mmap_size_bytes=mmap_size_bytes,
+        busy_timeout_ms=busy_timeout_ms,
+    )
+
+
+def _connect(db_path: str, readonly: bool = False) -> sqlite3.Connection:
+    """Return this thread's cached connection to ``db_path``.
+
+    Each thread keeps one read-write and one read-only connection per
+    database instead of opening a new one per call. Read-only connections
+    never take the write lock, so under WAL they read a consistent snapshot
+    while a writer commits.
+    """
+    cache = getattr(_local, "connections", None)
+    if cache is None:
+        cache = _local.connections = {}
+    key = (db_path, readonly)
+    conn = cache.get(key)
+    if conn is not None:
+        return conn
+
+    if readonly:
+        conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+    else:
+        conn = sqlite3.connect(db_path)
     conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA busy_timeout = {int(_pragmas['busy_timeout_ms'])}")
+    if not readonly:
+        conn.execute(f"PRAGMA journal_mode = {_pragmas['journal_mode']}")
+    conn.execute(f"PRAGMA synchronous = {_pragmas['synchronous']}")
+    conn.execute(f"PRAGMA cache_size = {-int(_pragmas['cache_size_kib'])}")
+    conn.execute(f"PRAGMA mmap_size = {int(_pragmas['mmap_size_bytes'])}")
+    cache[key] = conn
     return conn
 
 
-def init_db(db_path: str) -> None:
+@contextmanager
+def _reader(db_path: str) -> Iterator[sqlite3.Connection]:
+    t0 = time.perf_counter()
+    try:
+        yield _connect(db_path, readonly=True)
+    finally:
+        SQLITE_SECONDS.labels(endpoint_ctx.get(), "read").observe(time.perf_counter() - t0)
+
+
+@contextmanager
+def _writer(db_path: str) -> Iterator[sqlite3.Connection]:
+    """Serialise in-process writers and wrap the block in one transaction."""
+    with _write_locks_guard:
+        lock = _write_locks.setdefault(db_path, threading.Lock())
+    conn = _connect(db_path)
+    t0 = time.perf_counter()
+    try:
+        with lock, conn:
+            yield conn
+    finally:
+        SQLITE_SECONDS.labels(endpoint_ctx.get(), "write").observe(time.perf_counter() - t0)
+
+
+def _batched(values: List[str]) -> Iterable[List[str]]:
+    for start in range(0, len(values), _MAX_BATCH_PARAMS):
+        yield values[start : start + _MAX_BATCH_PARAMS]
+
+
+def _placeholders(values: List) -> str:
+    return ",".join("?" * len(values))
+
+
+def init_db(db_path: str, migration_batch_size: int = 500) -> None:
     Path(db_path).parent.mkdir(parents=True, exist_ok=True)
-    with _connect(db_path) as conn:
+    with _writer(db_path) as conn:
+        new_file = not conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone()
         conn.executescript(
             """
             CREATE TABLE IF NOT EXISTS documents (
@@ -31,19 +163,245 @@ def init_db(db_path: str) -> None:
                 chunk_hash TEXT,
                 text TEXT,
                 embedding TEXT,
+                embedding_blob BLOB,
                 created_at TEXT,
                 updated_at TEXT,
+                updated_at_epoch INTEGER,
                 FOREIGN KEY(doc_id) REFERENCES documents(doc_id)
             );
 
             CREATE INDEX IF NOT EXISTS idx_chunks_doc_id ON chunks(doc_id);
             CREATE INDEX IF NOT EXISTS idx_chunks_updated_at ON chunks(updated_at);
+
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                model TEXT,
+                chunk_hash TEXT,
+                embedding BLOB,
+                last_used_at REAL,
+                PRIMARY KEY (model, chunk_hash)
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_embedding_cache_last_used
+                ON embedding_cache(last_used_at);
+
+            CREATE TABLE IF NOT EXISTS ingest_jobs (
+                job_id TEXT PRIMARY KEY,
+                doc_id TEXT NOT NULL,
+                source TEXT,
+                request_id TEXT,
+                status TEXT NOT NULL,
+                payload_path TEXT,
+                superseded_by TEXT,
+                chunks_total INTEGER NOT NULL DEFAULT 0,
+                chunks_embedded INTEGER NOT NULL DEFAULT 0,
+                chunks_written INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                created_at TEXT,
+                started_at TEXT,
+                finished_at TEXT,
+                queue_ms REAL,
+                run_ms REAL,
+                owner TEXT,
+                heartbeat_at REAL
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_ingest_jobs_status ON ingest_jobs(status);
+            CREATE INDEX IF NOT EXISTS idx_ingest_jobs_doc_id ON ingest_jobs(doc_id);
+
+            -- Ids of chunks written, in commit order, so every process can
+            -- catch its resident index up with writes made by the others.
+            CREATE TABLE IF NOT EXISTS chunk_changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                chunk_id TEXT NOT NULL
+            );
+
+            CREATE TRIGGER IF NOT EXISTS chunk_changes_insert AFTER INSERT ON chunks
+            BEGIN
+                INSERT INTO chunk_changes (chunk_id) VALUES (new.chunk_id);
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS chunk_changes_update
+            AFTER UPDATE OF chunk_id, doc_id, chunk_index, text, updated_at ON chunks
+            BEGIN
+                INSERT INTO chunk_changes (chunk_id) VALUES (new.chunk_id);
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS chunk_changes_delete AFTER DELETE ON chunks
+            BEGIN
+                INSERT INTO chunk_changes (chunk_id) VALUES (old.chunk_id);
+            END;
             """
         )
+        if new_file:
+            # Cheap while empty; existing files are converted by
+            # reclaim_space after the embedding migration.
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+        columns = {r["name"] for r in conn.execute("PRAGMA table_info(chunks)")}
+        if "embedding_blob" not in columns:
+            conn.execute("ALTER TABLE chunks ADD COLUMN embedding_blob BLOB")
+        if "updated_at_epoch" not in columns:
+            conn.execute("ALTER TABLE chunks ADD COLUMN updated_at_epoch INTEGER")
+        job_columns = {r["name"] for r in conn.execute("PRAGMA table_info(ingest_jobs)")}
+        if "owner" not in job_columns:
+            conn.execute("ALTER TABLE ingest_jobs ADD COLUMN owner TEXT")
+        if "heartbeat_at" not in job_columns:
+            conn.execute("ALTER TABLE ingest_jobs ADD COLUMN heartbeat_at REAL")
+        # Age filtering runs on the resident index's epoch array; nothing
+        # range-scans the column.
+        conn.execute("DROP INDEX IF EXISTS idx_chunks_updated_at_epoch")
+        pending_embeddings = conn.execute(
+            "SELECT 1 FROM chunks WHERE embedding_blob IS NULL AND embedding IS NOT NULL LIMIT 1"
+        ).fetchone()
+        pending_epochs = conn.execute(
+            "SELECT 1 FROM chunks WHERE updated_at_epoch IS NULL AND updated_at IS NOT NULL LIMIT 1"
+        ).fetchone()
+
+    if pending_embeddings or pending_epochs:
+        threading.Thread(
+            target=_run_migrations,
+            args=(db_path, migration_batch_size, bool(pending_embeddings), bool(pending_epochs)),
+            name="schema-migration",
+            daemon=True,
+        ).start()
+
+
+def _run_migrations(db_path: str, batch_size: int, embeddings: bool, epochs: bool) -> None:
+    if embeddings and migrate_embeddings(db_path, batch_size):
+        reclaim_space(db_path)
+    if epochs:
+        backfill_updated_epochs(db_path, batch_size)
+
+
+def backfill_updated_epochs(db_path: str, batch_size: int = 500) -> int:
+    """Fill ``updated_at_epoch`` from ``updated_at`` for rows written before
+    the column existed, one short transaction per batch."""
+    t0 = time.perf_counter()
+    filled = 0
+    last_rowid = 0
+    while True:
+        with _writer(db_path) as conn:
+            rows = conn.execute(
+                """
+                SELECT rowid FROM chunks
+                WHERE rowid > ? AND updated_at_epoch IS NULL AND updated_at IS NOT NULL
+                ORDER BY rowid
+                LIMIT ?
+                """,
+                (last_rowid, batch_size),
+            ).fetchall()
+            if not rows:
+                break
+            last_rowid = rows[-1]["rowid"]
+            conn.executemany(
+                """
+                UPDATE chunks SET updated_at_epoch = CAST(strftime('%s', updated_at) AS INTEGER)
+                WHERE rowid = ? AND updated_at_epoch IS NULL
+                """,
+                [(r["rowid"],) for r in rows],
+            )
+            filled += len(rows)
+
+    log_event(
+        "epoch_backfill_complete",
+        filled=filled,
+        duration_ms=round((time.perf_counter() - t0) * 1000, 2),
+    )
+    return filled
+
+
+def migrate_embeddings(db_path: str, batch_size: int = 500) -> int:
+    """Re-encode legacy JSON embeddings as BLOBs, one short transaction per batch.
+
+    Readers accept both encodings, so this can run while the app serves
+    traffic. Each update is guarded on the old JSON value so a concurrent
+    ingest that rewrote the row is never clobbered.
+    """
+    t0 = time.perf_counter()
+    migrated = 0
+    last_rowid = 0
+    while True:
+        with _writer(db_path) as conn:
+            rows = conn.execute(
+                """
+                SELECT rowid, chunk_id, embedding FROM chunks
+                WHERE rowid > ? AND embedding_blob IS NULL AND embedding IS NOT NULL
+                ORDER BY rowid
+                LIMIT ?
+                """,
+                (last_rowid, batch_size),
+            ).fetchall()
+            if not rows:
+                break
+            last_rowid = rows[-1]["rowid"]
+            updates = []
+            for row in rows:
+                try:
+                    blob = serialize_embedding(json.loads(row["embedding"]))
+                except (TypeError, ValueError):
+                    continue
+                updates.append((blob, row["chunk_id"], row["embedding"]))
+            conn.executemany(
+                """
+                UPDATE chunks SET embedding_blob = ?, embedding = NULL
+                WHERE chunk_id = ? AND embedding = ?
+                """,
+                updates,
+            )
+            migrated += len(updates)
+
+    log_event(
+        "embedding_migration_complete",
+        migrated=migrated,
+        duration_ms=round((time.perf_counter() - t0) * 1000, 2),
+    )
+    return migrated
+
+
+def reclaim_space(db_path: str) -> int:
+    """Return free pages to the filesystem; returns the bytes released.
+
+    A database created before incremental auto-vacuum is switched to it
+    with one full VACUUM, which rewrites the file and blocks writers while
+    it runs. After that, free pages are released ``_VACUUM_STEP_PAGES`` at a
+    time, one short write each.
+    """
+    t0 = time.perf_counter()
+    before = _file_bytes(db_path)
+    with _writer(db_path) as conn:
+        # A read first, so a header another connection changed is reloaded.
+        conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone()
+        mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        if mode != _AUTO_VACUUM_INCREMENTAL:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+    while True:
+        with _writer(db_path) as conn:
+            if not conn.execute("PRAGMA freelist_count").fetchone()[0]:
+                break
+            conn.execute(f"PRAGMA incremental_vacuum({_VACUUM_STEP_PAGES})").fetchall()
+    with _writer(db_path) as conn:
+        # Truncation reaches the main file once the WAL is checkpointed.
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+    released = max(before - _file_bytes(db_path), 0)
+    log_event(
+        "database_space_reclaimed",
+        full_vacuum=mode != _AUTO_VACUUM_INCREMENTAL,
+        released_bytes=released,
+        duration_ms=round((time.perf_counter() - t0) * 1000, 2),
+    )
+    return released
+
+
+def _file_bytes(db_path: str) -> int:
+    return sum(
+        os.path.getsize(p) for p in (db_path, f"{db_path}-wal") if os.path.exists(p)
+    )
 
 
 def get_document(db_path: str, doc_id: str) -> Optional[Dict]:
-    with _connect(db_path) as conn:
+    with _reader(db_path) as conn:
         row = conn.execute(
             "SELECT * FROM documents WHERE doc_id = ?",
             (doc_id,),
@@ -51,97 +409,567 @@ def get_document(db_path: str, doc_id: str) -> Optional[Dict]:
         return dict(row) if row else None
 
 
+def get_documents(db_path: str, doc_ids: List[str]) -> Dict[str, Dict]:
+    found: Dict[str, Dict] = {}
+    with _reader(db_path) as conn:
+        for batch in _batched(doc_ids):
+            rows = conn.execute(
+                f"SELECT * FROM documents WHERE doc_id IN ({_placeholders(batch)})",
+                batch,
+            ).fetchall()
+            found.update((r["doc_id"], dict(r)) for r in rows)
+    return found
+
+
 def upsert_document(db_path: str, doc: Dict) -> None:
-    with _connect(db_path) as conn:
-        conn.execute(
-            """
-            INSERT INTO documents (doc_id, source, content_hash, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?)
-            ON CONFLICT(doc_id) DO UPDATE SET
-                source = excluded.source,
-                content_hash = excluded.content_hash,
-                updated_at = excluded.updated_at
-            """,
+    with _writer(db_path) as conn:
+        _upsert_documents(conn, [doc])
+
+
+def _upsert_documents(conn: sqlite3.Connection, docs: Iterable[Dict]) -> None:
+    conn.executemany(
+        """
+        INSERT INTO documents (doc_id, source, content_hash, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(doc_id) DO UPDATE SET
+            source = excluded.source,
+            content_hash = excluded.content_hash,
+            updated_at = excluded.updated_at
+        """,
+        [
             (
                 doc["doc_id"],
                 doc.get("source"),
                 doc.get("content_hash"),
                 doc.get("created_at"),
                 doc.get("updated_at"),
-            ),
-        )
+            )
+            for doc in docs
+        ],
+    )
 
 
 def get_chunks_by_doc(db_path: str, doc_id: str) -> List[Dict]:
-    with _connect(db_path) as conn:
+    with _reader(db_path) as conn:
         rows = conn.execute(
-            "SELECT * FROM chunks WHERE doc_id = ?",
+            f"SELECT {_CHUNK_COLUMNS} FROM chunks WHERE doc_id = ?",
             (doc_id,),
         ).fetchall()
         return [dict(r) for r in rows]
 
 
-def upsert_chunks(db_path: str, chunks: Iterable[Dict]) -> None:
-    with _connect(db_path) as conn:
-        conn.executemany(
+def get_chunk_states(db_path: str, doc_id: str) -> List[Dict]:
+    """Chunk identity and bookkeeping columns only, without text or embeddings."""
+    with _reader(db_path) as conn:
+        rows = conn.execute(
             """
-            INSERT INTO chunks (
-                chunk_id, doc_id, chunk_index, chunk_hash,
-                text, embedding, created_at, updated_at
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ON CONFLICT(chunk_id) DO UPDATE SET
-                chunk_hash = excluded.chunk_hash,
-                text = excluded.text,
-                embedding = excluded.embedding,
-                updated_at = excluded.updated_at
+            SELECT chunk_id, chunk_index, chunk_hash, created_at, updated_at
+            FROM chunks WHERE doc_id = ?
             """,
-            [
-                (
-                    c["chunk_id"],
-                    c["doc_id"],
-                    c["index"],
-                    c.get("chunk_hash"),
-                    c["text"],
-                    c.get("embedding"),
-                    c.get("created_at"),
-                    c.get("updated_at"),
-                )
-                for c in chunks
-            ],
+            (doc_id,),
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+
+def get_chunk_states_by_docs(db_path: str, doc_ids: List[str]) -> Dict[str, List[Dict]]:
+    found: Dict[str, List[Dict]] = {doc_id: [] for doc_id in doc_ids}
+    with _reader(db_path) as conn:
+        for batch in _batched(doc_ids):
+            rows = conn.execute(
+                f"""
+                SELECT doc_id, chunk_id, chunk_index, chunk_hash, created_at, updated_at
+                FROM chunks WHERE doc_id IN ({_placeholders(batch)})
+                """,
+                batch,
+            ).fetchall()
+            for r in rows:
+                found[r["doc_id"]].append(dict(r))
+    return found
+
+
+def upsert_chunks(db_path: str, chunks: Iterable[Dict]) -> None:
+    with _writer(db_path) as conn:
+        _upsert_chunks(conn, chunks)
+
+
+def _upsert_chunks(conn: sqlite3.Connection, chunks: Iterable[Dict]) -> None:
+    conn.executemany(
+        """
+        INSERT INTO chunks (
+            chunk_id, doc_id, chunk_index, chunk_hash,
+            text, embedding, embedding_blob, created_at, updated_at, updated_at_epoch
         )
+        VALUES (?, ?, ?, ?, ?, NULL, ?, ?, ?, ?)
+        ON CONFLICT(chunk_id) DO UPDATE SET
+            chunk_index = excluded.chunk_index,
+            chunk_hash = excluded.chunk_hash,
+            text = excluded.text,
+            embedding = NULL,
+            embedding_blob = excluded.embedding_blob,
+            updated_at = excluded.updated_at,
+            updated_at_epoch = excluded.updated_at_epoch
+        """,
+        [
+            (
+                c["chunk_id"],
+                c["doc_id"],
+                c["index"],
+                c.get("chunk_hash"),
+                c["text"],
+                c.get("embedding"),
+                c.get("created_at"),
+                c.get("updated_at"),
+                c.get("updated_at_epoch"),
+            )
+            for c in chunks
+        ],
+    )
+    _prune_chunk_changes(conn)
+
+
+def update_chunk_indexes(db_path: str, chunks: Iterable[Dict]) -> None:
+    with _writer(db_path) as conn:
+        _update_chunk_indexes(conn, chunks)
+
+
+def _update_chunk_indexes(conn: sqlite3.Connection, chunks: Iterable[Dict]) -> None:
+    conn.executemany(
+        "UPDATE chunks SET chunk_index = ? WHERE chunk_id = ?",
+        [(c["index"], c["chunk_id"]) for c in chunks],
+    )
 
 
 def delete_chunks(db_path: str, doc_id: str, chunk_ids: List[str]) -> None:
     if not chunk_ids:
         return
-    with _connect(db_path) as conn:
-        conn.executemany(
-            "DELETE FROM chunks WHERE doc_id = ? AND chunk_id = ?",
-            [(doc_id, cid) for cid in chunk_ids],
-        )
+    with _writer(db_path) as conn:
+        _delete_chunks(conn, [(doc_id, cid) for cid in chunk_ids])
+
+
+def _delete_chunks(conn: sqlite3.Connection, keys: Iterable[tuple]) -> None:
+    conn.executemany(
+        "DELETE FROM chunks WHERE doc_id = ? AND chunk_id = ?",
+        keys,
+    )
+
+
+def write_ingest_batch(
+    db_path: str,
+    documents: List[Dict],
+    chunks: List[Dict],
+    moved: List[Dict],
+    deleted: List[tuple],
+) -> None:
+    """Apply a whole ingest batch (documents, chunk upserts, index moves and
+    (doc_id, chunk_id) deletions) in a single transaction."""
+    with _writer(db_path) as conn:
+        _delete_chunks(conn, deleted)
+        _upsert_documents(conn, documents)
+        _upsert_chunks(conn, chunks)
+        _update_chunk_indexes(conn, moved)
 
 
 def list_chunks(db_path: str) -> List[Dict]:
-    with _connect(db_path) as conn:
-        rows = conn.execute("SELECT * FROM chunks").fetchall()
+    with _reader(db_path) as conn:
+        rows = conn.execute(f"SELECT {_CHUNK_COLUMNS} FROM chunks").fetchall()
         return [dict(r) for r in rows]
 
 
-def parse_embedding(raw: Optional[str]) -> Optional[List[float]]:
+def list_chunk_versions(db_path: str) -> Dict[str, Tuple[int, Optional[str]]]:
+    """chunk_id -> (chunk_index, updated_at) for every chunk."""
+    with _reader(db_path) as conn:
+        return {
+            row[0]: (row[1], row[2])
+            for row in conn.execute("SELECT chunk_id, chunk_index, updated_at FROM chunks")
+        }
+
+
+def get_chunk_versions(db_path: str, chunk_ids: List[str]) -> Dict[str, Tuple[int, Optional[str]]]:
+    """chunk_id -> (chunk_index, updated_at) for those of ``chunk_ids`` that
+    still exist."""
+    found: Dict[str, Tuple[int, Optional[str]]] = {}
+    with _reader(db_path) as conn:
+        for batch in _batched(chunk_ids):
+            rows = conn.execute(
+                f"""
+                SELECT chunk_id, chunk_index, updated_at
+                FROM chunks WHERE chunk_id IN ({_placeholders(batch)})
+                """,
+                batch,
+            ).fetchall()
+            found.update((r[0], (r[1], r[2])) for r in rows)
+    return found
+
+
+def get_chunks(db_path: str, chunk_ids: List[str]) -> List[Dict]:
+    rows: List[Dict] = []
+    with _reader(db_path) as conn:
+        for batch in _batched(chunk_ids):
+            rows.extend(
+                dict(r)
+                for r in conn.execute(
+                    f"SELECT {_CHUNK_COLUMNS} FROM chunks WHERE chunk_id IN ({_placeholders(batch)})",
+                    batch,
+                )
+            )
+    return rows
+
+
+def last_chunk_change(db_path: str) -> int:
+    """Sequence number of the newest chunk_changes entry (0 when empty)."""
+    with _reader(db_path) as conn:
+        return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM chunk_changes").fetchone()[0]
+
+
+def get_chunk_change(db_path: str, seq: int) -> Optional[str]:
+    """chunk_id logged at change ``seq``, or None when there is none (yet)."""
+    with _reader(db_path) as conn:
+        row = conn.execute("SELECT chunk_id FROM chunk_changes WHERE seq = ?", (seq,)).fetchone()
+    return row[0] if row else None
+
+
+def list_chunk_changes(db_path: str, after_seq: int) -> Optional[Tuple[int, List[str]]]:
+    """Distinct ids of chunks written after change ``after_seq`` and the
+    newest sequence number read, or None when entries after ``after_seq``
+    were already pruned."""
+    with _reader(db_path) as conn:
+        rows = conn.execute(
+            "SELECT seq, chunk_id FROM chunk_changes WHERE seq > ? ORDER BY seq",
+            (after_seq,),
+        ).fetchall()
+        # Read after the entries: pruning only raises the minimum, so a gap
+        # seen here means entries were missing from the read above too.
+        first = conn.execute("SELECT MIN(seq) FROM chunk_changes").fetchone()[0]
+    if first is not None and first > after_seq + 1:
+        return None
+    if not rows:
+        return after_seq, []
+    return rows[-1][0], list(dict.fromkeys(r[1] for r in rows))
+
+
+def _prune_chunk_changes(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        "DELETE FROM chunk_changes WHERE seq <= (SELECT MAX(seq) FROM chunk_changes) - ?",
+        (_CHUNK_CHANGE_RETENTION,),
+    )
+
+
+def create_job(db_path: str, job: Dict) -> None:
+    columns = list(job)
+    with _writer(db_path) as conn:
+        conn.execute(
+            f"INSERT INTO ingest_jobs ({', '.join(columns)}) VALUES ({_placeholders(columns)})",
+            [job[c] for c in columns],
+        )
+
+
+def update_job(db_path: str, job_id: str, **fields) -> None:
+    if "result" in fields and fields["result"] is not None:
+        fields["result"] = json.dumps(fields["result"])
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    with _writer(db_path) as conn:
+        conn.execute(
+            f"UPDATE ingest_jobs SET {assignments} WHERE job_id = ?",
+            [*fields.values(), job_id],
+        )
+
+
+def claim_job(db_path: str, job_id: str, owner: str, **fields) -> bool:
+    """Mark a queued job of ``owner`` running, setting ``fields``.
+
+    The check and the update are one statement, so a job is claimed by at
+    most one process. Returns False when the job is no longer queued, has
+    been adopted by another owner, or another job for the same document is
+    running.
+    """
+    assignments = "".join(f", {name} = ?" for name in fields)
+    with _writer(db_path) as conn:
+        cur = conn.execute(
+            f"UPDATE ingest_jobs SET status = 'running'{assignments} "
+            "WHERE job_id = ? AND owner = ? AND status = 'queued' AND NOT EXISTS ("
+            "SELECT 1 FROM ingest_jobs AS other "
+            "WHERE other.doc_id = ingest_jobs.doc_id AND other.status = 'running')",
+            [*fields.values(), job_id, owner],
+        )
+    return cur.rowcount == 1
+
+
+def supersede_jobs(db_path: str, job_id: str, doc_id: str, finished_at: str) -> List[Dict]:
+    """Supersede the queued jobs for ``doc_id`` created before ``job_id``.
+
+    Running jobs are left to finish. Returns the superseded jobs.
+    """
+    with _writer(db_path) as conn:
+        conn.execute(
+            "UPDATE ingest_jobs SET status = 'superseded', superseded_by = ?, finished_at = ? "
+            "WHERE doc_id = ? AND status = 'queued' "
+            "AND rowid < (SELECT rowid FROM ingest_jobs WHERE job_id = ?)",
+            (job_id, finished_at, doc_id, job_id),
+        )
+        rows = conn.execute(
+            "SELECT * FROM ingest_jobs WHERE superseded_by = ? AND status = 'superseded'",
+            (job_id,),
+        ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def start_jobs(db_path: str, jobs: List[Dict], finished_at: str) -> Optional[List[Dict]]:
+    """Record ``jobs`` as running, all or none, for work done outside the
+    queue's workers.
+
+    Nothing is recorded while a job for any of their documents is running,
+    and workers cannot claim a job for them until these finish. Queued jobs
+    for the documents are superseded. Returns the superseded jobs, or None
+    when a document was busy.
+    """
+    if not jobs:
+        return []
+    columns = list(jobs[0])
+    doc_ids = json.dumps([job["doc_id"] for job in jobs])
+    with _writer(db_path) as conn:
+        # The guarded insert comes first so the check runs under the write lock.
+        cur = conn.execute(
+            f"INSERT INTO ingest_jobs ({', '.join(columns)}) SELECT {_placeholders(columns)} "
+            "WHERE NOT EXISTS (SELECT 1 FROM ingest_jobs WHERE status = 'running' "
+            "AND doc_id IN (SELECT value FROM json_each(?)))",
+            [*(jobs[0][c] for c in columns), doc_ids],
+        )
+        if cur.rowcount != 1:
+            return None
+        conn.executemany(
+            f"INSERT INTO ingest_jobs ({', '.join(columns)}) VALUES ({_placeholders(columns)})",
+            [[job[c] for c in columns] for job in jobs[1:]],
+        )
+        conn.execute(
+            "UPDATE ingest_jobs SET status = 'superseded', finished_at = ?, superseded_by = ("
+            "SELECT running.job_id FROM ingest_jobs AS running "
+            "WHERE running.doc_id = ingest_jobs.doc_id AND running.status = 'running') "
+            "WHERE status = 'queued' AND doc_id IN (SELECT value FROM json_each(?))",
+            (finished_at, doc_ids),
+        )
+        rows = conn.execute(
+            "SELECT * FROM ingest_jobs WHERE status = 'superseded' "
+            "AND superseded_by IN (SELECT value FROM json_each(?))",
+            (json.dumps([job["job_id"] for job in jobs]),),
+        ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def finish_jobs(db_path: str, job_ids: List[str], **fields) -> None:
+    """Set ``fields`` (typically the final status) on every job in ``job_ids``."""
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    with _writer(db_path) as conn:
+        conn.executemany(
+            f"UPDATE ingest_jobs SET {assignments} WHERE job_id = ?",
+            [[*fields.values(), job_id] for job_id in job_ids],
+        )
+
+
+def touch_jobs(db_path: str, owner: str, heartbeat_at: float) -> None:
+    """Record that ``owner`` is alive for its queued and running jobs."""
+    with _writer(db_path) as conn:
+        conn.execute(
+            "UPDATE ingest_jobs SET heartbeat_at = ? "
+            "WHERE owner = ? AND status IN ('queued', 'running')",
+            (heartbeat_at, owner),
+        )
+
+
+def adopt_stale_jobs(db_path: str, owner: str, stale_before: float, heartbeat_at: float) -> List[Dict]:
+    """Requeue for ``owner`` the unfinished jobs whose owner went quiet.
+
+    A job is stale when its owner's last heartbeat is older than
+    ``stale_before`` (or it predates owners). Returns every queued job
+    ``owner`` now holds, oldest first.
+    """
+    with _writer(db_path) as conn:
+        conn.execute(
+            "UPDATE ingest_jobs SET status = 'queued', owner = ?, heartbeat_at = ?, started_at = NULL "
+            "WHERE status IN ('queued', 'running') "
+            "AND (owner IS NULL OR heartbeat_at IS NULL OR heartbeat_at < ?)",
+            (owner, heartbeat_at, stale_before),
+        )
+        rows = conn.execute(
+            "SELECT * FROM ingest_jobs WHERE owner = ? AND status = 'queued' ORDER BY created_at, rowid",
+            (owner,),
+        ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def prune_jobs(db_path: str, finished_before: str) -> int:
+    """Delete jobs that finished before ``finished_before``; returns the count."""
+    with _writer(db_path) as conn:
+        cur = conn.execute(
+            "DELETE FROM ingest_jobs "
+            "WHERE status IN ('succeeded', 'failed', 'superseded') AND finished_at < ?",
+            (finished_before,),
+        )
+    return cur.rowcount
+
+
+def list_job_payloads(db_path: str) -> Set[str]:
+    """Spool paths of queued and running jobs."""
+    with _reader(db_path) as conn:
+        rows = conn.execute(
+            "SELECT payload_path FROM ingest_jobs "
+            "WHERE status IN ('queued', 'running') AND payload_path IS NOT NULL"
+        ).fetchall()
+    return {r["payload_path"] for r in rows}
+
+
+def get_job(db_path: str, job_id: str) -> Optional[Dict]:
+    with _reader(db_path) as conn:
+        row = conn.execute("SELECT * FROM ingest_jobs WHERE job_id = ?", (job_id,)).fetchone()
+    if not row:
+        return None
+    job = dict(row)
+    if job["result"]:
+        job["result"] = json.loads(job["result"])
+    return job
+
+
+def list_jobs(db_path: str, statuses: List[str]) -> List[Dict]:
+    """Jobs in any of ``statuses``, oldest first."""
+    with _reader(db_path) as conn:
+        rows = conn.execute(
+            f"SELECT * FROM ingest_jobs WHERE status IN ({_placeholders(statuses)}) "
+            "ORDER BY created_at, rowid",
+            statuses,
+        ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def get_cached_embeddings(db_path: str, model: str, chunk_hashes: List[str]) -> Dict[str, bytes]:
+    """Return cached embedding BLOBs by chunk_hash and mark them recently used.
+
+    Lookups only read; the last_used_at touches are buffered in memory and
+    written with the next ``put_cached_embeddings`` or once
+    ``_CACHE_TOUCH_FLUSH`` of them are pending.
+    """
+    found: Dict[str, bytes] = {}
+    if not chunk_hashes:
+        return found
+    with _reader(db_path) as conn:
+        for batch in _batched(chunk_hashes):
+            rows = conn.execute(
+                f"""
+                SELECT chunk_hash, embedding FROM embedding_cache
+                WHERE model = ? AND chunk_hash IN ({_placeholders(batch)})
+                """,
+                (model, *batch),
+            ).fetchall()
+            found.update((r["chunk_hash"], r["embedding"]) for r in rows)
+    if found:
+        now = time.time()
+        with _cache_guard:
+            touches = _cache_touches.setdefault(db_path, {})
+            touches.update(((model, h), now) for h in found)
+            flush = len(touches) >= _CACHE_TOUCH_FLUSH
+        if flush:
+            with _writer(db_path) as conn:
+                _flush_cache_touches(conn, db_path)
+    return found
+
+
+def put_cached_embeddings(
+    db_path: str,
+    model: str,
+    embeddings: Dict[str, bytes],
+    max_entries: int,
+) -> int:
+    """Insert embedding BLOBs and evict least-recently-used rows beyond
+    ``max_entries``. Returns the number of evicted rows.
+
+    The row count is estimated from this process's inserts and only
+    counted exactly once the estimate passes ``max_entries``; eviction then
+    trims ``_CACHE_EVICT_FRACTION`` below the limit so the next count is
+    that many inserts away.
+    """
+    if not embeddings or max_entries <= 0:
+        return 0
+    now = time.time()
+    with _writer(db_path) as conn:
+        _flush_cache_touches(conn, db_path)
+        conn.executemany(
+            """
+            INSERT INTO embedding_cache (model, chunk_hash, embedding, last_used_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(model, chunk_hash) DO UPDATE SET
+                embedding = excluded.embedding,
+                last_used_at = excluded.last_used_at
+            """,
+            [(model, h, blob, now) for h, blob in embeddings.items()],
+        )
+        with _cache_guard:
+            estimate = _cache_sizes.get(db_path)
+            # Replaced rows count as inserts, so this only overestimates.
+            _cache_sizes[db_path] = (estimate or 0) + len(embeddings)
+        if estimate is not None and estimate + len(embeddings) <= max_entries:
+            return 0
+        total = conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+        evicted = 0
+        if total > max_entries:
+            evicted = conn.execute(
+                """
+                DELETE FROM embedding_cache WHERE rowid IN (
+                    SELECT rowid FROM embedding_cache ORDER BY last_used_at LIMIT ?
+                )
+                """,
+                (total - max_entries + int(max_entries * _CACHE_EVICT_FRACTION),),
+            ).rowcount
+        with _cache_guard:
+            _cache_sizes[db_path] = total - evicted
+    return evicted
+
+
+def _flush_cache_touches(conn: sqlite3.Connection, db_path: str) -> None:
+    with _cache_guard:
+        touches = _cache_touches.pop(db_path, None)
+    if touches:
+        conn.executemany(
+            "UPDATE embedding_cache SET last_used_at = ? WHERE model = ? AND chunk_hash = ?",
+            [(used, model, h) for (model, h), used in touches.items()],
+        )
+
+
+def parse_embedding(raw: Union[bytes, str, None]) -> Optional[np.ndarray]:
+    """Decode a stored embedding; BLOBs are returned as a read-only view."""
     if raw is None:
         return None
-    return json.loads(raw)
+    if isinstance(raw, str):
+        return np.asarray(json.loads(raw), dtype=np.float32)
+    tag, dim = _EMBEDDING_HEADER.unpack_from(raw)
+    if tag != _EMBEDDING_TAG:
+        raise ValueError(f"unsupported embedding encoding: {tag!r}")
+    return np.frombuffer(
+        memoryview(raw),
+        dtype=_EMBEDDING_DTYPE,
+        count=dim,
+        offset=_EMBEDDING_HEADER.size,
+    )
 
 
-def serialize_embedding(embedding: List[float]) -> str:
-    return json.dumps(embedding)
+def serialize_embedding(embedding: Union[List[float], np.ndarray]) -> bytes:
+    values = np.asarray(embedding, dtype=_EMBEDDING_DTYPE)
+    return _EMBEDDING_HEADER.pack(_EMBEDDING_TAG, values.shape[0]) + values.tobytes()
 
 
 def now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
+def to_epoch(updated_at: Optional[str]) -> Optional[int]:
+    if not updated_at:
+        return None
+    try:
+        ts = datetime.fromisoformat(updated_at)
+    except ValueError:
+        return None
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return int(ts.timestamp())
+
+
 def is_stale(updated_at: Optional[str], max_age_days: Optional[int]) -> bool:
     if not updated_at or max_age_days is None:
         return False
@@ -0,0 +1,305 @@
+import math
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.logging import log_event
+from app.metrics import INDEX_SEGMENTS, observe_stage
+from app.retrieval.base import RetrievalResult
+from app.retrieval.vectors import InMemoryIndex, _normalize, _staleness_weights
+
+# Segment key for rows without a usable updated_at.
+_UNDATED = -(1 << 62)
+
+# Reorder the matrix once a search has to gather more than this fraction of
+# the rows from segments that are no longer (mostly) contiguous.
+_COMPACT_FRACTION = 0.1
+
+
+class TieredIndex(InMemoryIndex):
+    """Resident index partitioned into time segments by ``updated_at``.
+
+    Rows are grouped into ``segment_days``-wide segments. Segments older than
+    ``compact_after_days`` roll over into ``compacted_segment_days``-wide
+    ones, so the segment count stays small as the corpus ages. Each segment
+    tracks its newest row, which bounds the best staleness-weighted score any
+    of its rows can reach (similarity is at most 1). A query scores segments
+    newest first, skips those entirely outside ``max_age_days`` and stops as
+    soon as its current k-th score beats every remaining segment's bound.
+    Results match the exact index.
+
+    Rows are kept ordered by segment (oldest first) so a segment is scored
+    as a slice of the matrix rather than a gathered copy. Appends land in the
+    newest segment at the tail; removals and re-dated rows scatter segments
+    over time, and ``_compact`` restores the order when gathering grows
+    expensive.
+    """
+
+    def __init__(
+        self,
+        segment_days: float = 7.0,
+        compact_after_days: float = 90.0,
+        compacted_segment_days: float = 91.0,
+    ):
+        super().__init__()
+        self.segment_seconds = max(segment_days, 1.0 / 24) * 86400.0
+        self.compact_after_seconds = max(compact_after_days, 0.0) * 86400.0
+        self.coarse_span = max(int(round(compacted_segment_days * 86400.0 / self.segment_seconds)), 1)
+        self._segment = np.zeros(0, dtype=np.int64)
+        self._segments: Dict[int, Set[int]] = {}
+        self._newest: Dict[int, float] = {}
+        self._rows: Dict[int, Tuple[np.ndarray, int, int]] = {}
+        self._fine_from = self._fine_boundary(time.time())
+
+    def build(self, rows: List[Dict]) -> None:
+        with self._lock:
+            super().build(rows)
+            self._compact()
+
+    def search(
+        self,
+        query_embedding: List[float],
+        top_k: int,
+        max_age_days: Optional[int] = None,
+    ) -> List[RetrievalResult]:
+        return self.search_batch([query_embedding], [top_k], [max_age_days])[0]
+
+    def search_batch(
+        self,
+        query_embeddings: List[List[float]],
+        top_ks: List[int],
+        max_age_days: List[Optional[int]],
+    ) -> List[List[RetrievalResult]]:
+        """Score segments newest first for every query still in play.
+
+        Each segment's rows are gathered once and scored against all active
+        queries as one matrix product; a query drops out when the next
+        segment is too old for it or cannot beat its k-th result.
+        """
+        with self._lock:
+            out: List[List[RetrievalResult]] = [[] for _ in query_embeddings]
+            if not self._size:
+                return out
+            active = [
+                i for i, q in enumerate(query_embeddings)
+                if top_ks[i] > 0 and len(q) == self.dim
+            ]
+            if not active:
+                return out
+            now = time.time()
+            self._roll(now)
+            queries = _normalize(np.asarray([query_embeddings[i] for i in active], dtype=np.float32))
+            vectors = dict(zip(active, queries))
+            cutoffs = {
+                i: -math.inf if max_age_days[i] is None else now - max_age_days[i] * 86400.0
+                for i in active
+            }
+
+            # Per query: the best finite (score, similarity, row) so far.
+            empty = (np.zeros(0), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64))
+            best = {i: empty for i in active}
+            order = sorted(self._segments, key=lambda key: self._newest[key], reverse=True)
+            bounds = self._bounds(order, now)
+            counts = {"scanned": 0, "skipped_age": 0, "skipped_bound": 0}
+            gathered = 0
+            score_seconds = sort_seconds = 0.0
+            for key, bound in zip(order, bounds):
+                scan = []
+                for i in active:
+                    top_scores = best[i][0]
+                    if self._newest[key] < cutoffs[i]:
+                        counts["skipped_age"] += 1
+                    elif len(top_scores) >= top_ks[i] and top_scores.min() >= bound:
+                        counts["skipped_bound"] += 1
+                    else:
+                        scan.append(i)
+                if not scan:
+                    continue
+                counts["scanned"] += len(scan)
+                t0 = time.perf_counter()
+                rows, lo, hi = self._segment_rows(key)
+                block = np.stack([vectors[i] for i in scan])
+                if hi - lo == len(rows):
+                    similarities = block @ self.vectors[lo:hi].T
+                elif hi - lo <= 2 * len(rows):
+                    similarities = (block @ self.vectors[lo:hi].T)[:, rows - lo]
+                else:
+                    similarities = block @ self.vectors[rows].T
+                    gathered += len(rows)
+                epochs = self.updated_epochs[rows]
+                scores = similarities * _staleness_weights((now - epochs) / 86400.0)
+                for offset, i in enumerate(scan):
+                    if cutoffs[i] > -math.inf:
+                        scores[offset][epochs < cutoffs[i]] = -np.inf
+                t1 = time.perf_counter()
+                for offset, i in enumerate(scan):
+                    best[i] = _merge_top(best[i], scores[offset], similarities[offset], rows, top_ks[i])
+                score_seconds += t1 - t0
+                sort_seconds += time.perf_counter() - t1
+
+            t0 = time.perf_counter()
+            for i in active:
+                top_scores, top_similarities, top_rows = best[i]
+                out[i], _ = self._top(top_similarities, top_scores, top_ks[i], top_rows)
+            observe_stage("score", score_seconds)
+            observe_stage("sort", sort_seconds + time.perf_counter() - t0)
+            for outcome, count in counts.items():
+                if count:
+                    INDEX_SEGMENTS.labels(outcome).inc(count)
+            if gathered > self._size * _COMPACT_FRACTION:
+                self._compact()
+            return out
+
+    def _bounds(self, order: List[int], now: float) -> np.ndarray:
+        """Best achievable weighted score per segment, from its newest row."""
+        newest = np.array([self._newest[key] for key in order], dtype=np.float64)
+        return _staleness_weights((now - newest) / 86400.0)
+
+    def _roll(self, now: float) -> None:
+        """Merge fine segments that aged past ``compact_after_days`` into
+        their compacted segment."""
+        fine_from = self._fine_boundary(now)
+        if fine_from <= self._fine_from:
+            return
+        t0 = time.perf_counter()
+        self._fine_from = fine_from
+        merged = 0
+        for key in [k for k in self._segments if k != _UNDATED and k < fine_from and k % self.coarse_span]:
+            target = key - key % self.coarse_span
+            rows = self._segments.pop(key)
+            newest = self._newest.pop(key)
+            self._rows.pop(key, None)
+            for row in rows:
+                self._segment[row] = target
+            self._segments.setdefault(target, set()).update(rows)
+            self._newest[target] = max(self._newest.get(target, -math.inf), newest)
+            self._rows.pop(target, None)
+            merged += 1
+        if merged:
+            log_event(
+                "index_rollover",
+                merged=merged,
+                segments=len(self._segments),
+                duration_ms=round((time.perf_counter() - t0) * 1000, 2),
+            )
+
+    def _fine_boundary(self, now: float) -> int:
+        """First fine segment key that is not compacted yet; aligned to a
+        compacted segment so those always cover whole spans."""
+        key = math.floor((now - self.compact_after_seconds) / self.segment_seconds)
+        return key - key % self.coarse_span
+
+    def _key(self, epoch: float) -> int:
+        if math.isnan(epoch):
+            return _UNDATED
+        key = math.floor(epoch / self.segment_seconds)
+        if key < self._fine_from:
+            key -= key % self.coarse_span
+        return key
+
+    def _segment_rows(self, key: int) -> Tuple[np.ndarray, int, int]:
+        """Sorted rows of a segment and the [lo, hi) range they span."""
+        cached = self._rows.get(key)
+        if cached is None:
+            rows = np.fromiter(self._segments[key], dtype=np.int64, count=len(self._segments[key]))
+            rows.sort()
+            cached = self._rows[key] = (rows, int(rows[0]), int(rows[-1]) + 1)
+        return cached
+
+    def _compact(self) -> None:
+        """Reorder rows so every segment is one contiguous slice, oldest
+        first."""
+        t0 = time.perf_counter()
+        keys = sorted(self._segments)
+        size = self._size
+        if not keys:
+            return
+        order = np.concatenate([self._segment_rows(key)[0] for key in keys])
+        self._preserve(0, size)
+        self.vectors[:size] = self.vectors[order]
+        self.updated_epochs[:size] = self.updated_epochs[order]
+        self._segment[:size] = self._segment[order]
+        self.metadata = [self.metadata[row] for row in order.tolist()]
+        self._row_by_id = {meta["chunk_id"]: row for row, meta in enumerate(self.metadata)}
+        start = 0
+        for key in keys:
+            stop = start + len(self._segments[key])
+            self._segments[key] = set(range(start, stop))
+            self._rows[key] = (np.arange(start, stop, dtype=np.int64), start, stop)
+            start = stop
+        log_event(
+            "index_compact",
+            segments=len(keys),
+            total=size,
+            duration_ms=round((time.perf_counter() - t0) * 1000, 2),
+        )
+
+    def _reserve(self, capacity: int) -> None:
+        super()._reserve(capacity)
+        if self._segment.shape[0] < self.vectors.shape[0]:
+            segment = np.zeros(self.vectors.shape[0], dtype=np.int64)
+            segment[: self._size] = self._segment[: self._size]
+            self._segment = segment
+
+    def _reindex(self) -> None:
+        self._segment = np.zeros(self.vectors.shape[0], dtype=np.int64)
+        self._segments = {}
+        self._newest = {}
+        self._rows = {}
+        for row in range(self._size):
+            self._on_set(row)
+        self._compact()
+
+    def _on_set(self, row: int) -> None:
+        epoch = float(self.updated_epochs[row])
+        key = self._key(epoch)
+        self._segment[row] = key
+        self._segments.setdefault(key, set()).add(row)
+        # Undated rows sort first, weigh 1.0 and are never too old.
+        newest = math.inf if key == _UNDATED else epoch
+        self._newest[key] = max(self._newest.get(key, -math.inf), newest)
+        self._rows.pop(key, None)
+
+    def _on_remove(self, row: int) -> None:
+        key = int(self._segment[row])
+        rows = self._segments.get(key)
+        if rows is None:
+            return
+        rows.discard(row)
+        self._rows.pop(key, None)
+        if not rows:
+            del self._segments[key]
+            del self._newest[key]
+
+    def _on_move(self, src: int, dst: int) -> None:
+        key = int(self._segment[src])
+        self._segment[dst] = key
+        rows = self._segments.setdefault(key, set())
+        rows.discard(src)
+        rows.add(dst)
+        self._rows.pop(key, None)
+
+
+def _merge_top(
+    best: Tuple[np.ndarray, np.ndarray, np.ndarray],
+    scores: np.ndarray,
+    similarities: np.ndarray,
+    rows: np.ndarray,
+    top_k: int,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Fold one segment's finite top-k candidates into the running top-k."""
+    if len(scores) > top_k:
+        pick = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        pick = np.arange(len(scores))
+    pick = pick[np.isfinite(scores[pick])]
+    if not len(pick):
+        return best
+    merged_scores = np.concatenate((best[0], scores[pick]))
+    merged_similarities = np.concatenate((best[1], similarities[pick]))
+    merged_rows = np.concatenate((best[2], rows[pick]))
+    if len(merged_scores) > top_k:
+        keep = np.argpartition(-merged_scores, top_k - 1)[:top_k]
+        return merged_scores[keep], merged_similarities[keep], merged_rows[keep]
+    return merged_scores, merged_similarities, merged_rows
@@ -0,0 +1,637 @@
+import math
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Dict, Iterator, Optional, Set, Tuple
+
+import numpy as np
+
+from app.logging import log_event
+from app.metrics import stage
+from app.config import settings
+from app.retrieval.base import RetrievalResult
+from app.retrieval import snapshot, store
+
+
+# Upper bound on query x row cells scored at once by ``search_batch``
+# (64 MiB of float32 scores).
+_BATCH_SCORE_CELLS = 1 << 24
+# Rows copied per lock hold while a snapshot is written (16 MiB at 256 dims).
+_SNAPSHOT_BLOCK_ROWS = 16384
+
+
+class InMemoryIndex:
+    """Resident vector index over the chunks table.
+
+    Embeddings are kept L2-normalised in one contiguous float32 matrix with
+    parallel metadata arrays, so a query is a single matrix-vector product.
+    The index is loaded from SQLite once and then kept current by
+    ``ingest_document`` through ``upsert``/``remove``. ``version`` counts
+    those mutations so callers can tell when cached results went stale.
+
+    Every uvicorn worker holds its own copy, so ``current_version`` also
+    catches up with chunks other processes wrote (``sync``), polling the
+    chunk_changes log at most every ``sync_interval_seconds``.
+
+    With ``snapshot_dir`` set, ``save_snapshot`` writes the resident rows to
+    disk and ``ensure_loaded`` starts from the latest snapshot taken from the
+    same database, syncing only chunks changed since then instead of
+    decoding the whole table.
+    """
+
+    def __init__(self):
+        self.dim: Optional[int] = None
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.updated_epochs = np.zeros(0, dtype=np.float64)
+        self.metadata: List[Dict] = []
+        self.loaded = False
+        self.version = 0
+        self.snapshot_dir: Optional[Path] = None
+        self.sync_interval_seconds = 1.0
+        self._db_path: Optional[str] = None
+        self._change_seq = 0
+        self._synced_at = 0.0
+        self._sync_lock = threading.Lock()
+        # While a snapshot is copied: the first row not copied yet, the row
+        # count it covers, and pre-write copies of rows changed ahead of it.
+        self._snapshot_cursor: Optional[int] = None
+        self._snapshot_size = 0
+        self._snapshot_saved: Dict[int, Tuple[np.ndarray, float, Dict]] = {}
+        self._row_by_id: Dict[str, int] = {}
+        self._size = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def ensure_loaded(self, db_path: str) -> None:
+        if self.loaded:
+            return
+        with self._lock:
+            if self.loaded:
+                return
+            t0 = time.perf_counter()
+            # Read first: anything committed while loading is synced again.
+            change_seq = store.last_chunk_change(db_path)
+            loaded = self._load_snapshot(db_path)
+            if loaded is None:
+                self.build(store.list_chunks(db_path))
+                loaded = {"source": "sqlite"}
+            else:
+                change_seq = loaded.pop("change_seq")
+            self._db_path = db_path
+            self._change_seq = change_seq
+            if loaded["source"] == "snapshot":
+                loaded.update(self.sync() or {})
+            self._synced_at = time.monotonic()
+            log_event(
+                "index_load",
+                total=self._size,
+                duration_ms=round((time.perf_counter() - t0) * 1000, 2),
+                **loaded,
+            )
+
+    def save_snapshot(self) -> Optional[int]:
+        """Write the resident rows to ``snapshot_dir`` as a new generation.
+
+        Rows are streamed to the writer in blocks of ``_SNAPSHOT_BLOCK_ROWS``,
+        holding the lock only while a block is copied. Rows changed ahead of
+        the copy are saved first (``_preserve``), so the snapshot is the index
+        as it was when the save began, recorded with the database it came
+        from and the chunk_changes position it reflects. Returns the
+        generation, or None when snapshots are off or nothing was loaded
+        from a database.
+        """
+        if self.snapshot_dir is None or not self.loaded or self._db_path is None:
+            return None
+        t0 = time.perf_counter()
+        with snapshot.lock(self.snapshot_dir):
+            with self._lock:
+                size = self._size
+                dim = self.dim
+                version = self.version
+                change_seq = self._change_seq
+                self._snapshot_cursor = 0
+                self._snapshot_size = size
+            metadata: List[Dict] = []
+            previous = snapshot.current_generation(self.snapshot_dir)
+            generation = (previous or 0) + 1
+            try:
+                snapshot.write_snapshot(
+                    self.snapshot_dir,
+                    generation,
+                    dim,
+                    size,
+                    self._snapshot_blocks(size, metadata),
+                    metadata,
+                    index_version=version,
+                    **snapshot_identity(self._db_path, change_seq),
+                )
+            finally:
+                with self._lock:
+                    self._snapshot_cursor = None
+                    self._snapshot_saved = {}
+            snapshot.publish(self.snapshot_dir, generation)
+            if previous is not None:
+                snapshot.remove_generation(self.snapshot_dir, previous)
+        log_event(
+            "index_snapshot",
+            generation=generation,
+            total=size,
+            change_seq=change_seq,
+            duration_ms=round((time.perf_counter() - t0) * 1000, 2),
+        )
+        return generation
+
+    def _snapshot_blocks(self, size: int, metadata: List[Dict]) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Copy the first ``size`` rows block by block, as they were when the
+        snapshot began; their metadata is appended to ``metadata``."""
+        for start in range(0, size, _SNAPSHOT_BLOCK_ROWS):
+            stop = min(start + _SNAPSHOT_BLOCK_ROWS, size)
+            with self._lock:
+                # Rows past the current size were removed and saved.
+                live = max(min(stop, self._size), start)
+                vectors = np.empty((stop - start, self.dim), dtype=np.float32)
+                epochs = np.empty(stop - start, dtype=np.float64)
+                vectors[: live - start] = self.vectors[start:live]
+                epochs[: live - start] = self.updated_epochs[start:live]
+                block_metadata = self.metadata[start:live] + [None] * (stop - live)
+                if self._snapshot_saved:
+                    for row in range(start, stop):
+                        saved = self._snapshot_saved.pop(row, None)
+                        if saved is not None:
+                            vectors[row - start], epochs[row - start], block_metadata[row - start] = saved
+                self._snapshot_cursor = stop
+            metadata.extend(block_metadata)
+            yield vectors, epochs
+
+    def _preserve(self, start: int, stop: Optional[int] = None) -> None:
+        """Save rows [start, stop) before they are overwritten if a running
+        snapshot has not copied them yet; caller holds the lock."""
+        if self._snapshot_cursor is None:
+            return
+        stop = start + 1 if stop is None else stop
+        for row in range(max(start, self._snapshot_cursor), min(stop, self._snapshot_size)):
+            if row not in self._snapshot_saved:
+                self._snapshot_saved[row] = (
+                    self.vectors[row].copy(),
+                    float(self.updated_epochs[row]),
+                    self.metadata[row],
+                )
+
+    def build(self, rows: List[Dict]) -> None:
+        """Populate the index from store rows and start accepting updates."""
+        with self._lock:
+            self._upsert_rows(rows)
+            self.loaded = True
+
+    def _load_snapshot(self, db_path: str) -> Optional[Dict]:
+        """Load the latest snapshot if it was taken from ``db_path``.
+
+        The snapshot must name the same database file, and the chunk_changes
+        entry it was taken at must still hold the chunk_id it recorded (or be
+        pruned); otherwise it is ignored and the index is rebuilt from
+        SQLite. ``ensure_loaded`` then syncs from that position. Returns
+        fields for the load event plus ``change_seq``, or None when there is
+        no usable snapshot.
+        """
+        if self.snapshot_dir is None:
+            return None
+        generation = snapshot.current_generation(self.snapshot_dir)
+        if generation is None:
+            return None
+        try:
+            vectors, epochs, metadata, info = snapshot.read_snapshot(self.snapshot_dir, generation)
+        except (OSError, ValueError, KeyError) as exc:
+            log_event("index_snapshot_unreadable", generation=generation, error=str(exc))
+            return None
+        mismatch = snapshot_mismatch(info, db_path)
+        if mismatch:
+            log_event("index_snapshot_mismatch", generation=generation, reason=mismatch)
+            return None
+        t0 = time.perf_counter()
+        self.dim = info["dim"]
+        self.vectors = np.array(vectors, dtype=np.float32).reshape(len(metadata), self.dim or 0)
+        self.updated_epochs = np.array(epochs, dtype=np.float64)
+        self.metadata = metadata
+        self._row_by_id = {meta["chunk_id"]: row for row, meta in enumerate(metadata)}
+        self._size = len(metadata)
+        self._reindex()
+        self.loaded = True
+        return {
+            "source": "snapshot",
+            "generation": generation,
+            "snapshot_rows": info["count"],
+            "snapshot_read_ms": round((time.perf_counter() - t0) * 1000, 2),
+            "snapshot_age_seconds": round(time.time() - (store.to_epoch(info["created_at"]) or 0), 1),
+            "change_seq": info["change_seq"],
+        }
+
+    def upsert(self, chunks: List[Dict]) -> None:
+        """Add or replace rows; chunks carry the same keys as store rows."""
+        with self._lock:
+            self.version += 1
+            if not self.loaded:
+                return
+            added = self._upsert_rows(chunks)
+        log_event("index_add", added=added, total=self._size)
+
+    def move(self, chunks: List[Dict]) -> None:
+        """Record new positions for unchanged chunks that shifted in their
+        document."""
+        with self._lock:
+            if chunks:
+                self.version += 1
+            if not self.loaded:
+                return
+            for chunk in chunks:
+                row = self._row_by_id.get(chunk["chunk_id"])
+                if row is not None:
+                    self._preserve(row)
+                    self.metadata[row] = {**self.metadata[row], "chunk_index": chunk["index"]}
+
+    def remove(self, chunk_ids: List[str]) -> None:
+        with self._lock:
+            if chunk_ids:
+                self.version += 1
+            if not self.loaded:
+                return
+            removed = 0
+            for chunk_id in chunk_ids:
+                row = self._row_by_id.pop(chunk_id, None)
+                if row is None:
+                    continue
+                last = self._size - 1
+                self._preserve(row)
+                self._preserve(last)
+                self._on_remove(row)
+                if row != last:
+                    self.vectors[row] = self.vectors[last]
+                    self.updated_epochs[row] = self.updated_epochs[last]
+                    self.metadata[row] = self.metadata[last]
+                    self._row_by_id[self.metadata[row]["chunk_id"]] = row
+                    self._on_move(last, row)
+                self.metadata.pop()
+                self._size = last
+                removed += 1
+        if removed:
+            log_event("index_remove", removed=removed, total=self._size)
+
+    def current_version(self) -> int:
+        """``version`` after picking up changes made outside this index
+        object, i.e. chunks written by other processes."""
+        if self._db_path is not None and time.monotonic() - self._synced_at >= self.sync_interval_seconds:
+            self.sync()
+        return self.version
+
+    def sync(self) -> Optional[Dict]:
+        """Apply chunk writes logged in SQLite since the last sync.
+
+        Rows that already match the table are skipped, so this process's own
+        writes cost an id lookup. A process that fell behind the pruned log
+        compares every chunk id instead. Concurrent callers do not wait.
+        Returns what was applied, or None when there was nothing to check.
+        """
+        if self._db_path is None or not self._sync_lock.acquire(blocking=False):
+            return None
+        try:
+            self._synced_at = time.monotonic()
+            db_path = self._db_path
+            if store.last_chunk_change(db_path) <= self._change_seq:
+                return None
+            t0 = time.perf_counter()
+            changes = store.list_chunk_changes(db_path, self._change_seq)
+            if changes is None:
+                seq = store.last_chunk_change(db_path)
+                versions = store.list_chunk_versions(db_path)
+                with self._lock:
+                    chunk_ids = list(self._indexed_ids().union(versions))
+            else:
+                seq, chunk_ids = changes
+                versions = store.get_chunk_versions(db_path, chunk_ids)
+            applied = self._reconcile(db_path, chunk_ids, versions)
+            self._change_seq = seq
+            applied.update(full=changes is None, checked=len(chunk_ids))
+            if changes is None or applied["replayed"] or applied["removed"] or applied["moved"]:
+                log_event(
+                    "index_sync",
+                    total=self._size,
+                    duration_ms=round((time.perf_counter() - t0) * 1000, 2),
+                    **applied,
+                )
+            return applied
+        finally:
+            self._sync_lock.release()
+
+    def _reconcile(
+        self,
+        db_path: str,
+        chunk_ids: List[str],
+        versions: Dict[str, Tuple[int, Optional[str]]],
+    ) -> Dict[str, int]:
+        """Bring ``chunk_ids`` in line with their (chunk_index, updated_at)
+        in ``versions``; ids missing there were deleted. Only rows whose
+        updated_at differs are read back from SQLite."""
+        removed, stale, moved = [], [], []
+        with self._lock:
+            for chunk_id in chunk_ids:
+                version = versions.get(chunk_id)
+                meta = self._indexed(chunk_id)
+                if version is None:
+                    if meta is not None:
+                        removed.append(chunk_id)
+                elif meta is None or meta["updated_at"] != version[1]:
+                    stale.append(chunk_id)
+                elif meta["chunk_index"] != version[0]:
+                    moved.append({"chunk_id": chunk_id, "index": version[0]})
+        rows = store.get_chunks(db_path, stale) if stale else []
+        self.remove(removed)
+        if rows:
+            self.upsert(rows)
+        self.move(moved)
+        return {"replayed": len(rows), "removed": len(removed), "moved": len(moved)}
+
+    def _indexed(self, chunk_id: str) -> Optional[Dict]:
+        """Metadata of the row holding ``chunk_id``; caller holds the lock."""
+        row = self._row_by_id.get(chunk_id)
+        return None if row is None else self.metadata[row]
+
+    def _indexed_ids(self) -> Set[str]:
+        """Ids of every indexed chunk; caller holds the lock."""
+        return set(self._row_by_id)
+
+    def search(
+        self,
+        query_embedding: List[float],
+        top_k: int,
+        max_age_days: Optional[int] = None,
+    ) -> List[RetrievalResult]:
+        with self._lock:
+            if top_k <= 0 or not self._size or len(query_embedding) != self.dim:
+                return []
+            query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+            results, _ = self._rank(query, top_k, max_age_days)
+            return results
+
+    def search_batch(
+        self,
+        query_embeddings: List[List[float]],
+        top_ks: List[int],
+        max_age_days: List[Optional[int]],
+    ) -> List[List[RetrievalResult]]:
+        """Exact search for many queries, scored as one matrix-matrix product.
+
+        Queries are scored in blocks of at most ``_BATCH_SCORE_CELLS``
+        query-row cells to bound the temporary score matrix; results come
+        back in input order.
+        """
+        with self._lock:
+            return self._search_matrix(
+                self.vectors[: self._size],
+                self.updated_epochs[: self._size],
+                self.metadata,
+                query_embeddings,
+                top_ks,
+                max_age_days,
+            )
+
+    def _search_matrix(
+        self,
+        vectors: np.ndarray,
+        epochs: np.ndarray,
+        metadata: List[Dict],
+        query_embeddings: List[List[float]],
+        top_ks: List[int],
+        max_age_days: List[Optional[int]],
+        excluded: Optional[np.ndarray] = None,
+    ) -> List[List[RetrievalResult]]:
+        """Blocked exact search over ``vectors``; rows flagged in
+        ``excluded`` never match."""
+        out: List[List[RetrievalResult]] = [[] for _ in query_embeddings]
+        if not vectors.shape[0]:
+            return out
+        usable = [
+            i for i, q in enumerate(query_embeddings)
+            if top_ks[i] > 0 and len(q) == self.dim
+        ]
+        if not usable:
+            return out
+        queries = _normalize(np.asarray([query_embeddings[i] for i in usable], dtype=np.float32))
+        now = time.time()
+        weights = _staleness_weights((now - epochs) / 86400.0)
+        too_old: Dict[int, np.ndarray] = {}
+        block = max(_BATCH_SCORE_CELLS // vectors.shape[0], 1)
+        for start in range(0, len(usable), block):
+            with stage("score"):
+                similarities = queries[start:start + block] @ vectors.T
+                scores = similarities * weights
+                if excluded is not None:
+                    scores[:, excluded] = -np.inf
+                for offset in range(similarities.shape[0]):
+                    age = max_age_days[usable[start + offset]]
+                    if age is not None:
+                        if age not in too_old:
+                            too_old[age] = epochs < now - age * 86400.0
+                        scores[offset][too_old[age]] = -np.inf
+            with stage("sort"):
+                for offset in range(similarities.shape[0]):
+                    i = usable[start + offset]
+                    out[i], _ = self._top(similarities[offset], scores[offset], top_ks[i], metadata=metadata)
+        return out
+
+    def _rank(
+        self,
+        query: np.ndarray,
+        top_k: int,
+        max_age_days: Optional[int],
+        rows: Optional[np.ndarray] = None,
+    ) -> Tuple[List[RetrievalResult], int]:
+        """Score ``rows`` (default: all) and return the top-k plus the number
+        of rows that passed the age filter."""
+        with stage("score"):
+            if rows is None:
+                similarities = self.vectors[: self._size] @ query
+                epochs = self.updated_epochs[: self._size]
+            else:
+                similarities = self.vectors[rows] @ query
+                epochs = self.updated_epochs[rows]
+
+            now = time.time()
+            scores = similarities * _staleness_weights((now - epochs) / 86400.0)
+
+            if max_age_days is not None:
+                # NaN epochs (unknown age) compare False and are never filtered.
+                scores[epochs < now - max_age_days * 86400.0] = -np.inf
+        with stage("sort"):
+            return self._top(similarities, scores, top_k, rows)
+
+    def _top(
+        self,
+        similarities: np.ndarray,
+        scores: np.ndarray,
+        top_k: int,
+        rows: Optional[np.ndarray] = None,
+        metadata: Optional[List[Dict]] = None,
+    ) -> Tuple[List[RetrievalResult], int]:
+        """Build results for the ``top_k`` best finite ``scores``; rows are
+        looked up in ``metadata`` (default: the resident rows)."""
+        eligible = int(np.count_nonzero(np.isfinite(scores)))
+        k = min(top_k, eligible)
+        if k == 0:
+            return [], eligible
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+
+        results: List[RetrievalResult] = []
+        for pos in top:
+            meta = (self.metadata if metadata is None else metadata)[pos if rows is None else rows[pos]]
+            results.append(
+                {
+                    "chunk_id": meta["chunk_id"],
+                    "doc_id": meta["doc_id"],
+                    "chunk_index": meta["chunk_index"],
+                    "text": meta["text"],
+                    "similarity": float(similarities[pos]),
+                    "created_at": meta["created_at"],
+                    "last_updated_at": meta["updated_at"],
+                    "score": float(scores[pos]),
+                }
+            )
+        return results, eligible
+
+    def _upsert_rows(self, rows: List[Dict]) -> int:
+        added = 0
+        for row in rows:
+            embedding = row.get("embedding")
+            if isinstance(embedding, (bytes, str)):
+                embedding = store.parse_embedding(embedding)
+            if embedding is None or len(embedding) == 0:
+                continue
+            vector = np.asarray(embedding, dtype=np.float32)
+            if self.dim is None:
+                self.dim = vector.shape[0]
+                self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+            if vector.shape[0] != self.dim:
+                log_event(
+                    "index_dim_mismatch",
+                    chunk_id=row.get("chunk_id"),
+                    expected=self.dim,
+                    actual=vector.shape[0],
+                )
+                continue
+
+            chunk_id = row["chunk_id"]
+            idx = self._row_by_id.get(chunk_id)
+            meta = {
+                "chunk_id": chunk_id,
+                "doc_id": row.get("doc_id"),
+                "chunk_index": row.get("chunk_index", row.get("index")),
+                "text": row.get("text"),
+                "created_at": row.get("created_at"),
+                "updated_at": row.get("updated_at"),
+            }
+            if idx is None:
+                idx = self._size
+                self._reserve(idx + 1)
+                self.metadata.append(meta)
+                self._row_by_id[chunk_id] = idx
+                self._size += 1
+                added += 1
+            else:
+                self._preserve(idx)
+                self._on_remove(idx)
+                self.metadata[idx] = meta
+            self.vectors[idx] = _normalize(vector)
+            epoch = row.get("updated_at_epoch")
+            self.updated_epochs[idx] = _epoch(row.get("updated_at")) if epoch is None else epoch
+            self._on_set(idx)
+        return added
+
+    def _reserve(self, capacity: int) -> None:
+        if capacity <= self.vectors.shape[0]:
+            return
+        new_capacity = max(capacity, 2 * self.vectors.shape[0], 1024)
+        vectors = np.zeros((new_capacity, self.dim), dtype=np.float32)
+        vectors[: self._size] = self.vectors[: self._size]
+        epochs = np.full(new_capacity, np.nan, dtype=np.float64)
+        epochs[: self._size] = self.updated_epochs[: self._size]
+        self.vectors = vectors
+        self.updated_epochs = epochs
+
+    # Hooks for subclasses that keep auxiliary structures per row.
+
+    def _reindex(self) -> None:
+        """Rebuild per-row structures after rows were loaded in bulk."""
+        pass
+
+    def _on_set(self, row: int) -> None:
+        pass
+
+    def _on_remove(self, row: int) -> None:
+        pass
+
+    def _on_move(self, src: int, dst: int) -> None:
+        pass
+
+
+def snapshot_identity(db_path: str, change_seq: int) -> Dict:
+    """Sidecar fields naming the database and chunk_changes position a
+    snapshot was taken at; checked by ``snapshot_mismatch``."""
+    return {
+        "db_path": str(Path(db_path).resolve()),
+        "db_file": _file_id(db_path),
+        "change_seq": change_seq,
+        "change_anchor": store.get_chunk_change(db_path, change_seq),
+    }
+
+
+def snapshot_mismatch(info: Dict, db_path: str) -> Optional[str]:
+    """Why a snapshot cannot have been taken from ``db_path``, if it cannot."""
+    if info.get("db_path") != str(Path(db_path).resolve()):
+        return "db_path"
+    if info.get("db_file") != _file_id(db_path):
+        return "db_file"
+    change_seq = info.get("change_seq")
+    if change_seq is None:
+        return "change_seq"
+    if change_seq > store.last_chunk_change(db_path):
+        return "ahead_of_database"
+    anchor = store.get_chunk_change(db_path, change_seq)
+    if anchor is not None and anchor != info.get("change_anchor"):
+        return "change_log"
+    return None
+
+
+def _file_id(path: str) -> str:
+    """Device and inode of ``path``; a database recreated in place differs."""
+    stat = os.stat(path)
+    return f"{stat.st_dev}:{stat.st_ino}"
+
+
+def _normalize(vector: np.ndarray) -> np.ndarray:
+    """L2-normalise a vector, or each row of a matrix; zero rows are kept."""
+    norm = np.linalg.norm(vector, axis=-1, keepdims=True)
+    return vector / np.where(norm == 0.0, 1.0, norm)
+
+
+def _epoch(updated_at: Optional[str]) -> float:
+    if not updated_at:
+        return math.nan
+    try:
+        ts = datetime.fromisoformat(updated_at)
+    except ValueError:
+        return math.nan
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
+
+
+def _staleness_weights(age_days: np.ndarray) -> np.ndarray:
+    """Exponential decay per row; rows with an unknown age (NaN) weigh 1.0."""
+    half_life = max(settings.staleness_half_life_days, 0.1)
+    weights = np.ones(age_days.shape[0], dtype=np.float64)
+    known = ~np.isnan(age_days)
+    weights[known] = np.exp(-np.maximum(age_days[known], 0.0) / half_life)
+    return weights
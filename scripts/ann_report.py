@@ -0,0 +1,122 @@
+"""Recall@k vs latency of the IVF index against exact search.
+
+Builds a clustered synthetic corpus with spread-out update times, runs the
+same queries through InMemoryIndex and IVFIndex for a grid of nlist/nprobe
+values and prints one row per setting (or JSON with --json).
+
+    python scripts/ann_report.py --chunks 100000 --dim 256
+"""
+import argparse
+import json
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.retrieval.ivf import IVFIndex  # noqa: E402
+from app.retrieval.vectors import InMemoryIndex  # noqa: E402
+
+
+def _corpus(n: int, dim: int, clusters: int, rng: np.random.Generator):
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, n)
+    vectors = centers[labels] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    now = datetime.now(timezone.utc)
+    ages = rng.exponential(90.0, n)
+    rows = [
+        {
+            "chunk_id": f"c{i}",
+            "doc_id": f"d{i // 8}",
+            "text": "",
+            "embedding": vectors[i],
+            "updated_at": (now - timedelta(days=float(ages[i]))).isoformat(),
+        }
+        for i in range(n)
+    ]
+    return rows, centers
+
+
+def _timed(index, queries, top_k, max_age_days):
+    latencies = []
+    ids = []
+    for q in queries:
+        t0 = time.perf_counter()
+        results = index.search(q, top_k, max_age_days)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        ids.append({r["chunk_id"] for r in results})
+    return ids, np.asarray(latencies)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--max-age-days", type=int, default=None)
+    parser.add_argument("--nlist", type=int, nargs="+", default=[0])
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    rows, centers = _corpus(args.chunks, args.dim, args.clusters, rng)
+    picks = rng.integers(0, args.clusters, args.queries)
+    queries = centers[picks] + 0.6 * rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+
+    exact = InMemoryIndex()
+    exact.build(rows)
+    truth, exact_ms = _timed(exact, queries, args.top_k, args.max_age_days)
+    report = [
+        {
+            "backend": "exact",
+            "recall": 1.0,
+            "p50_ms": round(float(np.percentile(exact_ms, 50)), 3),
+            "p99_ms": round(float(np.percentile(exact_ms, 99)), 3),
+        }
+    ]
+
+    for nlist in args.nlist:
+        ivf = IVFIndex(nlist=nlist, train_size=min(10000, args.chunks))
+        t0 = time.perf_counter()
+        ivf.build(rows)
+        build_s = round(time.perf_counter() - t0, 2)
+        for nprobe in args.nprobe:
+            ivf.nprobe = nprobe
+            found, ivf_ms = _timed(ivf, queries, args.top_k, args.max_age_days)
+            hits = sum(len(f & t) for f, t in zip(found, truth))
+            total = sum(len(t) for t in truth) or 1
+            report.append(
+                {
+                    "backend": "ivf",
+                    "nlist": ivf.centroids.shape[0] if ivf.centroids is not None else 0,
+                    "nprobe": nprobe,
+                    "build_s": build_s,
+                    "recall": round(hits / total, 4),
+                    "p50_ms": round(float(np.percentile(ivf_ms, 50)), 3),
+                    "p99_ms": round(float(np.percentile(ivf_ms, 99)), 3),
+                }
+            )
+
+    if args.json:
+        print(json.dumps({"params": vars(args), "results": report}, indent=2))
+        return 0
+
+    print(f"chunks={args.chunks} dim={args.dim} top_k={args.top_k} max_age_days={args.max_age_days}")
+    print(f"{'backend':8} {'nlist':>6} {'nprobe':>6} {'recall@k':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for row in report:
+        print(
+            f"{row['backend']:8} {row.get('nlist', '-'):>6} {row.get('nprobe', '-'):>6} "
+            f"{row['recall']:>9.4f} {row['p50_ms']:>9.3f} {row['p99_ms']:>9.3f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
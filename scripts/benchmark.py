@@ -0,0 +1,256 @@
+"""Offline ingest and retrieval benchmark on synthetic corpora.
+
+Runs entirely locally: embeddings come from the deterministic
+HashingEmbedder and every corpus size gets a fresh SQLite database in a
+temporary directory. For each size it measures ingest_document throughput,
+index load time from SQLite and from a snapshot, StalenessAwareRetriever
+.retrieve latency percentiles, resident memory and database size. Results
+are JSON (--out/--json) tagged with the current commit so two runs can be
+compared with --compare.
+
+    python scripts/benchmark.py --sizes 10000 100000 --out bench.json
+    python scripts/benchmark.py --compare base.json bench.json
+"""
+import argparse
+import json
+import os
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+# Settings are read at import time, so select the offline embedder (without
+# the micro-batcher's wait) before importing the app, and keep the app's
+# index snapshots out of the way; each size snapshots into its own directory.
+os.environ["EMBEDDING_BACKEND"] = "hashing"
+os.environ["EMBEDDING_BATCH_WAIT_MS"] = "0"
+os.environ["INDEX_SNAPSHOT_DIR"] = ""
+os.environ.setdefault("OPENAI_API_KEY", "offline")
+
+from app.config import settings  # noqa: E402
+from app.retrieval import store  # noqa: E402
+from app.retrieval.index import StalenessAwareRetriever, _build_index, ingest_document, shared_embedder  # noqa: E402
+from app.retrieval.query_cache import QueryEmbeddingCache  # noqa: E402
+from app.retrieval.result_cache import RetrievalResultCache  # noqa: E402
+
+# Lower-is-better metrics; everything else reported is higher-is-better.
+_LOWER_IS_BETTER = {
+    "ingest_s", "index_load_s", "snapshot_load_s", "p50_ms", "p95_ms", "p99_ms", "mean_ms",
+    "rss_mb", "index_mb", "db_mb",
+}
+
+
+class _Topics:
+    """Documents and queries drawn from Zipf-weighted topic vocabularies."""
+
+    def __init__(self, rng: np.random.Generator, topics: int = 200, vocab: int = 5000, per_topic: int = 300):
+        letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+        self.words = np.array(["".join(rng.choice(letters, rng.integers(3, 10))) for _ in range(vocab)])
+        self.members = [rng.choice(vocab, per_topic, replace=False) for _ in range(topics)]
+        weights = 1.0 / np.arange(1, per_topic + 1)
+        self.weights = weights / weights.sum()
+        self.rng = rng
+
+    def text(self, topic: int, words: int) -> str:
+        picks = self.rng.choice(self.members[topic], words, p=self.weights)
+        return " ".join(self.words[picks])
+
+
+def _ages_days(rng: np.random.Generator, n: int) -> np.ndarray:
+    """Mostly recent edits, a slower-moving middle and a long stale tail."""
+    kind = rng.choice(3, n, p=[0.6, 0.3, 0.1])
+    return np.where(
+        kind == 0,
+        rng.exponential(14.0, n),
+        np.where(kind == 1, rng.exponential(120.0, n), rng.uniform(365.0, 1500.0, n)),
+    )
+
+
+def _backdate(db_path: str, ages: dict) -> None:
+    now = datetime.now(timezone.utc)
+    rows = []
+    for doc_id, age in ages.items():
+        ts = now - timedelta(days=float(age))
+        rows.append((ts.isoformat(), int(ts.timestamp()), doc_id))
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.executemany("UPDATE chunks SET updated_at = ?, updated_at_epoch = ? WHERE doc_id = ?", rows)
+        conn.executemany(
+            "UPDATE documents SET updated_at = ? WHERE doc_id = ?",
+            [(ts, doc_id) for ts, _, doc_id in rows],
+        )
+    conn.close()
+
+
+def _db_bytes(db_path: str) -> int:
+    return sum(
+        os.path.getsize(p) for p in (db_path, f"{db_path}-wal", f"{db_path}-shm") if os.path.exists(p)
+    )
+
+
+def _rss_mb() -> float:
+    # ru_maxrss is KiB on Linux: the peak, which only grows across sizes.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run_size(chunks: int, args, workdir: Path) -> dict:
+    rng = np.random.default_rng(args.seed)
+    topics = _Topics(rng)
+    db_path = str(workdir / f"bench-{chunks}.db")
+    settings.db_path = db_path
+    store.init_db(db_path)
+
+    # Fixed chunking emits one chunk per 400 chars after the first 500.
+    doc_chars = 400 * (args.chunks_per_doc - 1) + 500
+    docs = max(chunks // args.chunks_per_doc, 1)
+    doc_topics = rng.integers(0, len(topics.members), docs)
+
+    total_chunks = 0
+    t0 = time.perf_counter()
+    for d in range(docs):
+        text = topics.text(int(doc_topics[d]), doc_chars // 7)
+        result = ingest_document(f"doc-{d}", text, source="benchmark")
+        total_chunks += result["total_chunks"]
+    ingest_s = time.perf_counter() - t0
+    _backdate(db_path, {f"doc-{d}": age for d, age in enumerate(_ages_days(rng, docs))})
+
+    index = _build_index()
+    t0 = time.perf_counter()
+    index.ensure_loaded(db_path)
+    index_load_s = time.perf_counter() - t0
+    index.snapshot_dir = workdir / f"snapshot-{chunks}"
+    index.save_snapshot()
+    cold = _build_index()
+    cold.snapshot_dir = index.snapshot_dir
+    t0 = time.perf_counter()
+    cold.ensure_loaded(db_path)
+    snapshot_load_s = time.perf_counter() - t0
+    del cold
+    retriever = StalenessAwareRetriever(
+        index=index,
+        embedder=shared_embedder,
+        cache=QueryEmbeddingCache(0, 0.0),
+        results=RetrievalResultCache(0, 60.0),
+    )
+
+    queries = [topics.text(int(t), int(rng.integers(3, 8))) for t in rng.integers(0, len(topics.members), args.queries)]
+    for query in queries[: min(10, len(queries))]:
+        retriever.retrieve(query, top_k=args.top_k)
+    latencies = []
+    for i, query in enumerate(queries):
+        max_age_days = settings.staleness_max_age_days if i % 2 else None
+        t0 = time.perf_counter()
+        retriever.retrieve(query, top_k=args.top_k, max_age_days=max_age_days)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    latencies = np.asarray(latencies)
+
+    return {
+        "chunks": total_chunks,
+        "documents": docs,
+        "ingest_s": round(ingest_s, 3),
+        "ingest_chunks_per_s": round(total_chunks / ingest_s, 1),
+        "ingest_docs_per_s": round(docs / ingest_s, 1),
+        "index_load_s": round(index_load_s, 3),
+        "snapshot_load_s": round(snapshot_load_s, 3),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "mean_ms": round(float(latencies.mean()), 3),
+        "rss_mb": round(_rss_mb(), 1),
+        "index_mb": round((index.vectors.nbytes + index.updated_epochs.nbytes) / 2**20, 1),
+        "db_mb": round(_db_bytes(db_path) / 2**20, 1),
+    }
+
+
+def _commit() -> str | None:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def _compare(base_path: str, new_path: str) -> int:
+    base = json.loads(Path(base_path).read_text())
+    new = json.loads(Path(new_path).read_text())
+    base_by_size = {row["chunks"]: row for row in base["results"]}
+    print(f"{base.get('commit')} -> {new.get('commit')}")
+    for row in new["results"]:
+        old = base_by_size.get(row["chunks"])
+        if old is None:
+            continue
+        print(f"chunks={row['chunks']}")
+        for key, value in row.items():
+            if key in ("chunks", "documents") or not old.get(key):
+                continue
+            change = (value - old[key]) / old[key] * 100
+            better = change < 0 if key in _LOWER_IS_BETTER else change > 0
+            mark = "" if abs(change) < 5 else (" better" if better else " WORSE")
+            print(f"  {key:22} {old[key]:>12} {value:>12} {change:>+8.1f}%{mark}")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000])
+    parser.add_argument("--chunks-per-doc", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the JSON report to this file")
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="diff two JSON reports")
+    args = parser.parse_args()
+
+    if args.compare:
+        return _compare(*args.compare)
+
+    with tempfile.TemporaryDirectory(prefix="chronicle-bench-") as tmp:
+        results = [_run_size(size, args, Path(tmp)) for size in args.sizes]
+
+    params = {k: v for k, v in vars(args).items() if k not in ("out", "json", "compare")}
+    params.update(
+        embedder=shared_embedder.model,
+        chunking_strategy=settings.chunking_strategy,
+        retrieval_backend=settings.retrieval_backend,
+    )
+    report = {
+        "commit": _commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "params": params,
+        "results": results,
+    }
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2) + "\n")
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+
+    print(f"commit={report['commit']} embedder={params['embedder']} top_k={args.top_k}")
+    print(
+        f"{'chunks':>9} {'chunks/s':>9} {'load s':>7} {'p50 ms':>8} {'p99 ms':>8} "
+        f"{'rss MB':>8} {'index MB':>9} {'db MB':>7}"
+    )
+    for row in results:
+        print(
+            f"{row['chunks']:>9} {row['ingest_chunks_per_s']:>9.0f} {row['index_load_s']:>7.2f} "
+            f"{row['p50_ms']:>8.3f} {row['p99_ms']:>8.3f} {row['rss_mb']:>8.1f} "
+            f"{row['index_mb']:>9.1f} {row['db_mb']:>7.1f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
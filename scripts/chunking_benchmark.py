@@ -0,0 +1,132 @@
+"""Re-embed counts for fixed vs content-defined chunking on edit traces.
+
+Each trace edits a synthetic document the way people edit runbooks and
+notes. For every edit we count the chunks ingest_document would re-embed
+(chunk_id is new or its chunk_hash changed) and, separately, how many of
+those are also new to the embedding cache (chunk_hash never seen before).
+
+    python scripts/chunking_benchmark.py --paragraphs 80
+"""
+import argparse
+import json
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.retrieval.chunking import add_chunk_hashes, chunk_text, chunk_text_cdc  # noqa: E402
+
+_WORDS = (
+    "service deploy rollback cluster node latency queue worker cache index "
+    "request response timeout retry alert owner runbook incident database "
+    "replica shard config version release metric dashboard threshold error"
+).split()
+
+CHUNKERS = {
+    "fixed": lambda text: chunk_text(text, "doc"),
+    "cdc": lambda text: chunk_text_cdc(text, "doc"),
+    "cdc+snap": lambda text: chunk_text_cdc(text, "doc", snap_window=120),
+}
+
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(_WORDS) for _ in range(rng.randint(8, 20))]
+    return " ".join(words).capitalize() + "."
+
+
+def _paragraph(rng: random.Random) -> str:
+    return " ".join(_sentence(rng) for _ in range(rng.randint(3, 7)))
+
+
+def _edit(paragraphs: list, kind: str, rng: random.Random) -> list:
+    paragraphs = list(paragraphs)
+    at = rng.randrange(len(paragraphs))
+    if kind == "insert_sentence_top":
+        paragraphs[0] = _sentence(rng) + " " + paragraphs[0]
+    elif kind == "typo_fix":
+        words = paragraphs[at].split(" ")
+        words[rng.randrange(len(words))] = rng.choice(_WORDS)
+        paragraphs[at] = " ".join(words)
+    elif kind == "delete_paragraph":
+        del paragraphs[at]
+    elif kind == "insert_paragraph":
+        paragraphs.insert(at, _paragraph(rng))
+    elif kind == "append_paragraph":
+        paragraphs.append(_paragraph(rng))
+    elif kind == "move_paragraph":
+        paragraphs.insert(rng.randrange(len(paragraphs)), paragraphs.pop(at))
+    return paragraphs
+
+
+def _reembeds(prev: list, new: list, seen_hashes: set) -> tuple:
+    prev_by_id = {c["chunk_id"]: c["chunk_hash"] for c in prev}
+    changed = [c for c in new if prev_by_id.get(c["chunk_id"]) != c["chunk_hash"]]
+    uncached = {c["chunk_hash"] for c in changed} - seen_hashes
+    return len(changed), len(uncached)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--paragraphs", type=int, default=80)
+    parser.add_argument("--session-edits", type=int, default=25)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    kinds = [
+        "insert_sentence_top",
+        "typo_fix",
+        "delete_paragraph",
+        "insert_paragraph",
+        "append_paragraph",
+        "move_paragraph",
+    ]
+    base_rng = random.Random(args.seed)
+    base = [_paragraph(base_rng) for _ in range(args.paragraphs)]
+    traces = {kind: [kind] for kind in kinds}
+    session_rng = random.Random(args.seed + 1)
+    traces["mixed_session"] = [session_rng.choice(kinds) for _ in range(args.session_edits)]
+
+    report = []
+    for trace, edits in traces.items():
+        for name, chunker in CHUNKERS.items():
+            rng = random.Random(f"{args.seed}-{trace}")
+            paragraphs = base
+            prev = add_chunk_hashes(chunker("\n\n".join(paragraphs)))
+            seen = {c["chunk_hash"] for c in prev}
+            reembedded = uncached = 0
+            for kind in edits:
+                paragraphs = _edit(paragraphs, kind, rng)
+                new = add_chunk_hashes(chunker("\n\n".join(paragraphs)))
+                changed, fresh = _reembeds(prev, new, seen)
+                reembedded += changed
+                uncached += fresh
+                seen.update(c["chunk_hash"] for c in new)
+                prev = new
+            report.append(
+                {
+                    "trace": trace,
+                    "chunker": name,
+                    "edits": len(edits),
+                    "chunks": len(prev),
+                    "reembedded": reembedded,
+                    "uncached": uncached,
+                }
+            )
+
+    if args.json:
+        print(json.dumps({"params": vars(args), "results": report}, indent=2))
+        return 0
+
+    print(f"{'trace':20} {'chunker':9} {'edits':>5} {'chunks':>6} {'re-embedded':>11} {'uncached':>8}")
+    for row in report:
+        print(
+            f"{row['trace']:20} {row['chunker']:9} {row['edits']:>5} {row['chunks']:>6} "
+            f"{row['reembedded']:>11} {row['uncached']:>8}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,363 @@
+"""Concurrent HTTP load generator for mixed read/write traffic.
+
+Drives a weighted mix of /prompt, /retrieve, /ingest and /upload using the
+request helpers from test_mvp.py, either closed-loop (--concurrency workers
+back to back) or open-loop at a target --rate. An open-loop request's latency
+runs from its scheduled send time, so queueing inside the generator is
+counted rather than hidden. Each phase reports throughput, error rate and
+p50/p95/p99/max latency per endpoint. The default "read" then "mixed"
+phases show how ingest traffic inflates read latency, and queued ingest
+jobs are followed through /jobs/{id} to report their queue and run time.
+
+With --start-server the script launches scripts/openai_stub.py and the app
+(uvicorn, --server-workers processes) against a temporary database, so no
+OpenAI key is needed:
+
+    python scripts/load_test.py --start-server --concurrency 32 --duration 30
+    python scripts/load_test.py --rate 50 --mix retrieve=8,prompt=1,ingest=1
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib import error
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import test_mvp  # noqa: E402
+from test_mvp import _get, _post, _post_multipart  # noqa: E402
+
+READ_ENDPOINTS = ("/prompt", "/retrieve")
+_WORDS = (
+    "service deploy rollback cluster node latency queue worker cache index "
+    "request response timeout retry alert owner runbook incident database "
+    "replica shard config version release metric dashboard threshold error"
+).split()
+
+
+def _parse_mix(spec: str) -> dict:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        mix[f"/{name.strip().lstrip('/')}"] = float(weight or 1)
+    unknown = set(mix) - {"/prompt", "/retrieve", "/ingest", "/upload"}
+    if unknown:
+        raise SystemExit(f"unknown endpoints in --mix: {', '.join(sorted(unknown))}")
+    return mix
+
+
+class _Workload:
+    def __init__(self, args):
+        self.args = args
+        self.jobs = []
+        self._jobs_lock = threading.Lock()
+
+    def text(self, rng: random.Random, words: int) -> str:
+        return " ".join(rng.choice(_WORDS) for _ in range(words))
+
+    def send(self, endpoint: str, rng: random.Random) -> None:
+        timeout = self.args.timeout
+        if endpoint == "/retrieve":
+            _post("/retrieve", {"query": self.text(rng, 4), "top_k": 5}, timeout=timeout)
+        elif endpoint == "/prompt":
+            _post("/prompt", {"prompt": self.text(rng, 8)}, timeout=timeout)
+        elif endpoint == "/ingest":
+            job = _post(
+                "/ingest",
+                {
+                    "doc_id": f"load-{rng.randrange(self.args.doc_pool)}",
+                    "text": self.text(rng, self.args.doc_words),
+                    "source": "load-test",
+                },
+                timeout=timeout,
+            )
+            self._track(job)
+        elif endpoint == "/upload":
+            job = _post_multipart(
+                "/upload",
+                {"doc_id": f"load-upload-{rng.randrange(self.args.doc_pool)}", "source": "load-test"},
+                "file",
+                "load.txt",
+                self.text(rng, self.args.doc_words).encode("utf-8"),
+                timeout=timeout,
+            )
+            self._track(job)
+
+    def _track(self, job: dict) -> None:
+        if job.get("job_id"):
+            with self._jobs_lock:
+                self.jobs.append(job["job_id"])
+
+    def take_jobs(self) -> list:
+        with self._jobs_lock:
+            jobs, self.jobs = self.jobs, []
+        return jobs
+
+
+def _run_phase(workload: _Workload, mix: dict, args, seed: int) -> list:
+    """Run one phase and return (endpoint, latency_ms, error) samples."""
+    endpoints = list(mix)
+    weights = [mix[e] for e in endpoints]
+    samples = []
+    samples_lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+
+    def one(rng: random.Random, scheduled: float) -> None:
+        endpoint = rng.choices(endpoints, weights)[0]
+        err = None
+        try:
+            workload.send(endpoint, rng)
+        except error.HTTPError as exc:
+            err = f"http {exc.code}"
+        except (error.URLError, OSError, ValueError) as exc:
+            err = type(exc).__name__
+        latency_ms = (time.perf_counter() - scheduled) * 1000
+        with samples_lock:
+            samples.append((endpoint, latency_ms, err))
+
+    if args.rate > 0:
+        rng = random.Random(seed)
+        interval = 1.0 / args.rate
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            start = time.perf_counter()
+            k = 0
+            while True:
+                scheduled = start + k * interval
+                if scheduled >= deadline:
+                    break
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(one, random.Random(rng.random()), scheduled)
+                k += 1
+    else:
+        def loop(worker: int) -> None:
+            rng = random.Random(seed * 1000 + worker)
+            while time.perf_counter() < deadline:
+                one(rng, time.perf_counter())
+
+        threads = [threading.Thread(target=loop, args=(w,)) for w in range(args.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return samples
+
+
+def _summarise(samples: list, duration: float) -> dict:
+    by_endpoint = {}
+    for endpoint, latency_ms, err in samples:
+        by_endpoint.setdefault(endpoint, []).append((latency_ms, err))
+    summary = {}
+    for endpoint, rows in sorted(by_endpoint.items()):
+        ok = np.asarray([lat for lat, err in rows if err is None])
+        errors = [err for _, err in rows if err is not None]
+        stats = {
+            "requests": len(rows),
+            "throughput_rps": round(len(rows) / duration, 2),
+            "error_rate": round(len(errors) / len(rows), 4),
+        }
+        if len(ok):
+            stats.update(
+                p50_ms=round(float(np.percentile(ok, 50)), 2),
+                p95_ms=round(float(np.percentile(ok, 95)), 2),
+                p99_ms=round(float(np.percentile(ok, 99)), 2),
+                max_ms=round(float(ok.max()), 2),
+            )
+        if errors:
+            stats["errors"] = {e: errors.count(e) for e in set(errors)}
+        summary[endpoint] = stats
+    return summary
+
+
+def _drain_jobs(job_ids: list, args) -> dict | None:
+    """Wait for ingest jobs to finish and summarise their queue/run times."""
+    if not job_ids:
+        return None
+    deadline = time.time() + args.drain_timeout
+    pending = list(job_ids)
+    finished = []
+    while pending and time.time() < deadline:
+        still = []
+        for job_id in pending:
+            try:
+                job = _get(f"/jobs/{job_id}", timeout=args.timeout)
+            except (error.URLError, OSError):
+                still.append(job_id)
+                continue
+            if job["status"] in ("queued", "running"):
+                still.append(job_id)
+            else:
+                finished.append(job)
+        pending = still
+        if pending:
+            time.sleep(0.5)
+
+    def pct(values, q):
+        return round(float(np.percentile(values, q)), 2) if values else None
+
+    queue_ms = [j["queue_ms"] for j in finished if j.get("queue_ms") is not None]
+    run_ms = [j["run_ms"] for j in finished if j.get("run_ms") is not None]
+    statuses = [j["status"] for j in finished]
+    return {
+        "submitted": len(job_ids),
+        "unfinished": len(pending),
+        "statuses": {s: statuses.count(s) for s in set(statuses)},
+        "queue_p50_ms": pct(queue_ms, 50),
+        "queue_p99_ms": pct(queue_ms, 99),
+        "run_p50_ms": pct(run_ms, 50),
+        "run_p99_ms": pct(run_ms, 99),
+    }
+
+
+def _start_servers(args, workdir: Path) -> list:
+    stub = subprocess.Popen(
+        [
+            sys.executable, str(ROOT / "scripts" / "openai_stub.py"),
+            "--port", str(args.stub_port),
+            "--embedding-latency-ms", str(args.stub_embedding_latency_ms),
+            "--chat-latency-ms", str(args.stub_chat_latency_ms),
+        ],
+        stdout=subprocess.DEVNULL,
+    )
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "stub",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{args.stub_port}/v1",
+        "DB_PATH": str(workdir / "load.db"),
+        "LOG_FILE": str(workdir / "load.log"),
+        "INGEST_SPOOL_DIR": str(workdir / "spool"),
+        "INDEX_SNAPSHOT_DIR": str(workdir / "index_snapshot"),
+        "SHARED_INDEX_DIR": str(workdir / "index"),
+        # Client-side quotas would throttle the generator, not the app.
+        "EMBEDDING_REQUESTS_PER_MINUTE": "100000000",
+        "EMBEDDING_TOKENS_PER_MINUTE": "100000000000",
+        "LLM_REQUESTS_PER_MINUTE": "100000000",
+        "LLM_TOKENS_PER_MINUTE": "100000000000",
+    }
+    app = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--port", str(args.app_port),
+            "--workers", str(args.server_workers),
+            "--log-level", "warning",
+        ],
+        cwd=ROOT,
+        env=env,
+    )
+    test_mvp.BASE_URL = f"http://127.0.0.1:{args.app_port}"
+    deadline = time.time() + 30
+    while True:
+        try:
+            _get("/limits", timeout=1)
+            return [app, stub]
+        except (error.URLError, OSError):
+            if time.time() > deadline:
+                for proc in (app, stub):
+                    proc.terminate()
+                raise SystemExit("app did not start within 30s")
+            time.sleep(0.2)
+
+
+def _seed(workload: _Workload, args) -> None:
+    rng = random.Random(args.seed)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda _: workload.send("/ingest", random.Random(rng.random())), range(args.seed_docs)))
+    _drain_jobs(workload.take_jobs(), args)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mix", default="retrieve=6,prompt=2,ingest=1,upload=1")
+    parser.add_argument("--phases", default="read,mixed", help="comma list of read (no writes) and mixed")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per phase")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rate", type=float, default=0.0, help="open-loop requests/s; 0 = closed loop")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--doc-pool", type=int, default=200, help="distinct doc_ids written")
+    parser.add_argument("--doc-words", type=int, default=600)
+    parser.add_argument("--seed-docs", type=int, default=100)
+    parser.add_argument("--drain-timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--start-server", action="store_true")
+    parser.add_argument("--server-workers", type=int, default=1)
+    parser.add_argument("--app-port", type=int, default=8300)
+    parser.add_argument("--stub-port", type=int, default=8100)
+    parser.add_argument("--stub-embedding-latency-ms", type=float, default=50.0)
+    parser.add_argument("--stub-chat-latency-ms", type=float, default=800.0)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    mix = _parse_mix(args.mix)
+    procs = []
+    with tempfile.TemporaryDirectory(prefix="chronicle-load-") as tmp:
+        try:
+            if args.start_server:
+                procs = _start_servers(args, Path(tmp))
+            workload = _Workload(args)
+            _seed(workload, args)
+
+            report = {"base_url": test_mvp.BASE_URL, "params": vars(args), "phases": {}}
+            for n, phase in enumerate(p.strip() for p in args.phases.split(",")):
+                phase_mix = mix if phase == "mixed" else {e: w for e, w in mix.items() if e in READ_ENDPOINTS}
+                samples = _run_phase(workload, phase_mix, args, seed=args.seed + n)
+                report["phases"][phase] = {
+                    "endpoints": _summarise(samples, args.duration),
+                    "ingest_jobs": _drain_jobs(workload.take_jobs(), args),
+                }
+        finally:
+            for proc in procs:
+                proc.terminate()
+                proc.wait(timeout=10)
+
+    phases = report["phases"]
+    if "read" in phases and "mixed" in phases:
+        report["read_write_contention"] = {
+            endpoint: {
+                "p50_ratio": round(mixed["p50_ms"] / read["p50_ms"], 3),
+                "p99_ratio": round(mixed["p99_ms"] / read["p99_ms"], 3),
+            }
+            for endpoint in READ_ENDPOINTS
+            if (read := phases["read"]["endpoints"].get(endpoint, {})).get("p50_ms")
+            and (mixed := phases["mixed"]["endpoints"].get(endpoint, {})).get("p50_ms")
+        }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+
+    mode = f"rate={args.rate}/s" if args.rate > 0 else f"concurrency={args.concurrency}"
+    print(f"{report['base_url']} {mode} duration={args.duration}s per phase")
+    for phase, result in phases.items():
+        print(f"\n[{phase}]")
+        print(f"{'endpoint':10} {'req':>6} {'rps':>8} {'err%':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+        for endpoint, s in result["endpoints"].items():
+            print(
+                f"{endpoint:10} {s['requests']:>6} {s['throughput_rps']:>8.1f} {s['error_rate'] * 100:>6.1f} "
+                f"{s.get('p50_ms', float('nan')):>9.1f} {s.get('p95_ms', float('nan')):>9.1f} "
+                f"{s.get('p99_ms', float('nan')):>9.1f} {s.get('max_ms', float('nan')):>9.1f}"
+            )
+        jobs = result["ingest_jobs"]
+        if jobs:
+            print(
+                f"ingest jobs: {jobs['submitted']} submitted, {jobs['unfinished']} unfinished, "
+                f"queue p50/p99 {jobs['queue_p50_ms']}/{jobs['queue_p99_ms']} ms, "
+                f"run p50/p99 {jobs['run_p50_ms']}/{jobs['run_p99_ms']} ms"
+            )
+    for endpoint, ratio in report.get("read_write_contention", {}).items():
+        print(f"\n{endpoint} under writes: p50 x{ratio['p50_ratio']}, p99 x{ratio['p99_ratio']}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
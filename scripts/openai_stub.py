@@ -0,0 +1,150 @@
+"""Local stand-in for the OpenAI embeddings and chat completions APIs.
+
+Answers POST /v1/embeddings with deterministic HashingEmbedder vectors and
+POST /v1/chat/completions (plain or stream=true) with a canned answer,
+after a configurable latency, so the app can be load-tested without keys
+or network. Point the app at it with OPENAI_BASE_URL.
+
+    python scripts/openai_stub.py --port 8100 --chat-latency-ms 800
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1 uvicorn app.main:app
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.retrieval.hashing_embedder import HashingEmbedder  # noqa: E402
+
+_ANSWER = "This is a stubbed completion used for load testing. " * 4
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    embedder: HashingEmbedder
+    args: argparse.Namespace
+
+    def log_message(self, format, *args):  # noqa: A002 - signature from BaseHTTPRequestHandler
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if self.path.endswith("/embeddings"):
+            self._embeddings(body)
+        elif self.path.endswith("/chat/completions"):
+            self._chat(body)
+        else:
+            self._json(404, {"error": {"message": f"unknown path {self.path}"}})
+
+    def _embeddings(self, body: dict):
+        texts = body.get("input", [])
+        if isinstance(texts, str):
+            texts = [texts]
+        self._sleep(self.args.embedding_latency_ms)
+        vectors = self.embedder.embed(texts)
+        self._json(
+            200,
+            {
+                "object": "list",
+                "model": body.get("model", "stub"),
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": v.tolist()}
+                    for i, v in enumerate(vectors)
+                ],
+                "usage": {"prompt_tokens": 0, "total_tokens": 0},
+            },
+        )
+
+    def _chat(self, body: dict):
+        model = body.get("model", "stub")
+        created = int(time.time())
+        if not body.get("stream"):
+            self._sleep(self.args.chat_latency_ms)
+            self._json(
+                200,
+                {
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": _ANSWER},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                },
+            )
+            return
+
+        self._sleep(self.args.ttft_ms)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        words = _ANSWER.split(" ")
+        per_token = max(self.args.chat_latency_ms - self.args.ttft_ms, 0) / len(words)
+        for i, word in enumerate(words):
+            chunk = {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            if i:
+                time.sleep(per_token / 1000)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+    def _sleep(self, latency_ms: float):
+        jitter = self.args.jitter
+        time.sleep(max(latency_ms * random.uniform(1 - jitter, 1 + jitter), 0) / 1000)
+
+    def _json(self, status: int, payload: dict):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--embedding-latency-ms", type=float, default=50.0)
+    parser.add_argument("--chat-latency-ms", type=float, default=800.0)
+    parser.add_argument("--ttft-ms", type=float, default=200.0)
+    parser.add_argument("--jitter", type=float, default=0.2, help="relative +/- latency jitter")
+    args = parser.parse_args()
+
+    _Handler.embedder = HashingEmbedder(args.dim)
+    _Handler.args = args
+    server = _Server((args.host, args.port), _Handler)
+    print(f"openai stub listening on http://{args.host}:{args.port}/v1", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -9,7 +9,7 @@ import uuid
 BASE_URL = os.environ.get("BASE_URL", "http://localhost:8000")
 
 
-def _post(path: str, payload: dict) -> dict:
+def _post(path: str, payload: dict, timeout: float = 10) -> dict:
     data = json.dumps(payload).encode("utf-8")
     req = request.Request(
         f"{BASE_URL}{path}",
@@ -17,11 +17,31 @@ def _post(path: str, payload: dict) -> dict:
         headers={"Content-Type": "application/json"},
         method="POST",
     )
-    with request.urlopen(req, timeout=10) as resp:
+    with request.urlopen(req, timeout=timeout) as resp:
         return json.loads(resp.read().decode("utf-8"))
 
 
-def _post_multipart(path: str, fields: dict, file_field: str, filename: str, data: bytes) -> dict:
+def _get(path: str, timeout: float = 10) -> dict:
+    with request.urlopen(f"{BASE_URL}{path}", timeout=timeout) as resp:
+        return json.loads(resp.read().decode("utf-8"))
+
+
+def _wait_for_job(job: dict, timeout: float = 60.0) -> dict:
+    deadline = time.time() + timeout
+    while job.get("status") in ("queued", "running") and time.time() < deadline:
+        time.sleep(0.2)
+        job = _get(f"/jobs/{job['job_id']}")
+    return job.get("result") or {}
+
+
+def _post_multipart(
+    path: str,
+    fields: dict,
+    file_field: str,
+    filename: str,
+    data: bytes,
+    timeout: float = 10,
+) -> dict:
     boundary = f"----chronicle-{uuid.uuid4().hex}"
     body = bytearray()
     for key, value in fields.items():
@@ -44,7 +64,7 @@ def _post_multipart(path: str, fields: dict, file_field: str, filename: str, dat
         headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
         method="POST",
     )
-    with request.urlopen(req, timeout=10) as resp:
+    with request.urlopen(req, timeout=timeout) as resp:
         return json.loads(resp.read().decode("utf-8"))
 
 
@@ -53,7 +73,7 @@ def main() -> int:
     text_v1 = "Chronicle is a staleness-aware RAG system. It keeps documents fresh."
     text_v2 = text_v1 + " Updates only re-embed changed chunks."
 
-    ingest1 = _post("/ingest", {"doc_id": doc_id, "text": text_v1, "source": "test"})
+    ingest1 = _wait_for_job(_post("/ingest", {"doc_id": doc_id, "text": text_v1, "source": "test"}))
     if ingest1.get("total_chunks", 0) <= 0:
         print("Ingest failed: no chunks created")
         return 1
@@ -63,18 +83,20 @@ def main() -> int:
         print("Retrieve failed: no results")
         return 1
 
-    ingest2 = _post("/ingest", {"doc_id": doc_id, "text": text_v2, "source": "test"})
+    ingest2 = _wait_for_job(_post("/ingest", {"doc_id": doc_id, "text": text_v2, "source": "test"}))
     if ingest2.get("added", 0) + ingest2.get("updated", 0) <= 0:
         print("Update failed: no chunks updated")
         return 1
 
     upload_text = "Upload test document for Chronicle RAG."
-    upload = _post_multipart(
-        "/upload",
-        {"doc_id": f"{doc_id}-upload", "source": "upload-test"},
-        "file",
-        "upload.txt",
-        upload_text.encode("utf-8"),
+    upload = _wait_for_job(
+        _post_multipart(
+            "/upload",
+            {"doc_id": f"{doc_id}-upload", "source": "upload-test"},
+            "file",
+            "upload.txt",
+            upload_text.encode("utf-8"),
+        )
     )
     if upload.get("total_chunks", 0) <= 0:
         print("Upload ingest failed: no chunks created")